@@ -1,126 +1,215 @@
-from flask import Flask,send_file, request, jsonify
-from data_loader import load_hospital_data
-from geocoder import geocode_address, load_geocode_cache, save_geocode_cache
-from fuzzy_system import setup_fuzzy_system, compute_recommendation_score, map_preference_to_value
-from route_calculator import get_driving_route
-import pandas as pd
+import time
+_import_start = time.perf_counter()
+import hmac
+from flask import Flask, Response, g, send_file, request, jsonify
+import api_config
+import metrics
+from artifact_cache import artifact_cache, artifact_key
+from hospital_updates import hospital_record
+from recommender import (
+    MAX_BATCH_QUERIES, QueryError, format_response, locate_user, parse_query, ranked_recommendations, recommend_batch
+)
+from regions import RegionShards
+from result_cache import result_cache
+from route_calculator import route_cache
+
+metrics.set_gauge('hospital_import_seconds', time.perf_counter() - _import_start, module='api')
 
 app = Flask(__name__)
+# Region shards, each loaded on first use and reloaded on file change
+shards = RegionShards()
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    endpoint = request.endpoint or 'unknown'
+    metrics.increment('hospital_http_requests_total', endpoint=endpoint, status=response.status_code)
+    metrics.observe('hospital_http_request_duration_seconds', time.perf_counter() - g.request_start, endpoint=endpoint)
+    return response
+
+def debug_requested(value):
+    return str(value).lower() in ('1', 'true', 'yes')
+
+def with_timings(body, timings):
+    # Per-stage breakdown for debug requests, in milliseconds
+    if timings is not None:
+        body['timings_ms'] = {stage: round(seconds * 1000, 3) for stage, seconds in timings.items()}
+    return body
 
 @app.route('/')
 def serve_frontend():
     return send_file('index.html')
 
-# Existing /get_recommendations route remains unchanged
+def find_recommendations(params):
+    # (query, user coordinates, map centre, ranked recommendations); raises QueryError
+    query = parse_query(params)
+    region = shards.region(query['region'])
+    with metrics.timed('state'):
+        locator = shards.locator(region)
+    user_coords = locate_user(locator, query['location'])
+    locator.save_geocode_cache()
+
+    # Only the shards whose region covers the user are searched
+    with metrics.timed('state'):
+        states = shards.states_for(user_coords, query['radius_km'], region)
+    with metrics.timed('recommend'):
+        recommendations = ranked_recommendations(states, query, user_coords, cache=result_cache)
+    return query, user_coords, (region or states[0].region or shards.registry.default).centroid, recommendations
+
+def get_recommendations_body(params):
+    try:
+        query, _, _, recommendations = find_recommendations(params)
+    except QueryError as e:
+        return {'error': e.message}, e.status
+    return format_response(query, recommendations), 200
+
+# Existing /get_recommendations route remains unchanged; add debug=1 for a timing breakdown
 @app.route('/get_recommendations', methods=['GET'])
 def get_recommendations():
-    # Extract query parameters
-    location = request.args.get('location', '').strip()
-    service = request.args.get('service', '').strip()
-    cost_pref_str = request.args.get('cost_pref', 'Medium').strip().capitalize()
-    quality_pref_str = request.args.get('quality_pref', 'High').strip().capitalize()
-
-    # Validate inputs
-    if not service:
-        return jsonify({'error': 'Service parameter is required.'}), 400
-
-    valid_categories = {'Low', 'Medium', 'High'}
-    if cost_pref_str not in valid_categories:
-        return jsonify({'error': 'Invalid cost preference. Use Low, Medium, or High.'}), 400
-    if quality_pref_str not in valid_categories:
-        return jsonify({'error': 'Invalid quality preference. Use Low, Medium, or High.'}), 400
-
-    # Map preferences to numerical values
-    cost_pref = map_preference_to_value(cost_pref_str)
-    quality_pref = map_preference_to_value(quality_pref_str)
-
-    # Load hospital data
-    data = load_hospital_data()
-    if data is None:
+    with metrics.request_timings(debug_requested(request.args.get('debug'))) as timings:
+        body, status = get_recommendations_body(request.args)
+    return jsonify(with_timings(body, timings)), status
+
+def artifact_response(kind, inputs, render, mimetype):
+    # Rendered once per distinct content; the content address doubles as the ETag
+    key = artifact_key(kind, inputs)
+    with metrics.timed('render'):
+        body = artifact_cache.get_or_render(key, render)
+    response = Response(body, mimetype=mimetype)
+    response.set_etag(key)
+    return response.make_conditional(request)
+
+# Same query parameters as /get_recommendations; the chart is rendered in memory
+@app.route('/get_recommendations/chart.png', methods=['GET'])
+def recommendations_chart():
+    from visualizer import CHART_COLUMNS, render_chart, render_inputs
+    try:
+        _, _, _, recommendations = find_recommendations(request.args)
+    except QueryError as e:
+        return jsonify({'error': e.message}), e.status
+    return artifact_response('chart', render_inputs(recommendations, CHART_COLUMNS),
+                             lambda: render_chart(recommendations), 'image/png')
+
+# Also takes zoom (default 11.5), which sets how far routes are simplified
+@app.route('/get_recommendations/map.html', methods=['GET'])
+def recommendations_map():
+    from visualizer import DEFAULT_MAP_ZOOM, MAP_COLUMNS, render_inputs, render_map
+    try:
+        zoom = float(request.args.get('zoom') or DEFAULT_MAP_ZOOM)
+    except ValueError:
+        return jsonify({'error': 'zoom must be a number.'}), 400
+    if not 1 <= zoom <= 20:
+        return jsonify({'error': 'zoom must be between 1 and 20.'}), 400
+    try:
+        _, user_coords, center, recommendations = find_recommendations(request.args)
+    except QueryError as e:
+        return jsonify({'error': e.message}), e.status
+    inputs = render_inputs(recommendations, MAP_COLUMNS, user_coords=user_coords, center=center, zoom=zoom)
+    return artifact_response('map', inputs, lambda: render_map(user_coords, recommendations, center, zoom),
+                             'text/html')
+
+@app.route('/batch_recommendations', methods=['POST'])
+def batch_recommendations():
+    # Body: {"queries": [{"location": ..., "service": ..., "cost_pref": ..., "quality_pref": ...}, ...],
+    #        "debug": false}; a query may also name a "region" to search
+    payload = request.get_json(silent=True)
+    queries = payload.get('queries') if isinstance(payload, dict) else None
+    if not isinstance(queries, list) or not queries:
+        return jsonify({'error': 'Request body must be a JSON object with a non-empty "queries" list.'}), 400
+    if len(queries) > MAX_BATCH_QUERIES:
+        return jsonify({'error': f'At most {MAX_BATCH_QUERIES} queries per batch.'}), 400
+
+    with metrics.request_timings(debug_requested(payload.get('debug'))) as timings:
+        results = recommend_batch(shards, queries)
+    return jsonify(with_timings({'results': results}, timings)), 200
+
+def admin_authorized():
+    token = api_config.ADMIN_API_TOKEN
+    return bool(token) and hmac.compare_digest(request.headers.get('X-Admin-Token', ''), token)
+
+def admin_region(name):
+    # With several regions a change has to say which dataset it belongs to
+    region = shards.region(name)
+    if region is None and len(shards.registry) > 1:
+        raise QueryError(f"region is required. Use one of: {', '.join(shards.registry.regions)}.")
+    return region or shards.registry.default
+
+def admin_change(op, name, fields=None, region_name=None):
+    if not admin_authorized():
+        return jsonify({'error': 'Admin API is disabled or the X-Admin-Token header is wrong.'}), 403
+    try:
+        manager = shards.manager(admin_region(region_name))
+        state, i = manager.apply(op, name, fields)
+    except QueryError as e:
+        return jsonify({'error': e.message}), e.status
+    if i is None:
+        return jsonify({'retired': name}), 200
+    return jsonify({'hospital': hospital_record(state, i)}), 201 if op == 'add' else 200
+
+@app.route('/admin/hospitals', methods=['POST'])
+def add_hospital():
+    # Body: {"Name": ..., "Full Address": ..., "Services": ..., "Cost Level": ...,
+    #        "Quality Score": ..., "User Rating": ..., "region": ...}
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({'error': 'Request body must be a JSON object of hospital fields.'}), 400
+    fields = dict(payload)
+    region_name = fields.pop('region', None)
+    name = str(fields.pop('Name', '') or '').strip()
+    if not name:
+        return jsonify({'error': 'Name is required.'}), 400
+    return admin_change('add', name, fields, region_name)
+
+@app.route('/admin/hospitals/<path:name>', methods=['PATCH', 'DELETE'])
+def change_hospital(name):
+    # PATCH body: the fields to change (including a new "Name"); DELETE retires the hospital
+    if request.method == 'DELETE':
+        return admin_change('retire', name, region_name=request.args.get('region'))
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({'error': 'Request body must be a JSON object of hospital fields.'}), 400
+    fields = dict(payload)
+    region_name = fields.pop('region', None) or request.args.get('region')
+    return admin_change('update', name, fields, region_name)
+
+@app.route('/admin/compact', methods=['POST'])
+def compact_changes():
+    if not admin_authorized():
+        return jsonify({'error': 'Admin API is disabled or the X-Admin-Token header is wrong.'}), 403
+    try:
+        manager = shards.manager(admin_region(request.args.get('region')))
+    except QueryError as e:
+        return jsonify({'error': e.message}), e.status
+    rows = manager.compact()
+    if rows is None:
         return jsonify({'error': 'Failed to load hospital data.'}), 500
-
-    # Load geocoding cache
-    cache_file = 'hospital_coordinates.csv'
-    geocode_cache = load_geocode_cache(cache_file)
-
-    # Geocode user location
-    user_coords = None
-    if location:
-        user_coords = geocode_address(location, geocode_cache)
-        if user_coords == (6.5244, 3.3792):
-            print(f"Could not geocode location '{location}'. Using all hospitals without distance filter.")
-        else:
-            print(f"Geocoded location '{location}' to coordinates {user_coords}")
-    else:
-        print("No location provided. Using all hospitals without distance filter.")
-
-    # Geocode hospital addresses
-    print("Geocoding hospital addresses...")
-    data['Coordinates'] = data['Full Address'].apply(lambda addr: geocode_address(addr, geocode_cache))
-    default_coords_count = (data['Coordinates'] == (6.5244, 3.3792)).sum()
-    if default_coords_count > 0:
-        print(f"Warning: {default_coords_count} hospital(s) using default coordinates. Check addresses in dataset.")
-    valid_coords = data['Coordinates'].notna().sum()
-    print(f"Successfully geocoded {valid_coords} hospital addresses.")
-
-    # Save geocoding cache
-    save_geocode_cache(geocode_cache, cache_file)
-
-    if data.empty:
-        return jsonify({'error': 'No hospitals available after filtering.'}), 404
-
-    # Apply distance filter if user location is valid
-    if user_coords and user_coords != (6.5244, 3.3792):
-        data['Distance_km'] = data['Coordinates'].apply(lambda coords: calculate_distance(user_coords, coords)[1])
-        data = data[data['Distance_km'] <= 10.0]
-        if data.empty:
-            return jsonify({'error': 'No hospitals found within 10 km of the provided location.'}), 404
-
-    # Initialize fuzzy logic system
-    fuzzy_system = setup_fuzzy_system()
-
-    # Compute recommendation scores
-    data['Recommendation_Score'] = data.apply(
-        lambda row: compute_recommendation_score(row, service, cost_pref, quality_pref, user_coords, fuzzy_system),
-        axis=1
-    )
-
-    # Filter hospitals with non-zero scores
-    recommendations = data[data['Recommendation_Score'] > 0].copy()
-    if recommendations.empty:
-        return jsonify({'error': f"No hospitals found matching service '{service}'."}), 404
-
-    # Get top 3 recommendations
-    recommendations = recommendations.sort_values(by='Recommendation_Score', ascending=False).head(3)
-
-    # Calculate driving routes
-    print("Calculating driving routes...")
-    for idx, row in recommendations.iterrows():
-        distance, duration, polyline_points, instructions = get_driving_route(
-            user_coords, row['Coordinates'], row['Name']
-        )
-        recommendations.at[idx, 'Route_Distance'] = distance
-        recommendations.at[idx, 'Route_Duration'] = duration
-        recommendations.at[idx, 'Polyline_Points'] = polyline_points
-        recommendations.at[idx, 'Route_Instructions'] = "; ".join(instructions) if instructions else "N/A"
-        if distance:
-            print(f"Route to {row['Name']}: {distance}, {duration}")
-
-    # Prepare response
-    response_data = recommendations[[
-        'Name', 'Full Address', 'Services', 'Cost Level', 'Quality Score',
-        'User Rating', 'Recommendation_Score', 'Route_Distance', 'Route_Duration', 'Route_Instructions'
-    ]].to_dict(orient='records')
-
-    return jsonify({
-        'user_inputs': {
-            'location': location or 'None',
-            'service': service,
-            'cost_preference': cost_pref_str,
-            'quality_preference': quality_pref_str
-        },
-        'recommendations': response_data
-    }), 200
+    return jsonify({'hospitals': rows}), 200
+
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    return jsonify({'results': result_cache.stats(), 'routes': route_cache.stats(), 'regions': shards.stats(),
+                    'artifacts': artifact_cache.stats()}), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    results, routes, artifacts = result_cache.stats(), route_cache.stats(), artifact_cache.stats()
+    cache_metrics = {
+        'hospital_result_cache_entries': ('gauge', 'Entries in the recommendation result cache.', results['size']),
+        'hospital_result_cache_hits_total': ('counter', 'Result cache hits.', results['hits']),
+        'hospital_result_cache_misses_total': ('counter', 'Result cache misses.', results['misses']),
+        'hospital_result_cache_coalesced_total': ('counter', 'Requests that waited on an identical in-flight request.', results['coalesced']),
+        'hospital_route_cache_entries': ('gauge', 'Entries in the route cache.', routes['size']),
+        'hospital_route_cache_hits_total': ('counter', 'Route cache hits.', routes['hits']),
+        'hospital_route_cache_misses_total': ('counter', 'Route cache misses.', routes['misses']),
+        'hospital_artifact_cache_bytes': ('gauge', 'Bytes of rendered charts and maps cached.', artifacts['bytes']),
+        'hospital_artifact_cache_hits_total': ('counter', 'Artifact cache hits.', artifacts['hits']),
+        'hospital_artifact_cache_misses_total': ('counter', 'Artifact cache misses.', artifacts['misses']),
+    }
+    return Response(metrics.render(cache_metrics), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    shards.states([shards.registry.default])
+    app.run(debug=True)
@@ -1,5 +1,27 @@
 
-import googlemaps
-
 GOOGLE_API_KEY = ''  # Replace with your actual API key
-gmaps = googlemaps.Client(key=GOOGLE_API_KEY)
+
+def __getattr__(name):
+    # gmaps (and the googlemaps import) is created on first use rather than at import time
+    global gmaps
+    if name == 'gmaps':
+        import googlemaps
+        gmaps = googlemaps.Client(key=GOOGLE_API_KEY)
+        return gmaps
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Routing backend: 'google' (Directions API) or 'local' (in-process A* over LOCAL_ROAD_GRAPH,
+# built with `python main.py build-road-graph`)
+ROUTING_BACKEND = 'google'
+LOCAL_ROAD_GRAPH = 'datasets/road_graph.npz'
+
+# Re-rank the RERANK_CANDIDATES best fuzzy matches by real drive time (one batched Distance
+# Matrix call) before taking the top k; requests can turn it on or off with rerank=1/0
+RERANK_BY_DRIVE_TIME = False
+RERANK_CANDIDATES = 20
+
+# Stage timers, counters and latency histograms served at /metrics
+METRICS_ENABLED = True
+
+# Shared secret for the /admin endpoints (sent as the X-Admin-Token header); empty disables them
+ADMIN_API_TOKEN = ''
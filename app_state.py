@@ -0,0 +1,323 @@
+import copy
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+from bulk_geocoder import BulkGeocoder, GEOCODE_SUFFIX
+from coverage_grid import coverage_file, refresh_coverage_grid
+from data_loader import load_hospital_data, DATASET_FILE, FIELD_DEFAULTS
+from geocoder import load_geocode_cache, save_geocode_cache, CACHE_FILE, DEFAULT_COORDS
+from fuzzy_system import get_fuzzy_model
+from hospital_store import HospitalStore, build_hospital_store
+from hospital_updates import (
+    COMPACT_AFTER_CHANGES, ChangeLog, begin_compaction, catch_up, change_log_file, compact, locate_change,
+    prepare_change, replay_change_log, validate_change
+)
+import metrics
+from recommender import QueryError
+from service_index import ServiceIndex
+from snapshot import SNAPSHOT_SUFFIX, is_snapshot_file, open_snapshot, read_only, snapshot_source_file
+from spatial_index import SpatialIndex
+
+RELOAD_CHECK_INTERVAL = 2.0
+
+def file_mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+def default_dataset_file(dataset_file=DATASET_FILE):
+    # A built snapshot is preferred to parsing the CSV; while the CSV is newer than it,
+    # build_snapshot_state loads the CSV instead
+    snapshot_file = os.path.splitext(dataset_file)[0] + SNAPSHOT_SUFFIX
+    return snapshot_file if os.path.exists(snapshot_file) else dataset_file
+
+# Everything a request needs that does not depend on the query. Nothing changes a state once
+# requests can see it; the geocode cache (new user locations) handles its own locking, and
+# admin changes (see hospital_updates) are applied to a copy that StateManager then swaps in,
+# each bumping revision. The frame is never edited: changed and added rows are laid over it
+# from row_changes. A snapshot-backed state has no frame until something asks for data;
+# requests only ever materialize their result rows.
+class AppState:
+    def __init__(self, data, store, coordinates, spatial_index, service_index, geocode_cache, geocoder, version,
+                 snapshot=None, region=None, source_file=None):
+        self._data = data
+        self.snapshot = snapshot
+        self.region = region
+        # The CSV the hospitals were read from, directly or through the snapshot
+        self.source_file = source_file
+        self.store = store
+        self.coordinates = coordinates
+        self.spatial_index = spatial_index
+        self.service_index = service_index
+        self.geocode_cache = geocode_cache
+        self.geocoder = geocoder
+        self.version = version
+        # Admin changes: how many have been applied, how far into the change log, the changed
+        # fields (with Coordinates) of every updated or added row id, which rows are retired,
+        # and the name -> row id map built on the first change. Row ids from base_rows on are
+        # added hospitals.
+        self.base_rows = len(store)
+        self.row_changes = {}
+        self.revision = 0
+        self.change_offset = 0
+        self.pending_changes = 0
+        self.retired = set()
+        self.hospital_ids = None
+        # Precomputed answers (see coverage_grid), attached by StateManager
+        self.coverage = None
+        self.coverage_mtime = None
+
+    @property
+    def data(self):
+        # Every row, for offline jobs; with admin changes this is a new frame each time
+        if self._data is None:
+            self._data = self.snapshot.to_frame()
+        if self.row_changes:
+            return self.rows(np.arange(len(self.store)))
+        return self._data
+
+    def _base_rows(self, ids):
+        if self._data is None:
+            return self.snapshot.to_frame(ids)
+        return self._data.iloc[ids].copy()
+
+    def rows(self, ids):
+        # Frame of the given (distinct) row ids, with Coordinates, indexed by row id
+        ids = np.asarray(ids, dtype=np.int64)
+        changed = [i for i in ids.tolist() if i in self.row_changes]
+        if not changed:
+            return self._base_rows(ids)
+        frame = self._base_rows(ids[ids < self.base_rows])
+        added = [i for i in changed if i >= self.base_rows]
+        if added:
+            new_rows = pd.DataFrame([{**FIELD_DEFAULTS, **self.row_changes[i]} for i in added], index=added)
+            frame = pd.concat([frame, new_rows]).loc[ids]
+        for i in changed:
+            for name, value in self.row_changes[i].items():
+                frame.at[i, name] = value
+        return frame
+
+    @property
+    def memory_bytes(self):
+        # Rough resident size, used to keep loaded region shards under a budget. Snapshot
+        # columns count too: they are mapped pages, but pages this process has touched.
+        total = self.store.nbytes + self.coordinates.nbytes
+        total += self.spatial_index.lat.nbytes + self.spatial_index.lon.nbytes + self.spatial_index.sorted_ids.nbytes
+        total += sum(ids.nbytes for ids in self.service_index.postings.values())
+        if self._data is not None:
+            total += int(self._data.memory_usage(deep=True).sum())
+        return total
+
+    def copy(self):
+        # To apply admin changes to. Arrays are shared read-only until an update copies the ones
+        # it writes, and the frame is shared outright; what is copied now only holds the rows
+        # and names changed so far.
+        state = copy.copy(self)
+        state.coordinates = read_only(self.coordinates)
+        state.store = self.store.copy()
+        state.spatial_index = self.spatial_index.copy()
+        state.service_index = self.service_index.copy()
+        state.row_changes = dict(self.row_changes)
+        state.retired = set(self.retired)
+        state.hospital_ids = self.hospital_ids.copy() if self.hospital_ids is not None else None
+        return state
+
+    def geocode(self, address):
+        return self.geocoder.geocode(address)
+
+    def save_geocode_cache(self):
+        return save_geocode_cache(self.geocode_cache) > 0
+
+def build_snapshot_state(dataset_file, cache_file=CACHE_FILE, client=None, region=None):
+    dataset_mtime = file_mtime(dataset_file)
+    with metrics.timed('load_dataset'):
+        snapshot = open_snapshot(dataset_file)
+    if snapshot is None:
+        return None
+    if snapshot.is_stale():
+        # Serving the old snapshot would hide the CSV edit until someone rebuilt it
+        source_file = snapshot.header['source']['path']
+        print(f"Warning: {dataset_file} is older than {source_file}; loading the CSV instead. "
+              f"Rebuild it with `python main.py build-snapshot`.")
+        return build_app_state(source_file, cache_file, client, region)
+
+    # Hospital coordinates come from the snapshot; the cache only serves user locations
+    geocode_cache = load_geocode_cache(cache_file)
+    geocoder = BulkGeocoder(geocode_cache, client=client, suffix=region.geocode_suffix if region else GEOCODE_SUFFIX)
+    version = (dataset_mtime,)
+
+    with metrics.timed('build_indexes'):
+        arrays = snapshot.arrays
+        coords = arrays['coordinates']
+        spatial_index = SpatialIndex(coords[:, 0], coords[:, 1], snapshot.header['cell_degrees'],
+                                     sorted_ids=arrays['spatial_ids'])
+        service_index = ServiceIndex.from_postings(snapshot.string_column('services_text'), snapshot.service_postings(),
+                                                   arrays['services_text'] >= 0)
+        model = get_fuzzy_model()
+        store = HospitalStore(arrays['cost'], arrays['quality'], arrays['rating'], arrays['lat'], arrays['lon'],
+                              model=model, memberships=snapshot.memberships(model['fingerprint']))
+    print(f"Loaded {len(snapshot)} hospitals from snapshot {dataset_file}.")
+    source = snapshot.header['source']
+    return AppState(None, store, coords, spatial_index, service_index, geocode_cache, geocoder, version, snapshot,
+                    region, source['path'] if source else None)
+
+def build_app_state(dataset_file=None, cache_file=CACHE_FILE, client=None, region=None):
+    # region (see regions.Region) supplies the geocoding suffix for hospital addresses and the
+    # centroid that hospitals which fail to geocode are placed at; None means Lagos
+    dataset_file = dataset_file or default_dataset_file()
+    if is_snapshot_file(dataset_file):
+        return build_snapshot_state(dataset_file, cache_file, client, region)
+    dataset_mtime = file_mtime(dataset_file)
+    with metrics.timed('load_dataset'):
+        data = load_hospital_data(dataset_file)
+    if data is None:
+        return None
+    data = data.reset_index(drop=True)
+
+    print("Geocoding hospital addresses...")
+    with metrics.timed('geocode_hospitals'):
+        geocode_cache = load_geocode_cache(cache_file)
+        geocode_cache.preload(data['Full Address'])
+        geocoder = BulkGeocoder(geocode_cache, client=client, suffix=region.geocode_suffix if region else GEOCODE_SUFFIX)
+        coordinates = geocoder.geocode_many(list(data['Full Address']))
+    default_coords = region.centroid if region else DEFAULT_COORDS
+    data['Coordinates'] = [default_coords if coords == DEFAULT_COORDS else coords for coords in coordinates]
+    default_coords_count = (data['Coordinates'] == default_coords).sum()
+    if default_coords_count > 0:
+        print(f"Warning: {default_coords_count} hospital(s) using default coordinates. Check addresses in dataset.")
+    valid_coords = data['Coordinates'].notna().sum()
+    print(f"Successfully geocoded {valid_coords} hospital addresses.")
+
+    save_geocode_cache(geocode_cache)
+    version = (dataset_mtime,)
+
+    with metrics.timed('build_indexes'):
+        coords = np.array(data['Coordinates'].tolist(), dtype=np.float64).reshape(-1, 2)
+        spatial_index = SpatialIndex(coords[:, 0], coords[:, 1])
+        service_index = ServiceIndex(data['Services'])
+        store = build_hospital_store(data)
+    return AppState(data, store, coords, spatial_index, service_index, geocode_cache, geocoder, version,
+                    region=region, source_file=dataset_file)
+
+# Holds the current AppState and swaps in a freshly built one when the dataset changes on
+# disk. Readers only ever see a fully built state. The geocode cache is not part of the
+# version: SQLite writes it through its -wal file, so the .db mtime only moves at checkpoints.
+# Coordinates another process adds reach hospitals on the next dataset reload or snapshot build.
+class StateManager:
+    def __init__(self, dataset_file=None, cache_file=CACHE_FILE, check_interval=RELOAD_CHECK_INTERVAL,
+                 client=None, region=None):
+        self.dataset_file = dataset_file or default_dataset_file()
+        self.cache_file = cache_file
+        self.client = client
+        self.region = region
+        self.check_interval = check_interval
+        self.change_log = ChangeLog(change_log_file(self.dataset_file))
+        self.coverage_file = coverage_file(self.dataset_file)
+        # A snapshot's CSV is watched too: editing it reloads, from the CSV until the snapshot
+        # is rebuilt
+        self.source_file = snapshot_source_file(self.dataset_file) if is_snapshot_file(self.dataset_file) else None
+        self._compacting = False
+        self._state = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self._compaction_lock = threading.Lock()
+
+    def _current_version(self):
+        return (file_mtime(self.dataset_file), file_mtime(self.source_file) if self.source_file else None)
+
+    def get(self):
+        state = self._state
+        now = time.monotonic()
+        if state is not None and now - self._last_check < self.check_interval:
+            return state
+        with self._lock:
+            return self._refresh()
+
+    def _refresh(self):
+        # Called with the lock held. Changes appended to the log since are applied to a copy
+        # that replaces the state; a compacted log means the base dataset changed too, so it is
+        # reloaded.
+        state = self._state
+        version = self._current_version()
+        caught_up = catch_up(state, self.change_log) if state is not None and version == state.version else None
+        if caught_up is not None:
+            self._state = state = caught_up
+        else:
+            if state is not None:
+                print("Dataset changed on disk. Reloading.")
+            new_state = build_app_state(self.dataset_file, self.cache_file, client=self.client, region=self.region)
+            if new_state is not None:
+                new_state.version = version
+                replay_change_log(new_state, self.change_log)
+                self._state = state = new_state
+        if state is not None:
+            refresh_coverage_grid(state, self.coverage_file)
+        self._last_check = time.monotonic()
+        return state
+
+    def apply(self, op, name, fields=None):
+        # One admin change (see hospital_updates): validated and geocoded without the lock, so a
+        # slow geocode holds up neither reloads nor other changes, then checked again against
+        # the latest state and logged under it
+        state = self.get()
+        if state is None:
+            raise QueryError('Failed to load hospital data.', 500)
+        try:
+            located = prepare_change(state, op, name, fields)
+        except QueryError:
+            # state may be a reload check behind; the check under the lock decides
+            located = {}
+        if 'coordinates' in located:
+            state.save_geocode_cache()
+        with self._lock:
+            state = self._refresh()
+            if state is None:
+                raise QueryError('Failed to load hospital data.', 500)
+            change = validate_change(state, op, name, fields)
+            if 'coordinates' in located:
+                change['coordinates'] = located['coordinates']
+            # Only geocodes here if a change logged meanwhile moved the hospital's address
+            change = locate_change(state, change)
+            if 'coordinates' in change and 'coordinates' not in located:
+                state.save_geocode_cache()
+            self.change_log.append(change)
+            # Read back from the log, so this process applies it in the same order as the others
+            state = self._refresh()
+            target = name if op == 'retire' else change['fields'].get('Name', name)
+            should_compact = state.pending_changes >= COMPACT_AFTER_CHANGES and not self._compacting
+            self._compacting = self._compacting or should_compact
+        if should_compact:
+            threading.Thread(target=self.compact, name='compact-changes', daemon=True).start()
+        # Row id of the hospital, None once retired
+        return state, state.hospital_ids.get(target)
+
+    def compact(self):
+        # Only setting the log aside holds the lock; the CSV and snapshot are rewritten without
+        # it while requests and changes carry on against the current state
+        if not self._compaction_lock.acquire(blocking=False):
+            print("A compaction is already running.")
+            return None
+        try:
+            with self._lock:
+                state = self._refresh()
+                if state is not None:
+                    state = begin_compaction(state, self.change_log)
+            if state is None:
+                return None
+            return compact(state, self.change_log, self.dataset_file, self.cache_file, self.region)
+        finally:
+            # Reloaded on the next get(), from the new base and whatever was logged since
+            self._compacting = False
+            self._last_check = 0.0
+            self._compaction_lock.release()
+
+    @property
+    def loaded(self):
+        # The current state without checking the files or loading it
+        return self._state
+
+    def save_geocode_cache(self, state):
+        return state.save_geocode_cache()
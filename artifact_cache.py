@@ -0,0 +1,75 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+ARTIFACT_CACHE_BYTES = 64 * 1024 * 1024
+
+def artifact_key(kind, inputs):
+    # Content address of a rendered chart or map: a hash of everything it is rendered from
+    payload = json.dumps([kind, inputs], sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+# Thread-safe LRU of rendered artifacts (bytes or str) by content address, bounded by total
+# size. Entries never go stale, since a different input has a different key; identical
+# concurrent misses wait on a single rendering.
+class ArtifactCache:
+    def __init__(self, max_bytes=ARTIFACT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get_or_render(self, key, render):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if not owner:
+            return future.result()
+
+        try:
+            value = render()
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._inflight[key]
+            size = len(value)
+            # An artifact larger than the whole budget is served but not kept
+            if size <= self.max_bytes:
+                self._entries[key] = value
+                self.bytes += size
+                while self.bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self.bytes -= len(evicted)
+        future.set_result(value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'bytes': self.bytes, 'hits': self.hits, 'misses': self.misses,
+                    'coalesced': self.coalesced}
+
+artifact_cache = ArtifactCache()
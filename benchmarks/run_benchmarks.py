@@ -0,0 +1,276 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+import numpy as np
+from benchmarks.stub_maps import LAGOS_BOUNDS, StubMapsClient, install_stub_client
+from benchmarks.synthetic_data import SERVICES, write_dataset
+
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+DEFAULT_QUERIES = 200
+DEFAULT_REQUESTS = 300
+REPORT_FILE = 'benchmark_report.json'
+CATEGORIES = ['Low', 'Medium', 'High']
+
+@contextlib.contextmanager
+def quiet():
+    # The pipeline prints per address and per route; keep that out of the benchmark output
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+def stage(seconds, items):
+    return {
+        'seconds': round(seconds, 6),
+        'items': items,
+        'per_item_ms': round(seconds * 1000 / items, 6) if items else None,
+        'items_per_second': round(items / seconds, 1) if seconds else None,
+    }
+
+def timed_call(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def random_queries(rng, count):
+    (south, west), (north, east) = LAGOS_BOUNDS
+    queries = []
+    for _ in range(count):
+        queries.append({
+            'service': str(rng.choice(SERVICES)),
+            'cost_pref': str(rng.choice(CATEGORIES)),
+            'quality_pref': str(rng.choice(CATEGORIES)),
+            'user_coords': (float(rng.uniform(south, north)), float(rng.uniform(west, east))),
+        })
+    return queries
+
+def benchmark_size(size, workdir, client, args):
+    import metrics
+    from api_config import ROUTING_BACKEND
+    from bulk_geocoder import GEOCODE_SUFFIX
+    from geocoder import DEFAULT_COORDS
+    from app_state import build_app_state
+    from data_loader import load_hospital_data
+    from recommender import (
+        QueryError, add_routes, find_candidates, parse_query, rerank_by_drive_time, rerank_depth, score_candidates,
+        top_recommendations
+    )
+    from regions import Region, RegionRegistry, RegionShards
+    from route_calculator import route_cache, travel_time_cache
+
+    rng = np.random.default_rng(args.seed)
+    dataset = os.path.join(workdir, f'hospitals_{size}.csv')
+    cache_file = os.path.join(workdir, f'coordinates_{size}.db')
+    _, generate_seconds = timed_call(write_dataset, dataset, size, args.seed)
+    stages = {'generate_dataset': stage(generate_seconds, size)}
+
+    with quiet():
+        _, seconds = timed_call(load_hospital_data, dataset)
+    stages['load'] = stage(seconds, size)
+
+    # build_app_state's own stage timers split each build into load, geocode and indexing
+    for label in ('cold', 'warm'):
+        calls_before = client.calls['geocode']
+        with quiet(), metrics.request_timings() as timings:
+            state = build_app_state(dataset, cache_file, client=client)
+        stages[f'geocode_{label}'] = stage(timings['geocode_hospitals'], size)
+        stages[f'geocode_{label}']['api_calls'] = client.calls['geocode'] - calls_before
+        stages[f'state_build_{label}'] = stage(timings['total'], size)
+    stages['build_indexes'] = stage(timings['build_indexes'], size)
+
+    queries = random_queries(rng, args.queries)
+    parsed = [parse_query(query) for query in queries]
+    origins = [query['user_coords'] for query in queries]
+
+    candidate_sets = []
+    kept = []
+    start = time.perf_counter()
+    for i, (query, user_coords) in enumerate(zip(parsed, origins)):
+        try:
+            candidate_sets.append(find_candidates(state, query, user_coords))
+            kept.append(i)
+        except QueryError:
+            pass
+    stages['distance_filter'] = stage(time.perf_counter() - start, len(parsed))
+    stages['distance_filter']['mean_candidates'] = (
+        round(float(np.mean([candidates.size for candidates, _, _, _ in candidate_sets])), 1) if candidate_sets else 0.0)
+
+    # Exact scores for every hospital under one preference pair: raw fuzzy throughput
+    store = state.store
+    _, seconds = timed_call(store.score, np.ones(len(store)), np.full(len(store), 0.5),
+                            np.full(len(store), 0.66), np.full(len(store), 1.0))
+    stages['fuzzy_scoring'] = stage(seconds, len(store))
+
+    start = time.perf_counter()
+    scored = score_candidates(state, [parsed[i] for i in kept], candidate_sets)
+    recommendation_sets = []
+    route_origins = []
+    for i, (candidates, _, _, distances), (positions, scores) in zip(kept, candidate_sets, scored):
+        if positions.size:
+            recommendation_sets.append(
+                top_recommendations(state, parsed[i], origins[i], candidates, distances, positions, scores))
+            route_origins.append(origins[i])
+    stages['ranking'] = stage(time.perf_counter() - start, len(kept))
+
+    # Drive-time re-ranking of each query's top RERANK_CANDIDATES: one travel-time call per query
+    rerank_queries = [dict(parsed[i], rerank=True) for i in kept]
+    depths = [rerank_depth(query, origins[i]) for query, i in zip(rerank_queries, kept)]
+    travel_time_cache.clear()
+    calls_before = client.calls['distance_matrix']
+    start = time.perf_counter()
+    with quiet():
+        scored = score_candidates(state, rerank_queries, candidate_sets, depths)
+        for query, i, candidate_set, (positions, scores) in zip(rerank_queries, kept, candidate_sets, scored):
+            if positions.size:
+                rerank_by_drive_time(state, query, origins[i], candidate_set, positions, scores)
+    stages['rerank'] = stage(time.perf_counter() - start, len(kept))
+    stages['rerank']['api_calls'] = client.calls['distance_matrix'] - calls_before
+
+    route_cache.clear()
+    calls_before = client.calls['directions']
+    with quiet():
+        _, seconds = timed_call(add_routes, recommendation_sets, route_origins)
+    routes = sum(len(recommendations) for recommendations in recommendation_sets)
+    stages['routing'] = stage(seconds, routes)
+    stages['routing']['api_calls'] = client.calls['directions'] - calls_before
+    stages['routing']['backend'] = ROUTING_BACKEND
+
+    region = Region('benchmark', None, DEFAULT_COORDS, GEOCODE_SUFFIX, dataset, cache_file)
+    stages.update(benchmark_flask(RegionShards(RegionRegistry([region]), client=client), rng, args.requests))
+    return {'size': size, 'stages': stages}
+
+def benchmark_flask(shards, rng, count):
+    # End-to-end GET /get_recommendations through Flask's test client (no network server).
+    # Locations are drawn from a small pool, so the second pass is answered by the result cache.
+    import api
+    from result_cache import result_cache
+    from route_calculator import route_cache
+
+    api.shards = shards
+    with quiet():
+        shards.states([shards.registry.default])
+    client = api.app.test_client()
+    locations = [f'Benchmark Location {i}' for i in range(max(count // 10, 1))]
+    urls = [
+        '/get_recommendations?' + '&'.join([
+            f'location={rng.choice(locations).replace(" ", "%20")}',
+            f'service={str(rng.choice(SERVICES)).replace(" ", "%20")}',
+            f'cost_pref={rng.choice(CATEGORIES)}',
+            f'quality_pref={rng.choice(CATEGORIES)}',
+        ])
+        for _ in range(count)
+    ]
+
+    results = {}
+    result_cache.clear()
+    route_cache.clear()
+    for label in ('flask_uncached', 'flask_cached'):
+        statuses = {}
+        cache_before = result_cache.stats()
+        with quiet():
+            start = time.perf_counter()
+            for url in urls:
+                status = client.get(url).status_code
+                statuses[status] = statuses.get(status, 0) + 1
+            seconds = time.perf_counter() - start
+        results[label] = stage(seconds, count)
+        results[label]['statuses'] = {str(status): n for status, n in sorted(statuses.items())}
+        cache_after = result_cache.stats()
+        results[label]['result_cache_hits'] = cache_after['hits'] - cache_before['hits']
+    return results
+
+def benchmark_startup(workdir):
+    # Imports run in fresh interpreters so nothing is already loaded
+    from fuzzy_system import compile_fuzzy_model, load_fuzzy_model, save_fuzzy_model
+
+    startup = {}
+    for module in ('api', 'main'):
+        code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+        startup[f'import_{module}'] = stage(float(output.strip().splitlines()[-1]), 1)
+
+    artifact = os.path.join(workdir, 'fuzzy_model.npz')
+    model, seconds = timed_call(compile_fuzzy_model)
+    startup['fuzzy_model_compile'] = stage(seconds, 1)
+    save_fuzzy_model(model, artifact)
+    _, seconds = timed_call(load_fuzzy_model, artifact)
+    startup['fuzzy_model_load'] = stage(seconds, 1)
+    return startup
+
+def environment():
+    import pandas as pd
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+    }
+
+def print_summary(report):
+    print("\nStart-up")
+    for name, values in report['startup'].items():
+        print(f"  {name:<20} {values['seconds'] * 1000:12.2f} ms")
+    for result in report['results']:
+        print(f"\n{result['size']} hospitals")
+        for name, values in result['stages'].items():
+            rate = values['items_per_second']
+            print(f"  {name:<20} {values['seconds'] * 1000:12.2f} ms  {values['items']:>9} items"
+                  f"  {rate if rate is not None else '-':>12}/s")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark each pipeline stage against synthetic data and a stub Google client")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="Dataset sizes, 100 to 1000000 rows")
+    parser.add_argument('--queries', type=int, default=DEFAULT_QUERIES, help="Queries per size for the filtering, ranking and routing stages")
+    parser.add_argument('--requests', type=int, default=DEFAULT_REQUESTS, help="Flask requests per size and pass")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds of simulated latency per Google call")
+    parser.add_argument('--geocode-qps', type=float, default=0.0, help="Geocoding rate limit; 0 disables it")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', help="Keep generated datasets and caches here instead of a temporary directory")
+    parser.add_argument('--output', default=REPORT_FILE)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    client = install_stub_client(StubMapsClient(latency=args.latency))
+    from bulk_geocoder import shared_pool
+    _, rate_limiter = shared_pool()
+    rate_limiter.interval = 1.0 / args.geocode_qps if args.geocode_qps else 0.0
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='hospital-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        print("Benchmarking start-up...")
+        startup = benchmark_startup(workdir)
+        results = []
+        for size in args.sizes:
+            print(f"Benchmarking {size} hospitals...")
+            results.append(benchmark_size(size, workdir, client, args))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'generated_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'environment': environment(),
+        'config': {
+            'queries': args.queries, 'requests': args.requests, 'latency': args.latency,
+            'geocode_qps': args.geocode_qps, 'seed': args.seed,
+        },
+        'startup': startup,
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print_summary(report)
+    print(f"\nReport written to {args.output}")
+
+if __name__ == '__main__':
+    main()
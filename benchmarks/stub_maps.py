@@ -0,0 +1,80 @@
+import hashlib
+import math
+import threading
+import time
+import polyline
+
+# Bounding box the stub places geocoded addresses in (mainland Lagos and the islands)
+LAGOS_BOUNDS = ((6.42, 3.20), (6.70, 3.60))
+STUB_SPEED_KMH = 30.0
+
+def _haversine_km(origin, destination):
+    lat1, lon1, lat2, lon2 = map(math.radians, (*origin, *destination))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0088 * math.asin(math.sqrt(a))
+
+def _texts(km):
+    minutes = max(1, round(km / STUB_SPEED_KMH * 60))
+    return f"{km:.1f} km", f"{minutes} mins", minutes * 60
+
+# Deterministic stand-in for googlemaps.Client: the same address always geocodes to the same
+# point, and routes are straight lines driven at STUB_SPEED_KMH. latency (seconds) is added to
+# every call to model the network round trip.
+class StubMapsClient:
+    def __init__(self, latency=0.0, failure_rate=0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.calls = {'geocode': 0, 'directions': 0, 'distance_matrix': 0}
+        self._lock = threading.Lock()
+
+    def _call(self, api):
+        with self._lock:
+            self.calls[api] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def geocode(self, address):
+        self._call('geocode')
+        digest = hashlib.md5(address.encode()).digest()
+        if digest[4] / 255 < self.failure_rate:
+            return []
+        (south, west), (north, east) = LAGOS_BOUNDS
+        lat = south + int.from_bytes(digest[:2], 'big') / 65535 * (north - south)
+        lng = west + int.from_bytes(digest[2:4], 'big') / 65535 * (east - west)
+        return [{'geometry': {'location': {'lat': lat, 'lng': lng}}, 'formatted_address': address}]
+
+    def directions(self, origin, destination, mode=None, departure_time=None):
+        self._call('directions')
+        km = _haversine_km(origin, destination)
+        distance, duration, seconds = _texts(km)
+        return [{
+            'legs': [{
+                'distance': {'text': distance, 'value': round(km * 1000)},
+                'duration': {'text': duration, 'value': seconds},
+                'steps': [{'html_instructions': f"Head toward the destination for {distance}"}],
+            }],
+            'overview_polyline': {'points': polyline.encode([tuple(origin), tuple(destination)])},
+        }]
+
+    def distance_matrix(self, origins, destinations, mode=None, departure_time=None):
+        self._call('distance_matrix')
+        rows = []
+        for origin in origins:
+            elements = []
+            for destination in destinations:
+                km = _haversine_km(origin, destination)
+                distance, duration, seconds = _texts(km)
+                elements.append({
+                    'status': 'OK',
+                    'distance': {'text': distance, 'value': round(km * 1000)},
+                    'duration': {'text': duration, 'value': seconds},
+                })
+            rows.append({'elements': elements})
+        return {'status': 'OK', 'rows': rows}
+
+def install_stub_client(client):
+    # api_config creates its googlemaps.Client on first use of gmaps; setting it first means
+    # the real client (and an API key) is never needed
+    import api_config
+    api_config.gmaps = client
+    return client
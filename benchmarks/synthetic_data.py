@@ -0,0 +1,64 @@
+import argparse
+import numpy as np
+import pandas as pd
+
+# Columns of datasets/Lagos_hospital.csv
+COLUMNS = ['Name', 'Full Address', 'Services', 'Cost Level', 'Quality Score', 'User Rating']
+
+AREAS = [
+    'Ikeja', 'Yaba', 'Surulere', 'Lekki', 'Victoria Island', 'Ikoyi', 'Ajah', 'Maryland', 'Gbagada',
+    'Ogba', 'Agege', 'Ikorodu', 'Festac', 'Apapa', 'Mushin', 'Oshodi', 'Ojota', 'Magodo', 'Isolo', 'Egbeda'
+]
+STREETS = [
+    'Allen Avenue', 'Herbert Macaulay Way', 'Awolowo Road', 'Admiralty Way', 'Adeola Odeku Street',
+    'Ikorodu Road', 'Opebi Road', 'Toyin Street', 'Bode Thomas Street', 'Adeniran Ogunsanya Street',
+    'Obafemi Awolowo Way', 'Ago Palace Way', 'Lagos-Abeokuta Expressway', 'Akin Adesola Street'
+]
+SERVICES = [
+    'General Medicine', 'Surgery', 'Pediatrics', 'Maternity', 'Dental', 'Cardiology', 'Emergency Care',
+    'Orthopedics', 'Ophthalmology', 'Dermatology', 'Radiology', 'Laboratory Services', 'Physiotherapy',
+    'Mental Health', 'ENT', 'Oncology', 'Neurology', 'Urology'
+]
+COST_LEVELS = ['Low', 'Medium', 'High', 'Premium']
+COST_WEIGHTS = [0.3, 0.4, 0.2, 0.1]
+
+def generate_hospitals(size, seed=0, missing_rate=0.02):
+    # Deterministic for a given (size, seed). Every address is distinct, so geocoding cost
+    # scales with size. A small share of Quality Score / User Rating
+    # values are left blank, as in the real file, to exercise the loader's defaults.
+    rng = np.random.default_rng(seed)
+    streets = rng.integers(0, len(STREETS), size)
+    areas = rng.integers(0, len(AREAS), size)
+    service_counts = rng.integers(1, 5, size)
+    service_choices = rng.random((size, len(SERVICES))).argsort(axis=1)
+
+    quality = np.round(rng.uniform(3.0, 5.0, size), 1).astype(object)
+    rating = np.round(rng.uniform(1.0, 5.0, size), 1).astype(object)
+    quality[rng.random(size) < missing_rate] = None
+    rating[rng.random(size) < missing_rate] = None
+
+    return pd.DataFrame({
+        'Name': [f'Synthetic Hospital {i}' for i in range(size)],
+        'Full Address': [
+            f'Plot {i + 1}, {STREETS[street]}, {AREAS[area]}' for i, (street, area) in enumerate(zip(streets, areas))
+        ],
+        'Services': [
+            ', '.join(SERVICES[j] for j in choices[:count]) for choices, count in zip(service_choices, service_counts)
+        ],
+        'Cost Level': rng.choice(COST_LEVELS, size, p=COST_WEIGHTS),
+        'Quality Score': quality,
+        'User Rating': rating,
+    }, columns=COLUMNS)
+
+def write_dataset(path, size, seed=0):
+    generate_hospitals(size, seed).to_csv(path, index=False)
+    return path
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Write a synthetic hospital dataset in the Lagos_hospital.csv schema")
+    parser.add_argument('size', type=int)
+    parser.add_argument('output')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    write_dataset(args.output, args.size, args.seed)
+    print(f"Wrote {args.size} hospitals to {args.output}")
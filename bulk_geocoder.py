@@ -0,0 +1,127 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+import api_config
+import metrics
+from geocoder import DEFAULT_COORDS, MISSING, normalize_address
+
+GEOCODE_MAX_WORKERS = 8
+GEOCODE_QPS = 10.0
+GEOCODE_RETRIES = 3
+GEOCODE_BACKOFF = 0.5
+GEOCODE_SUFFIX = ', Lagos, Nigeria'
+RETRIABLE_STATUSES = {'OVER_QUERY_LIMIT', 'UNKNOWN_ERROR'}
+
+# Spaces calls out to at most qps per second across every thread that shares it
+class RateLimiter:
+    def __init__(self, qps):
+        self.interval = 1.0 / qps if qps else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+_shared_executor = None
+_shared_rate_limiter = None
+_shared_lock = threading.Lock()
+
+def shared_pool():
+    # The geocoding QPS limit applies to the API key, so the pool and limiter are per process
+    global _shared_executor, _shared_rate_limiter
+    with _shared_lock:
+        if _shared_executor is None:
+            _shared_executor = ThreadPoolExecutor(GEOCODE_MAX_WORKERS, thread_name_prefix='geocode')
+            _shared_rate_limiter = RateLimiter(GEOCODE_QPS)
+    return _shared_executor, _shared_rate_limiter
+
+def is_retriable(error):
+    import googlemaps
+    if isinstance(error, (googlemaps.exceptions.Timeout, googlemaps.exceptions.TransportError,
+                          TimeoutError, ConnectionError)):
+        return True
+    return isinstance(error, googlemaps.exceptions.ApiError) and error.status in RETRIABLE_STATUSES
+
+# Geocodes addresses through a bounded thread pool and rate limiter, writing results to a
+# GeocodeCache. Concurrent lookups of the same (normalized) address share one in-flight call.
+class BulkGeocoder:
+    def __init__(self, cache, client=None, executor=None, rate_limiter=None,
+                 retries=GEOCODE_RETRIES, backoff=GEOCODE_BACKOFF, suffix=GEOCODE_SUFFIX):
+        self.cache = cache
+        self.client = client
+        if executor is None or rate_limiter is None:
+            shared_executor, shared_rate_limiter = shared_pool()
+            executor = executor or shared_executor
+            rate_limiter = rate_limiter or shared_rate_limiter
+        self.executor = executor
+        self.rate_limiter = rate_limiter
+        self.retries = retries
+        self.backoff = backoff
+        self.suffix = suffix
+        self._in_flight = {}
+        # Reentrant: a call that finishes before add_done_callback runs its callback inline
+        self._lock = threading.RLock()
+
+    def _resolve(self, address):
+        client = self.client or api_config.gmaps
+        for attempt in range(self.retries + 1):
+            self.rate_limiter.wait()
+            try:
+                with metrics.google_call('geocode'):
+                    geocode_result = client.geocode(f"{address}{self.suffix}")
+            except Exception as e:
+                if is_retriable(e) and attempt < self.retries:
+                    time.sleep(self.backoff * 2 ** attempt)
+                    continue
+                # Not cached, so the address is retried on a later lookup
+                print(f"Geocoding error for '{address}': {e}. Using default coordinates.")
+                return DEFAULT_COORDS
+            if geocode_result:
+                location = geocode_result[0]['geometry']['location']
+                coords = (location['lat'], location['lng'])
+                print(f"Geocoded '{address}' to {coords}")
+                self.cache.store(address, coords)
+                return coords
+            print(f"Geocoding failed for '{address}'. Using default coordinates.")
+            self.cache.store(address, None)
+            return DEFAULT_COORDS
+
+    def submit(self, address):
+        cached = self.cache.lookup(address)
+        if cached is not MISSING:
+            metrics.increment('hospital_geocode_cache_hits_total')
+            future = Future()
+            future.set_result(DEFAULT_COORDS if cached is None else cached)
+            return future
+        metrics.increment('hospital_geocode_cache_misses_total')
+        key = normalize_address(address)
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is None:
+                cached = self.cache.lookup(address)
+                if cached is not MISSING:
+                    future = Future()
+                    future.set_result(DEFAULT_COORDS if cached is None else cached)
+                    return future
+                future = self.executor.submit(self._resolve, address)
+                self._in_flight[key] = future
+                future.add_done_callback(lambda _, key=key: self._finish(key))
+        return future
+
+    def _finish(self, key):
+        with self._lock:
+            self._in_flight.pop(key, None)
+
+    def geocode(self, address):
+        return self.submit(address).result()
+
+    def geocode_many(self, addresses):
+        futures = {address: self.submit(address) for address in dict.fromkeys(addresses)}
+        return [futures[address].result() for address in addresses]
@@ -0,0 +1,233 @@
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from recommender import DEFAULT_RADIUS_KM, QueryError, find_candidates, parse_query, score_candidates
+from route_calculator import snap_coords
+from snapshot import is_stale_source, map_sections, source_stamp, write_snapshot
+
+# Precomputed answers for the commonest queries. `python main.py build-coverage` tiles the
+# region's bounding box into cells and ranks, from each cell centre, the top COVERAGE_TOP_K
+# hospitals for every popular service under each of the 9 cost/quality preference pairs, at
+# the default radius. The result is written next to the dataset in the snapshot layout and
+# mapped by every worker; a query that falls inside the grid and matches what it holds is
+# answered by indexing into it, anything else is scored live.
+#
+# Grid answers are approximate: every user in a cell gets the ranking and scores computed from
+# its centre, up to about 0.8 km away, as if they stood there. Distance_km is still measured from
+# the user, and a cell whose top k are not all within the radius of the user is scored live, so
+# a grid answer never lists a hospital the live search would have excluded.
+#
+# Only the base dataset is covered: admin changes since it was loaded turn the grid off until
+# they are compacted and the grid is rebuilt.
+COVERAGE_SUFFIX = '.coverage'
+COVERAGE_MAGIC = b'HOSPGRID'
+COVERAGE_VERSION = 3
+# About 1.1 km; a smaller cell is closer to live scoring but grows the job and the file
+# quadratically
+COVERAGE_CELL_DEGREES = 0.01
+COVERAGE_TOP_K = 10
+COVERAGE_SERVICES = 8
+PREFERENCE_LEVELS = ('Low', 'Medium', 'High')
+PREFERENCES = [(cost, quality) for cost in PREFERENCE_LEVELS for quality in PREFERENCE_LEVELS]
+
+def coverage_file(dataset_file):
+    # Shared by a CSV and the snapshot built from it
+    return os.path.splitext(dataset_file)[0] + COVERAGE_SUFFIX
+
+def popular_services(state, count=COVERAGE_SERVICES):
+    # The services most hospitals list, counting each entry of a comma-separated Services list
+    counts = Counter()
+    for text in state.service_index.texts:
+        if text:
+            counts.update({service.strip() for service in text.split(',') if service.strip()})
+    return [service for service, _ in counts.most_common(count)]
+
+def dataset_bbox(state):
+    coords = state.coordinates[~np.isnan(state.coordinates).any(axis=1)]
+    return tuple(coords.min(axis=0)), tuple(coords.max(axis=0))
+
+def grid_cells(bbox, cell_degrees):
+    # Index of the first cell and (rows, columns) of a grid covering bbox. Cell (i, j) is centred
+    # on ((first_lat + i) * cell_degrees, (first_lon + j) * cell_degrees), as snap_coords rounds.
+    (south, west), (north, east) = bbox
+    first_lat, first_lon = snap_coords((south, west), cell_degrees)
+    last_lat, last_lon = snap_coords((north, east), cell_degrees)
+    return (first_lat, first_lon), (last_lat - first_lat + 1, last_lon - first_lon + 1)
+
+def grid_queries(services, radius_km, k):
+    # [service][preference] -> parsed query
+    return [[parse_query({'service': service, 'cost_pref': cost, 'quality_pref': quality, 'radius_km': radius_km,
+                          'k': k, 'rerank': 0})
+             for cost, quality in PREFERENCES] for service in services]
+
+def grid_row(state, lat, lons, services, radius_km, k):
+    # Top-k row ids and scores for every cell of one grid row, service and preference pair, and
+    # how many hospitals offering each service lie within radius_km of each cell centre.
+    # Candidates depend only on the service, so each cell finds them once per service and scores
+    # all services and preferences in one vectorized pass.
+    queries = grid_queries(services, radius_km, k)
+    ids = np.full((len(services), len(PREFERENCES), len(lons), k), -1, dtype=np.int32)
+    scores = np.zeros(ids.shape, dtype=np.float64)
+    counts = np.zeros((len(services), len(lons)), dtype=np.int32)
+    for j, lon in enumerate(lons):
+        centre = (float(lat), float(lon))
+        found = []
+        for s, service_queries in enumerate(queries):
+            try:
+                candidate_set = find_candidates(state, service_queries[0], centre)
+            except QueryError:
+                continue
+            counts[s, j] = candidate_set[0].size
+            found.append((s, candidate_set))
+        if not found:
+            continue
+        cell_queries = [query for s, _ in found for query in queries[s]]
+        candidate_sets = [candidate_set for _, candidate_set in found for _ in PREFERENCES]
+        scored = score_candidates(state, cell_queries, candidate_sets, [k] * len(cell_queries))
+        slots = [(s, p) for s, _ in found for p in range(len(PREFERENCES))]
+        for (s, p), candidate_set, (positions, cell_scores) in zip(slots, candidate_sets, scored):
+            ids[s, p, j, :positions.size] = candidate_set[0][positions]
+            scores[s, p, j, :positions.size] = cell_scores
+    return ids, scores, counts
+
+# Worker processes load the dataset once and then compute whole grid rows
+_worker_state = None
+
+def _init_worker(dataset_file, cache_file, region):
+    global _worker_state
+    from app_state import build_app_state
+    _worker_state = build_app_state(dataset_file, cache_file, region=region)
+
+def _grid_row_in_worker(args):
+    return grid_row(_worker_state, *args)
+
+def build_coverage_grid(dataset_file, cache_file, output=None, region=None, services=None,
+                        cell_degrees=COVERAGE_CELL_DEGREES, radius_km=DEFAULT_RADIUS_KM, k=COVERAGE_TOP_K,
+                        workers=None):
+    from app_state import build_app_state
+
+    output = output or coverage_file(dataset_file)
+    state = build_app_state(dataset_file, cache_file, region=region)
+    if state is None:
+        print("Error: Could not build the coverage grid; the dataset failed to load.")
+        return None
+    services = [service.lower().strip() for service in services] if services else popular_services(state)
+    bbox = region.bbox if region is not None and region.bbox is not None else dataset_bbox(state)
+    (first_lat, first_lon), (rows, columns) = grid_cells(bbox, cell_degrees)
+    lons = (first_lon + np.arange(columns)) * cell_degrees
+    workers = max(1, min(workers or os.cpu_count() or 1, rows))
+    print(f"Ranking {len(services)} services x {len(PREFERENCES)} preferences over {rows} x {columns} cells "
+          f"with {workers} worker(s)...")
+
+    ids = np.full((len(services), len(PREFERENCES), rows, columns, k), -1, dtype=np.int32)
+    scores = np.zeros(ids.shape, dtype=np.float64)
+    counts = np.zeros((len(services), rows, columns), dtype=np.int32)
+    tasks = [((first_lat + i) * cell_degrees, lons, services, radius_km, k) for i in range(rows)]
+    if workers == 1:
+        results = (grid_row(state, *task) for task in tasks)
+        executor = None
+    else:
+        # Workers reload the dataset themselves; the geocode cache is warm by now, so they do not geocode
+        executor = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(dataset_file, cache_file, region))
+        results = executor.map(_grid_row_in_worker, tasks, chunksize=max(1, rows // (workers * 4)))
+    try:
+        for i, (row_ids, row_scores, row_counts) in enumerate(results):
+            ids[:, :, i] = row_ids
+            scores[:, :, i] = row_scores
+            counts[:, i] = row_counts
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    meta = {
+        'rows': len(state.store),
+        'source': source_stamp(dataset_file),
+        'fingerprint': state.store.model['fingerprint'],
+        'region': region.name if region is not None else None,
+        'services': services,
+        'preferences': PREFERENCES,
+        'cell_degrees': cell_degrees,
+        'first_cell': [first_lat, first_lon],
+        'radius_km': radius_km,
+        'k': k,
+    }
+    write_snapshot(output, {'ids': ids, 'scores': scores, 'counts': counts}, meta, COVERAGE_MAGIC, COVERAGE_VERSION)
+    print(f"Coverage grid of {rows * columns} cells saved to {output}.")
+    return output
+
+class CoverageGrid:
+    def __init__(self, path):
+        self.path = path
+        self._mmap, self.header, arrays = map_sections(path, COVERAGE_MAGIC, COVERAGE_VERSION, 'coverage grid')
+        # ids and scores: [service, preference, row, column, rank]; counts: [service, row, column]
+        self.ids = arrays['ids']
+        self.scores = arrays['scores']
+        self.counts = arrays['counts']
+        self.services = {service: s for s, service in enumerate(self.header['services'])}
+        self.preferences = {tuple(preference): p for p, preference in enumerate(self.header['preferences'])}
+        self.cell_degrees = self.header['cell_degrees']
+        self.first_cell = tuple(self.header['first_cell'])
+
+    def is_stale(self, state):
+        header = self.header
+        return header['rows'] != len(state.store) or header['fingerprint'] != state.store.model['fingerprint'] \
+            or is_stale_source(header['source'])
+
+    def cell(self, user_coords):
+        lat, lon = snap_coords(user_coords, self.cell_degrees)
+        i, j = lat - self.first_cell[0], lon - self.first_cell[1]
+        rows, columns = self.counts.shape[1:]
+        return (i, j) if 0 <= i < rows and 0 <= j < columns else None
+
+    def bounds(self):
+        # ((south, west), (north, east)) of the outer cell edges
+        rows, columns = self.counts.shape[1:]
+        half = self.cell_degrees / 2
+        south, west = (self.first_cell[0] * self.cell_degrees - half, self.first_cell[1] * self.cell_degrees - half)
+        return (south, west), (south + rows * self.cell_degrees, west + columns * self.cell_degrees)
+
+    def lookup(self, query, user_coords):
+        # (row ids, scores) best first, ranked from the centre of user_coords's cell, when the
+        # grid holds this query, else None. A cell with no match is left to live scoring, which
+        # reports why.
+        header = self.header
+        if query['nearest'] is not None or query.get('rerank') or query['radius_km'] != header['radius_km'] \
+                or query['k'] > header['k']:
+            return None
+        s = self.services.get(query['service'].lower().strip())
+        p = self.preferences.get((query['cost_pref_str'], query['quality_pref_str']))
+        cell = self.cell(user_coords)
+        if s is None or p is None or cell is None:
+            return None
+        ids = self.ids[s, p, cell[0], cell[1], :query['k']]
+        found = ids >= 0
+        if not found.any():
+            return None
+        return ids[found].astype(np.int64), np.array(self.scores[s, p, cell[0], cell[1], :query['k']][found])
+
+def open_coverage_grid(path, state):
+    # The grid for state's dataset, or None when there is none or it is out of date
+    if not os.path.exists(path):
+        return None
+    try:
+        grid = CoverageGrid(path)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error: Unable to read coverage grid {path}: {e}")
+        return None
+    if grid.is_stale(state):
+        print(f"Warning: ignoring {path}, which is older than the dataset. "
+              f"Rebuild it with `python main.py build-coverage`.")
+        return None
+    print(f"Loaded coverage grid {path} ({len(grid.services)} services).")
+    return grid
+
+def refresh_coverage_grid(state, path):
+    # Opens the grid when its file appears or is rebuilt; checked alongside dataset reloads
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+    if mtime != state.coverage_mtime:
+        state.coverage_mtime = mtime
+        state.coverage = open_coverage_grid(path, state) if mtime is not None else None
@@ -1,12 +1,25 @@
+import os
 import pandas as pd
+from snapshot import SNAPSHOT_SUFFIX, is_snapshot_file, open_snapshot
 
-def load_hospital_data(file_path='datasets\Lagos_hospital.csv'):
+DATASET_FILE = 'datasets\Lagos_hospital.csv'
+# Built from DATASET_FILE and the geocode cache by `python main.py build-snapshot`
+SNAPSHOT_FILE = os.path.splitext(DATASET_FILE)[0] + SNAPSHOT_SUFFIX
+# Rows missing a required field are dropped; other missing values are filled in
+REQUIRED_FIELDS = ['Name', 'Services', 'Cost Level']
+FIELD_DEFAULTS = {'Full Address': 'Unknown', 'Quality Score': 3.1, 'User Rating': 3.0}
+
+def load_hospital_data(file_path=DATASET_FILE):
+    # A snapshot loads as the same frame, with its Coordinates column already resolved
+    if is_snapshot_file(file_path):
+        snapshot = open_snapshot(file_path)
+        return None if snapshot is None else snapshot.to_frame()
     try:
         data = pd.read_csv(file_path)
-        data = data.dropna(subset=['Name', 'Services', 'Cost Level'])
-        data['Full Address'] = data['Full Address'].fillna('Unknown')
-        data['Quality Score'] = pd.to_numeric(data['Quality Score'], errors='coerce').fillna(3.1)
-        data['User Rating'] = pd.to_numeric(data['User Rating'], errors='coerce').fillna(3.0)
+        data = data.dropna(subset=REQUIRED_FIELDS)
+        data['Full Address'] = data['Full Address'].fillna(FIELD_DEFAULTS['Full Address'])
+        data['Quality Score'] = pd.to_numeric(data['Quality Score'], errors='coerce').fillna(FIELD_DEFAULTS['Quality Score'])
+        data['User Rating'] = pd.to_numeric(data['User Rating'], errors='coerce').fillna(FIELD_DEFAULTS['User Rating'])
         return data
     except FileNotFoundError:
         print(f"Error: {file_path} not found.")
@@ -1,6 +1,11 @@
 import numpy as np
 from geopy.distance import geodesic
 
+EARTH_RADIUS_KM = 6371.0088
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = (1 - WGS84_F) * WGS84_A
+
 def calculate_distance(user_coords, hospital_coords, scale=2.0):
     if user_coords is None or hospital_coords is None:
         return 0.0, float('inf')
@@ -10,4 +15,74 @@ def calculate_distance(user_coords, hospital_coords, scale=2.0):
         return proximity_score, distance
     except Exception as e:
         print(f"Distance calculation error: {e}")
-        return 0.0, float('inf')
\ No newline at end of file
+        return 0.0, float('inf')
+
+def haversine_km(lat, lon, lats, lons):
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2.0) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2.0) ** 2
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def vincenty_km(lat, lon, lats, lons, max_iterations=200, tolerance=1e-12):
+    # Vincenty's inverse formula on the WGS-84 ellipsoid, iterated for all points at once.
+    # Agrees with geopy's geodesic to well under a millimetre; the few (near-antipodal)
+    # pairs that do not converge fall back to geodesic.
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    f = WGS84_F
+    L = np.radians(lons - lon)
+    U1 = np.arctan((1 - f) * np.tan(np.radians(lat)))
+    U2 = np.arctan((1 - f) * np.tan(np.radians(lats)))
+    sinU1, cosU1 = np.sin(U1), np.cos(U1)
+    sinU2, cosU2 = np.sin(U2), np.cos(U2)
+
+    lam = L.copy()
+    converged = np.zeros(lam.shape, dtype=bool)
+    for _ in range(max_iterations):
+        sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+        sin_sigma = np.sqrt((cosU2 * sin_lam) ** 2 + (cosU1 * sinU2 - sinU1 * cosU2 * cos_lam) ** 2)
+        cos_sigma = sinU1 * sinU2 + cosU1 * cosU2 * cos_lam
+        sigma = np.arctan2(sin_sigma, cos_sigma)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sin_alpha = np.where(sin_sigma == 0, 0.0, cosU1 * cosU2 * sin_lam / sin_sigma)
+            cos2_alpha = 1 - sin_alpha ** 2
+            cos_2sigma_m = np.where(cos2_alpha == 0, 0.0, cos_sigma - 2 * sinU1 * sinU2 / cos2_alpha)
+        C = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+        lam_prev = lam
+        lam = L + (1 - C) * f * sin_alpha * (
+            sigma + C * sin_sigma * (cos_2sigma_m + C * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)))
+        converged = np.abs(lam - lam_prev) < tolerance
+        if converged.all():
+            break
+
+    u2 = cos2_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+    A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+    B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+    delta_sigma = B * sin_sigma * (cos_2sigma_m + B / 4 * (
+        cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)
+        - B / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)))
+    distances = WGS84_B * A * (sigma - delta_sigma) / 1000.0
+
+    for i in np.flatnonzero(~converged & np.isfinite(lats) & np.isfinite(lons)):
+        distances[i] = geodesic((lat, lon), (lats[i], lons[i])).km
+    return distances
+
+def calculate_distances(user_coords, hospital_coords, scale=2.0, method='ellipsoidal'):
+    # Vectorized calculate_distance for one origin and an (N, 2) array of (lat, lon).
+    # Rows with missing (NaN) coordinates, or every row when there is no origin, get
+    # proximity 0.0 and distance inf, matching the scalar version.
+    coords = np.asarray(hospital_coords, dtype=np.float64).reshape(-1, 2)
+    proximity = np.zeros(coords.shape[0])
+    distances = np.full(coords.shape[0], np.inf)
+    if user_coords is None:
+        return proximity, distances
+    valid = np.isfinite(coords).all(axis=1)
+    lat, lon = float(user_coords[0]), float(user_coords[1])
+    if method == 'haversine':
+        distances[valid] = haversine_km(lat, lon, coords[valid, 0], coords[valid, 1])
+    elif method == 'ellipsoidal':
+        distances[valid] = vincenty_km(lat, lon, coords[valid, 0], coords[valid, 1])
+    else:
+        raise ValueError(f"Unknown distance method '{method}'. Use 'haversine' or 'ellipsoidal'.")
+    proximity[valid] = np.exp(-distances[valid] / scale)
+    return proximity, distances
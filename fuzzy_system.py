@@ -1,7 +1,12 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+import zipfile
 import numpy as np
-import skfuzzy as fuzz
-from skfuzzy import control as ctrl
 from distance_calculator import calculate_distance
+import metrics
 import pandas as pd
 
 def map_preference_to_value(pref):
@@ -25,89 +30,113 @@ def map_cost_rating(cost_rating):
     cost_map = {'Low': 1.0, 'Medium': 2.0, 'High': 3.0, 'Premium': 3.0}
     return cost_map.get(cost_rating.strip().capitalize(), 1.0)
 
+FUZZY_VARIABLES = {
+    'cost': ((1, 3.1, 0.1), {
+        'low': [1, 1, 1.2, 1.8],
+        'medium': [1.2, 1.8, 2.2, 2.8],
+        'high': [2.2, 2.8, 3, 3],
+    }),
+    'quality': ((3, 5.1, 0.1), {
+        'low': [3, 3, 3.4, 3.8],
+        'medium': [3.4, 3.8, 4.2, 4.6],
+        'high': [4.2, 4.6, 5, 5],
+    }),
+    'user_rating': ((1, 5.1, 0.1), {
+        'low': [1, 1, 2, 3],
+        'medium': [2, 3, 3.5, 4],
+        'high': [3.5, 4, 5, 5],
+    }),
+    'service_match': ((0, 1.1, 0.1), {
+        'low': [0, 0, 0.3, 0.6],
+        'high': [0.4, 0.7, 1, 1],
+    }),
+    'user_cost_pref': ((0, 1.1, 0.1), {
+        'low': [0, 0, 0.2, 0.4],
+        'medium': [0.3, 0.5, 0.7, 0.9],
+        'high': [0.6, 0.8, 1, 1],
+    }),
+    'user_quality_pref': ((0, 1.1, 0.1), {
+        'low': [0, 0, 0.2, 0.4],
+        'medium': [0.3, 0.5, 0.7, 0.9],
+        'high': [0.6, 0.8, 1, 1],
+    }),
+    'proximity': ((0, 1.1, 0.1), {
+        'far': [0, 0, 0.2, 0.4],
+        'medium': [0.3, 0.4, 0.6, 0.7],
+        'near': [0.6, 0.7, 0.9, 1],
+        'very_near': [0.8, 0.9, 1, 1],
+    }),
+}
+
+OUTPUT_VARIABLE = ('recommendation', (0, 1.1, 0.1), {
+    'low': [0, 0, 0.3, 0.5],
+    'medium': [0.4, 0.5, 0.6, 0.7],
+    'high': [0.6, 0.7, 1, 1],
+})
+
+# Rule antecedents are nested ('and' | 'or', ...) tuples over (variable, term) leaves.
+# Both setup_fuzzy_system and the batch scorer below are built from these definitions.
+RULE_DEFINITIONS = [
+    (('and', ('service_match', 'high'), ('proximity', 'very_near'), ('quality', 'high'), ('user_rating', 'high'),
+      ('or', ('and', ('cost', 'low'), ('user_cost_pref', 'low')),
+             ('and', ('cost', 'medium'), ('user_cost_pref', 'medium')),
+             ('and', ('cost', 'high'), ('user_cost_pref', 'high'))),
+      ('user_quality_pref', 'high')),
+     'high'),
+    (('and', ('service_match', 'high'), ('proximity', 'near'), ('quality', 'high'), ('user_rating', 'medium'),
+      ('or', ('and', ('cost', 'low'), ('user_cost_pref', 'low')),
+             ('and', ('cost', 'medium'), ('user_cost_pref', 'medium'))),
+      ('user_quality_pref', 'high')),
+     'high'),
+    (('and', ('service_match', 'high'), ('proximity', 'medium'), ('or', ('quality', 'medium'), ('quality', 'high')),
+      ('user_rating', 'medium'),
+      ('or', ('and', ('cost', 'low'), ('user_cost_pref', 'low')),
+             ('and', ('cost', 'medium'), ('user_cost_pref', 'medium')))),
+     'medium'),
+    (('and', ('service_match', 'high'), ('proximity', 'near'), ('quality', 'medium'), ('user_rating', 'medium'),
+      ('user_quality_pref', 'medium')),
+     'medium'),
+    (('or', ('service_match', 'low'), ('proximity', 'far'), ('and', ('quality', 'low'), ('user_quality_pref', 'high'))),
+     'low'),
+    (('or', ('and', ('cost', 'high'), ('user_cost_pref', 'low')), ('and', ('cost', 'medium'), ('user_cost_pref', 'low'))),
+     'low'),
+    (('and', ('service_match', 'high'), ('proximity', 'very_near'), ('quality', 'medium'), ('user_rating', 'high'),
+      ('user_quality_pref', 'medium'), ('or', ('cost', 'low'), ('cost', 'medium'))),
+     'high'),
+    (('and', ('service_match', 'low'), ('proximity', 'very_near'), ('quality', 'high'), ('user_rating', 'high'),
+      ('user_quality_pref', 'high'), ('cost', 'low'), ('user_cost_pref', 'low')),
+     'medium'),
+]
+
+def _build_rule_antecedent(expr, variables):
+    if expr[0] in ('and', 'or'):
+        terms = [_build_rule_antecedent(child, variables) for child in expr[1:]]
+        combined = terms[0]
+        for term in terms[1:]:
+            combined = (combined & term) if expr[0] == 'and' else (combined | term)
+        return combined
+    name, label = expr
+    return variables[name][label]
+
 def setup_fuzzy_system():
-    cost = ctrl.Antecedent(np.arange(1, 3.1, 0.1), 'cost')
-    quality = ctrl.Antecedent(np.arange(3, 5.1, 0.1), 'quality')
-    user_rating = ctrl.Antecedent(np.arange(1, 5.1, 0.1), 'user_rating')
-    service_match = ctrl.Antecedent(np.arange(0, 1.1, 0.1), 'service_match')
-    user_cost_pref = ctrl.Antecedent(np.arange(0, 1.1, 0.1), 'user_cost_pref')
-    user_quality_pref = ctrl.Antecedent(np.arange(0, 1.1, 0.1), 'user_quality_pref')
-    proximity = ctrl.Antecedent(np.arange(0, 1.1, 0.1), 'proximity')
-    recommendation = ctrl.Consequent(np.arange(0, 1.1, 0.1), 'recommendation')
-
-    cost['low'] = fuzz.trapmf(cost.universe, [1, 1, 1.2, 1.8])
-    cost['medium'] = fuzz.trapmf(cost.universe, [1.2, 1.8, 2.2, 2.8])
-    cost['high'] = fuzz.trapmf(cost.universe, [2.2, 2.8, 3, 3])
-
-    quality['low'] = fuzz.trapmf(quality.universe, [3, 3, 3.4, 3.8])
-    quality['medium'] = fuzz.trapmf(quality.universe, [3.4, 3.8, 4.2, 4.6])
-    quality['high'] = fuzz.trapmf(quality.universe, [4.2, 4.6, 5, 5])
-
-    user_rating['low'] = fuzz.trapmf(user_rating.universe, [1, 1, 2, 3])
-    user_rating['medium'] = fuzz.trapmf(user_rating.universe, [2, 3, 3.5, 4])
-    user_rating['high'] = fuzz.trapmf(user_rating.universe, [3.5, 4, 5, 5])
-
-    service_match['low'] = fuzz.trapmf(service_match.universe, [0, 0, 0.3, 0.6])
-    service_match['high'] = fuzz.trapmf(service_match.universe, [0.4, 0.7, 1, 1])
-
-    user_cost_pref['low'] = fuzz.trapmf(user_cost_pref.universe, [0, 0, 0.2, 0.4])
-    user_cost_pref['medium'] = fuzz.trapmf(user_cost_pref.universe, [0.3, 0.5, 0.7, 0.9])
-    user_cost_pref['high'] = fuzz.trapmf(user_cost_pref.universe, [0.6, 0.8, 1, 1])
-
-    user_quality_pref['low'] = fuzz.trapmf(user_quality_pref.universe, [0, 0, 0.2, 0.4])
-    user_quality_pref['medium'] = fuzz.trapmf(user_quality_pref.universe, [0.3, 0.5, 0.7, 0.9])
-    user_quality_pref['high'] = fuzz.trapmf(user_quality_pref.universe, [0.6, 0.8, 1, 1])
-
-    proximity['far'] = fuzz.trapmf(proximity.universe, [0, 0, 0.2, 0.4])
-    proximity['medium'] = fuzz.trapmf(proximity.universe, [0.3, 0.4, 0.6, 0.7])
-    proximity['near'] = fuzz.trapmf(proximity.universe, [0.6, 0.7, 0.9, 1])
-    proximity['very_near'] = fuzz.trapmf(proximity.universe, [0.8, 0.9, 1, 1])
-
-    recommendation['low'] = fuzz.trapmf(recommendation.universe, [0, 0, 0.3, 0.5])
-    recommendation['medium'] = fuzz.trapmf(recommendation.universe, [0.4, 0.5, 0.6, 0.7])
-    recommendation['high'] = fuzz.trapmf(recommendation.universe, [0.6, 0.7, 1, 1])
+    # skfuzzy.control imports matplotlib, so it is only loaded for the per-row simulation
+    import skfuzzy as fuzz
+    from skfuzzy import control as ctrl
+
+    variables = {}
+    for name, (universe_range, terms) in FUZZY_VARIABLES.items():
+        variables[name] = ctrl.Antecedent(np.arange(*universe_range), name)
+        for label, params in terms.items():
+            variables[name][label] = fuzz.trapmf(variables[name].universe, params)
+
+    output_name, output_range, output_terms = OUTPUT_VARIABLE
+    recommendation = ctrl.Consequent(np.arange(*output_range), output_name)
+    for label, params in output_terms.items():
+        recommendation[label] = fuzz.trapmf(recommendation.universe, params)
 
     rules = [
-        ctrl.Rule(
-            service_match['high'] & proximity['very_near'] & quality['high'] & user_rating['high'] &
-            ((cost['low'] & user_cost_pref['low']) | (cost['medium'] & user_cost_pref['medium']) | (cost['high'] & user_cost_pref['high'])) &
-            user_quality_pref['high'],
-            recommendation['high']
-        ),
-        ctrl.Rule(
-            service_match['high'] & proximity['near'] & quality['high'] & user_rating['medium'] &
-            ((cost['low'] & user_cost_pref['low']) | (cost['medium'] & user_cost_pref['medium'])) &
-            user_quality_pref['high'],
-            recommendation['high']
-        ),
-        ctrl.Rule(
-            service_match['high'] & proximity['medium'] & (quality['medium'] | quality['high']) & user_rating['medium'] &
-            ((cost['low'] & user_cost_pref['low']) | (cost['medium'] & user_cost_pref['medium'])),
-            recommendation['medium']
-        ),
-        ctrl.Rule(
-            service_match['high'] & proximity['near'] & quality['medium'] & user_rating['medium'] &
-            user_quality_pref['medium'],
-            recommendation['medium']
-        ),
-        ctrl.Rule(
-            service_match['low'] | proximity['far'] | (quality['low'] & user_quality_pref['high']),
-            recommendation['low']
-        ),
-        ctrl.Rule(
-            (cost['high'] & user_cost_pref['low']) | (cost['medium'] & user_cost_pref['low']),
-            recommendation['low']
-        ),
-        ctrl.Rule(
-            service_match['high'] & proximity['very_near'] & quality['medium'] & user_rating['high'] &
-            user_quality_pref['medium'] & (cost['low'] | cost['medium']),
-            recommendation['high']
-        ),
-        ctrl.Rule(
-            service_match['low'] & proximity['very_near'] & quality['high'] & user_rating['high'] &
-            user_quality_pref['high'] & cost['low'] & user_cost_pref['low'],
-            recommendation['medium']
-        )
+        ctrl.Rule(_build_rule_antecedent(antecedent, variables), recommendation[consequent])
+        for antecedent, consequent in RULE_DEFINITIONS
     ]
 
     hospital_ctrl = ctrl.ControlSystem(rules)
@@ -133,4 +162,276 @@ def compute_recommendation_score(row, user_service, user_cost_pref, user_quality
         return fuzzy_system.output.get('recommendation', 0.0)
     except Exception as e:
         print(f"Error processing {row['Name']}: {e}")
-        return 0.0
\ No newline at end of file
+        return 0.0
+
+# Batch scoring.
+#
+# compute_recommendation_scores evaluates RULE_DEFINITIONS over whole arrays of hospitals
+# with the same arithmetic skfuzzy's ControlSystemSimulation uses for a single input:
+# inputs clipped to each universe, linear interpolation of the sampled trapezoids,
+# fmin/fmax for AND/OR, fmax accumulation per consequent term, the universe upsampled at
+# the points where each term crosses its activation level, and an exact piecewise-linear
+# centroid. Scores agree with compute_recommendation_score to within 1e-9 (floating point
+# summation order only); hospitals whose rules all fire at zero score 0.0, as before.
+
+SCORE_TOLERANCE = 1e-9
+BATCH_CHUNK_SIZE = 65536
+# Compiled model artifact: sampled membership functions plus rule structure, reused across
+# processes until the definitions above change. Kept beside this module, not in whatever
+# directory a worker happens to start in.
+FUZZY_MODEL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fuzzy_model.npz')
+FUZZY_MODEL_FORMAT = 1
+
+_fuzzy_model = None
+
+def fuzzy_definitions_hash():
+    # Changes whenever a variable, term or rule definition does
+    definitions = repr((FUZZY_VARIABLES, OUTPUT_VARIABLE, RULE_DEFINITIONS))
+    return hashlib.sha256(definitions.encode()).hexdigest()[:16]
+
+def compile_fuzzy_model():
+    import skfuzzy as fuzz
+
+    variables = {}
+    for name, (universe_range, terms) in FUZZY_VARIABLES.items():
+        universe = np.arange(*universe_range)
+        variables[name] = (universe, {label: fuzz.trapmf(universe, params) for label, params in terms.items()})
+    output_name, output_range, output_terms = OUTPUT_VARIABLE
+    output_universe = np.arange(*output_range)
+    output = (output_universe, {label: fuzz.trapmf(output_universe, params) for label, params in output_terms.items()})
+    return {'variables': variables, 'output': output, 'output_params': output_terms, 'rules': RULE_DEFINITIONS,
+            'fingerprint': fuzzy_definitions_hash()}
+
+def save_fuzzy_model(model, path=FUZZY_MODEL_FILE):
+    arrays = {}
+    for name, (universe, terms) in model['variables'].items():
+        arrays[f'input__{name}__universe'] = universe
+        for label, mf in terms.items():
+            arrays[f'input__{name}__{label}'] = mf
+    output_universe, output_terms = model['output']
+    arrays['output__universe'] = output_universe
+    for label, mf in output_terms.items():
+        arrays[f'output__{label}'] = mf
+    meta = {
+        'format': FUZZY_MODEL_FORMAT,
+        'fingerprint': model['fingerprint'],
+        'variables': {name: list(terms) for name, (_, terms) in model['variables'].items()},
+        'output': list(output_terms),
+        'output_params': model['output_params'],
+        'rules': model['rules'],
+    }
+    # A temp file of its own, so workers compiling at the same time never write into each other's
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp',
+                                        dir=os.path.dirname(os.path.abspath(path)))
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, meta=np.array(json.dumps(meta)), **arrays)
+        os.replace(tmp_path, path)
+        return True
+    except OSError as e:
+        print(f"Error saving compiled fuzzy model to {path}: {e}")
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+def _as_tuples(expr):
+    return tuple(_as_tuples(item) for item in expr) if isinstance(expr, list) else expr
+
+def load_fuzzy_model(path=FUZZY_MODEL_FILE):
+    # Returns None when the artifact is missing, unreadable or built from other definitions
+    try:
+        with np.load(path, allow_pickle=False) as artifact:
+            meta = json.loads(str(artifact['meta']))
+            if meta['format'] != FUZZY_MODEL_FORMAT or meta['fingerprint'] != fuzzy_definitions_hash():
+                return None
+            variables = {
+                name: (artifact[f'input__{name}__universe'], {label: artifact[f'input__{name}__{label}'] for label in labels})
+                for name, labels in meta['variables'].items()
+            }
+            output = (artifact['output__universe'], {label: artifact[f'output__{label}'] for label in meta['output']})
+    except (OSError, KeyError, ValueError, EOFError, zipfile.BadZipFile) as e:
+        if os.path.exists(path):
+            print(f"Ignoring unreadable compiled fuzzy model {path}: {e}")
+        return None
+    rules = [(_as_tuples(antecedent), consequent) for antecedent, consequent in meta['rules']]
+    return {'variables': variables, 'output': output, 'output_params': meta['output_params'], 'rules': rules,
+            'fingerprint': meta['fingerprint']}
+
+def get_fuzzy_model(path=FUZZY_MODEL_FILE):
+    global _fuzzy_model
+    if _fuzzy_model is None:
+        start = time.perf_counter()
+        model = load_fuzzy_model(path)
+        source = 'artifact'
+        if model is None:
+            model = compile_fuzzy_model()
+            save_fuzzy_model(model, path)
+            source = 'compiled'
+        metrics.set_gauge('hospital_fuzzy_model_load_seconds', time.perf_counter() - start, source=source)
+        _fuzzy_model = model
+    return _fuzzy_model
+
+def fuzzify(model, name, values):
+    universe, terms = model['variables'][name]
+    values = np.clip(np.asarray(values, dtype=np.float64), universe.min(), universe.max())
+    return {label: np.interp(values, universe, mf) for label, mf in terms.items()}
+
+def _evaluate_antecedent(expr, memberships):
+    if expr[0] in ('and', 'or'):
+        combine = np.fmin if expr[0] == 'and' else np.fmax
+        result = _evaluate_antecedent(expr[1], memberships)
+        for child in expr[2:]:
+            result = combine(result, _evaluate_antecedent(child, memberships))
+        return result
+    name, label = expr
+    return memberships[name][label]
+
+def rule_activations(model, memberships, size):
+    _, output_terms = model['output']
+    activations = {label: np.zeros(size) for label in output_terms}
+    for antecedent, consequent in model['rules']:
+        strength = np.broadcast_to(_evaluate_antecedent(antecedent, memberships), (size,))
+        activations[consequent] = np.fmax(activations[consequent], strength)
+    return activations
+
+def _centroid_chunk(universe, term_mfs, cuts):
+    # Upsample: the universe plus every point where a term's mf crosses its cut level
+    points = [np.broadcast_to(universe, (cuts.shape[0], universe.size))]
+    for mf, cut in zip(term_mfs, cuts.T):
+        cut = cut[:, None]
+        above = np.where(cut == 0, mf > cut, mf >= cut)
+        crossing = above[:, 1:] != above[:, :-1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x = universe[:-1] + (cut - mf[:-1]) * np.diff(universe) / np.diff(mf)
+        points.append(np.where(crossing, x, np.nan))
+    points = np.sort(np.concatenate(points, axis=1), axis=1)
+    points = np.where(np.isnan(points), universe[-1], points)
+
+    output_mf = np.zeros_like(points)
+    for mf, cut in zip(term_mfs, cuts.T):
+        np.fmax(output_mf, np.fmin(cut[:, None], np.interp(points, universe, mf)), out=output_mf)
+
+    x1, x2 = points[:, :-1], points[:, 1:]
+    y1, y2 = output_mf[:, :-1], output_mf[:, 1:]
+    width = x2 - x1
+    area = 0.5 * width * (y1 + y2)
+    moment = width * width * (y1 + 2.0 * y2) / 6.0 + x1 * area
+    total_area = area.sum(axis=1)
+    total_moment = moment.sum(axis=1)
+    scores = np.zeros(cuts.shape[0])
+    nonempty = (cuts.max(axis=1) > 0) & (total_area > 0)
+    scores[nonempty] = total_moment[nonempty] / np.fmax(total_area[nonempty], np.finfo(float).eps)
+    return scores
+
+def defuzzify_centroid(model, activations):
+    universe, output_terms = model['output']
+    labels = list(output_terms)
+    term_mfs = [output_terms[label] for label in labels]
+    cuts = np.column_stack([activations[label] for label in labels])
+    scores = np.zeros(cuts.shape[0])
+    for start in range(0, cuts.shape[0], BATCH_CHUNK_SIZE):
+        stop = start + BATCH_CHUNK_SIZE
+        scores[start:stop] = _centroid_chunk(universe, term_mfs, cuts[start:stop])
+    return scores
+
+def compute_recommendation_scores(cost, quality, user_rating, service_match, proximity,
+                                  user_cost_pref, user_quality_pref, model=None):
+    model = model or get_fuzzy_model()
+    size = np.broadcast(cost, quality, user_rating, service_match, proximity).size
+    memberships = {
+        'cost': fuzzify(model, 'cost', cost),
+        'quality': fuzzify(model, 'quality', quality),
+        'user_rating': fuzzify(model, 'user_rating', user_rating),
+        'service_match': fuzzify(model, 'service_match', service_match),
+        'proximity': fuzzify(model, 'proximity', proximity),
+        'user_cost_pref': fuzzify(model, 'user_cost_pref', user_cost_pref),
+        'user_quality_pref': fuzzify(model, 'user_quality_pref', user_quality_pref),
+    }
+    return score_memberships(model, memberships, size)
+
+def score_memberships(model, memberships, size):
+    return defuzzify_centroid(model, rule_activations(model, memberships, size))
+
+
+# Top-k selection with upper-bound pruning.
+#
+# Rule activations are cheap element-wise min/max; the centroid is the expensive step. An
+# upper bound on each hospital's centroid follows from its activations alone: the aggregate
+# output is the max of the clipped consequent trapezoids, so its moment is at most the sum
+# of their moments, and its area is at least the sum of their areas minus their pairwise
+# overlaps (each no larger than min(cut_i, cut_j) times the width the two supports share).
+# The interpolated aggregate skfuzzy integrates lies between the two, so the bound also holds
+# for the exact scores. top_k_scores evaluates hospitals in bound order and stops as soon as
+# the k-th best exact score beats every remaining bound.
+
+BOUND_MARGIN = 1e-9
+MIN_BOUNDED_AREA = 1e-9
+TOP_K_CHUNK_SIZE = 64
+
+def _clipped_trapezoid_area_moment(params, cut):
+    a, b, c, d = params
+    rise_end = a + cut * (b - a)
+    fall_start = d - cut * (d - c)
+    rise = 0.5 * cut * (rise_end - a)
+    plateau = cut * (fall_start - rise_end)
+    fall = 0.5 * cut * (d - fall_start)
+    moment = (rise * (a + 2.0 * (rise_end - a) / 3.0) + plateau * (rise_end + fall_start) / 2.0
+              + fall * (fall_start + (d - fall_start) / 3.0))
+    return rise + plateau + fall, moment
+
+def score_upper_bounds(model, activations):
+    output_params = model['output_params']
+    labels = list(output_params)
+    area_sum = moment_sum = max_area = 0.0
+    for label in labels:
+        area, moment = _clipped_trapezoid_area_moment(output_params[label], activations[label])
+        area_sum = area_sum + area
+        moment_sum = moment_sum + moment
+        max_area = np.fmax(max_area, area)
+    overlap = 0.0
+    for i, first in enumerate(labels):
+        for second in labels[i + 1:]:
+            shared = min(output_params[first][3], output_params[second][3]) - max(output_params[first][0], output_params[second][0])
+            if shared > 0:
+                overlap = overlap + np.fmin(activations[first], activations[second]) * shared
+    denominator = np.fmax(area_sum - overlap, max_area)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bounds = np.where(denominator > 0, moment_sum / denominator, 0.0)
+    # Cuts within rounding error of zero leave a sliver whose centroid the closed form cannot
+    # bound reliably; fall back to the top of the output universe for those.
+    universe_max = model['output'][0].max()
+    bounds = np.where(max_area > MIN_BOUNDED_AREA, np.fmin(bounds, universe_max), universe_max)
+    return np.where(denominator > 0, bounds + BOUND_MARGIN, 0.0)
+
+def top_k_scores(model, activations, k, chunk_size=TOP_K_CHUNK_SIZE):
+    # Returns (positions, scores) of the k best non-zero scores, best first; ties keep the
+    # lower position first, as a stable sort of every score would.
+    bounds = score_upper_bounds(model, activations)
+    remaining = np.flatnonzero(bounds > 0)
+    chunk_size = max(chunk_size, 4 * k)
+    evaluated = []
+    evaluated_scores = []
+    while remaining.size:
+        if remaining.size > chunk_size:
+            order = np.argpartition(-bounds[remaining], chunk_size)
+            batch, remaining = remaining[order[:chunk_size]], remaining[order[chunk_size:]]
+        else:
+            batch, remaining = remaining, remaining[:0]
+        evaluated.append(batch)
+        evaluated_scores.append(defuzzify_centroid(model, {label: values[batch] for label, values in activations.items()}))
+        scores = np.concatenate(evaluated_scores)
+        positive = scores[scores > 0]
+        if remaining.size == 0 or positive.size < k:
+            continue
+        if np.partition(positive, positive.size - k)[positive.size - k] > bounds[remaining].max():
+            break
+
+    if not evaluated:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    positions = np.concatenate(evaluated)
+    scores = np.concatenate(evaluated_scores)
+    keep = scores > 0
+    positions, scores = positions[keep], scores[keep]
+    order = np.lexsort((positions, -scores))[:k]
+    return positions[order], scores[order]
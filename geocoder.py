@@ -1,52 +1,130 @@
-import googlemaps
 import os
+import sqlite3
+import threading
+import time
 import pandas as pd
-from api_config import gmaps
 
 DEFAULT_COORDS = (6.5244, 3.3792)
+CACHE_FILE = 'hospital_coordinates.db'
+LEGACY_CACHE_FILE = 'hospital_coordinates.csv'
+SQLITE_BATCH_SIZE = 500
+MISSING = object()
 
-def load_geocode_cache(cache_file='hospital_coordinates.csv'):
-    if os.path.exists(cache_file):
+def normalize_address(address):
+    return ' '.join(str(address).lower().split())
+
+# Persistent geocode cache in SQLite (WAL mode), shared safely by every worker process.
+# Coordinates are stored as typed REAL columns keyed by normalized address; a failed lookup
+# is stored with NULL coordinates. Entries are kept in memory once read, and flush() only
+# inserts the entries added since the last flush.
+class GeocodeCache:
+    def __init__(self, path=CACHE_FILE, legacy_csv=LEGACY_CACHE_FILE):
+        self.path = path
+        self._local = threading.local()
+        self._entries = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS geocode_cache ('
+            'address TEXT PRIMARY KEY, lat REAL, lon REAL, updated_at REAL NOT NULL)'
+        )
+        conn.commit()
+        if legacy_csv and os.path.exists(legacy_csv):
+            self._import_legacy_csv(conn, legacy_csv)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0, uri=self.path.startswith('file:'))
+            conn.execute('PRAGMA busy_timeout=30000')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _import_legacy_csv(self, conn, legacy_csv):
+        if conn.execute('SELECT 1 FROM geocode_cache LIMIT 1').fetchone():
+            return
         try:
-            cache = pd.read_csv(cache_file, index_col='Address')
-            return cache.to_dict()['Coordinates']
+            legacy = pd.read_csv(legacy_csv, index_col='Address').to_dict()['Coordinates']
         except Exception as e:
-            print(f"Error loading cache: {e}. Starting with empty cache.")
-    return {}
+            print(f"Error importing legacy cache {legacy_csv}: {e}")
+            return
+        rows = []
+        for address, coords_str in legacy.items():
+            try:
+                if pd.isna(coords_str) or coords_str == 'None':
+                    lat, lon = None, None
+                else:
+                    lat, lon = map(float, coords_str.strip('()').split(','))
+            except (AttributeError, ValueError):
+                continue
+            rows.append((normalize_address(address), lat, lon, time.time()))
+        with conn:
+            conn.executemany('INSERT OR IGNORE INTO geocode_cache VALUES (?, ?, ?, ?)', rows)
+        print(f"Imported {len(rows)} cached coordinates from {legacy_csv} into {self.path}")
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM geocode_cache').fetchone()[0]
+
+    def __contains__(self, address):
+        return self.lookup(address) is not MISSING
+
+    def preload(self, addresses):
+        keys = list({normalize_address(address) for address in addresses} - self._entries.keys())
+        conn = self._connection()
+        for start in range(0, len(keys), SQLITE_BATCH_SIZE):
+            chunk = keys[start:start + SQLITE_BATCH_SIZE]
+            placeholders = ','.join('?' * len(chunk))
+            for key, lat, lon in conn.execute(
+                    f'SELECT address, lat, lon FROM geocode_cache WHERE address IN ({placeholders})', chunk):
+                self._entries[key] = None if lat is None else (lat, lon)
 
-def save_geocode_cache(cache, cache_file='hospital_coordinates.csv'):
+    def lookup(self, address):
+        # (lat, lon), None for a cached failure, or MISSING
+        key = normalize_address(address)
+        if key in self._entries:
+            return self._entries[key]
+        row = self._connection().execute(
+            'SELECT lat, lon FROM geocode_cache WHERE address = ?', (key,)).fetchone()
+        if row is None:
+            return MISSING
+        coords = None if row[0] is None else (row[0], row[1])
+        self._entries[key] = coords
+        return coords
+
+    def store(self, address, coords):
+        key = normalize_address(address)
+        with self._lock:
+            self._entries[key] = coords
+            self._pending[key] = coords
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        now = time.time()
+        rows = [(key, *(coords if coords else (None, None)), now) for key, coords in pending.items()]
+        conn = self._connection()
+        with conn:
+            conn.executemany('INSERT OR REPLACE INTO geocode_cache VALUES (?, ?, ?, ?)', rows)
+        return len(rows)
+
+def load_geocode_cache(cache_file=CACHE_FILE):
     try:
-        cache_df = pd.DataFrame.from_dict(cache, orient='index', columns=['Coordinates'])
-        cache_df.index.name = 'Address'
-        cache_df.to_csv(cache_file)
-        print(f"Geocoding cache saved to {cache_file}")
-    except Exception as e:
-        print(f"Error saving cache: {e}")
+        return GeocodeCache(cache_file)
+    except sqlite3.Error as e:
+        print(f"Error opening cache: {e}. Using an in-memory cache.")
+        return GeocodeCache(f'file:geocode-{id(object())}?mode=memory&cache=shared', legacy_csv=None)
 
-def geocode_address(address, cache):
-    if address in cache:
-        coords_str = cache[address]
-        if coords_str == 'None':
-            return DEFAULT_COORDS
-        try:
-            lat, lon = map(float, coords_str.strip('()').split(','))
-            return (lat, lon)
-        except:
-            print(f"Invalid cached coordinates for '{address}'. Re-geocoding.")
-    
+def save_geocode_cache(cache):
     try:
-        full_address = f"{address}, Lagos, Nigeria"
-        geocode_result = gmaps.geocode(full_address)
-        if geocode_result:
-            location = geocode_result[0]['geometry']['location']
-            coords = (location['lat'], location['lng'])
-            print(f"Geocoded '{address}' to {coords}")
-            cache[address] = f"({coords[0]},{coords[1]})"
-            return coords
-        print(f"Geocoding failed for '{address}'. Using default coordinates.")
-        cache[address] = 'None'
-        return DEFAULT_COORDS
-    except Exception as e:
-        print(f"Geocoding error for '{address}': {e}. Using default coordinates.")
-        cache[address] = 'None'
-        return DEFAULT_COORDS
\ No newline at end of file
+        written = cache.flush()
+        if written:
+            print(f"Geocoding cache saved {written} new entr{'y' if written == 1 else 'ies'} to {cache.path}")
+        return written
+    except sqlite3.Error as e:
+        print(f"Error saving cache: {e}")
+        return 0
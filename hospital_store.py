@@ -0,0 +1,128 @@
+import copy
+import numpy as np
+from fuzzy_system import get_fuzzy_model, fuzzify, map_cost_rating, rule_activations, score_memberships, top_k_scores
+from snapshot import read_only
+
+STATIC_VARIABLES = ('cost', 'quality', 'user_rating')
+
+# Query-independent hospital attributes as contiguous arrays, row-aligned with the source frame.
+# Values and memberships stay float64: float32 moved scores by up to ~1e-7, outside the
+# SCORE_TOLERANCE the store is held to against compute_recommendation_scores.
+class HospitalStore:
+    def __init__(self, cost, quality, user_rating, lat, lon, model=None, memberships=None):
+        self.model = model or get_fuzzy_model()
+        self.cost = np.ascontiguousarray(cost, dtype=np.int8)
+        self.quality = np.ascontiguousarray(quality, dtype=np.float64)
+        self.user_rating = np.ascontiguousarray(user_rating, dtype=np.float64)
+        self.lat = np.ascontiguousarray(lat, dtype=np.float64)
+        self.lon = np.ascontiguousarray(lon, dtype=np.float64)
+        # memberships: precomputed {name: (labels, degrees)} for STATIC_VARIABLES, e.g. from a snapshot
+        self.memberships = memberships or {}
+        for name, values in zip(STATIC_VARIABLES, (self.cost, self.quality, self.user_rating)):
+            if name in self.memberships:
+                continue
+            degrees = fuzzify(self.model, name, values.astype(np.float64))
+            self.memberships[name] = (list(degrees), np.ascontiguousarray(np.vstack(list(degrees.values())), dtype=np.float64))
+
+    def __len__(self):
+        return self.cost.size
+
+    @property
+    def nbytes(self):
+        arrays = [self.cost, self.quality, self.user_rating, self.lat, self.lon]
+        arrays += [degrees for _, degrees in self.memberships.values()]
+        return sum(array.nbytes for array in arrays)
+
+    def copy(self):
+        # Shares the columns read-only; the copy's first update copies the ones it writes
+        store = copy.copy(self)
+        for name in ('cost', 'quality', 'user_rating', 'lat', 'lon'):
+            setattr(store, name, read_only(getattr(self, name)))
+        store.memberships = {name: (labels, read_only(degrees)) for name, (labels, degrees) in self.memberships.items()}
+        return store
+
+    def _writable(self, names):
+        # Read-only columns (a copy's, or a snapshot's mapped pages) are copied on their first
+        # update, with their static memberships; the others stay shared
+        for name in names:
+            array = getattr(self, name)
+            if not array.flags.writeable:
+                setattr(self, name, array.copy())
+            if name in self.memberships:
+                labels, degrees = self.memberships[name]
+                if not degrees.flags.writeable:
+                    self.memberships[name] = (labels, degrees.copy())
+
+    def _row_memberships(self, name, value):
+        labels, _ = self.memberships[name]
+        degrees = fuzzify(self.model, name, np.array([value], dtype=np.float64))
+        return np.array([degrees[label][0] for label in labels], dtype=np.float64)
+
+    def update_row(self, i, cost=None, quality=None, user_rating=None, lat=None, lon=None):
+        # In place: only the given columns of row i, and their static memberships, change
+        values = dict(zip(('cost', 'quality', 'user_rating', 'lat', 'lon'), (cost, quality, user_rating, lat, lon)))
+        self._writable([name for name, value in values.items() if value is not None])
+        for name, value in values.items():
+            if value is not None:
+                getattr(self, name)[i] = value
+        for name in STATIC_VARIABLES:
+            if values[name] is not None:
+                self.memberships[name][1][:, i] = self._row_memberships(name, getattr(self, name)[i])
+
+    def append_row(self, cost, quality, user_rating, lat, lon):
+        # Every column grows by one, which copies it; an update copies only the columns it
+        # writes, and only once per copy of the store
+        memberships = {}
+        for name, value in zip(STATIC_VARIABLES, (cost, quality, user_rating)):
+            labels, degrees = self.memberships[name]
+            memberships[name] = (labels, np.column_stack([degrees, self._row_memberships(name, value)]))
+        self.memberships = memberships
+        for name, value in zip(('cost', 'quality', 'user_rating', 'lat', 'lon'), (cost, quality, user_rating, lat, lon)):
+            array = getattr(self, name)
+            setattr(self, name, np.append(array, array.dtype.type(value)))
+        return len(self) - 1
+
+    def coordinates(self, idx=None):
+        lat, lon = (self.lat, self.lon) if idx is None else (self.lat[idx], self.lon[idx])
+        return np.column_stack([lat, lon])
+
+    def static_memberships(self, idx=None):
+        memberships = {}
+        for name, (labels, degrees) in self.memberships.items():
+            rows = degrees if idx is None else degrees[:, idx]
+            memberships[name] = {label: rows[i].astype(np.float64) for i, label in enumerate(labels)}
+        return memberships
+
+    def query_memberships(self, service_match, proximity, user_cost_pref, user_quality_pref, idx=None):
+        memberships = self.static_memberships(idx)
+        memberships['service_match'] = fuzzify(self.model, 'service_match', service_match)
+        memberships['proximity'] = fuzzify(self.model, 'proximity', proximity)
+        memberships['user_cost_pref'] = fuzzify(self.model, 'user_cost_pref', user_cost_pref)
+        memberships['user_quality_pref'] = fuzzify(self.model, 'user_quality_pref', user_quality_pref)
+        return memberships
+
+    def score(self, service_match, proximity, user_cost_pref, user_quality_pref, idx=None):
+        size = len(self) if idx is None else len(idx)
+        memberships = self.query_memberships(service_match, proximity, user_cost_pref, user_quality_pref, idx)
+        return score_memberships(self.model, memberships, size)
+
+    def activations(self, service_match, proximity, user_cost_pref, user_quality_pref, idx=None):
+        size = len(self) if idx is None else len(idx)
+        memberships = self.query_memberships(service_match, proximity, user_cost_pref, user_quality_pref, idx)
+        return rule_activations(self.model, memberships, size)
+
+    def top_k(self, activations, k):
+        # (positions, scores) of the k best rows of an activations() result, best first
+        return top_k_scores(self.model, activations, k)
+
+def build_hospital_store(data, model=None):
+    coords = np.array([tuple(c) if c is not None else (np.nan, np.nan) for c in data['Coordinates']],
+                      dtype=np.float64).reshape(-1, 2)
+    return HospitalStore(
+        cost=data['Cost Level'].map(map_cost_rating).to_numpy(),
+        quality=data['Quality Score'].to_numpy(dtype=float),
+        user_rating=data['User Rating'].to_numpy(dtype=float),
+        lat=coords[:, 0],
+        lon=coords[:, 1],
+        model=model
+    )
@@ -0,0 +1,368 @@
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+from data_loader import FIELD_DEFAULTS, REQUIRED_FIELDS
+from fuzzy_system import map_cost_rating
+from geocoder import DEFAULT_COORDS, normalize_address
+from recommender import QueryError
+from snapshot import replace_file
+
+# Admin changes to a loaded dataset: add, update or retire one hospital without a reload.
+# Each change is appended to a JSON-lines change log next to the dataset, which every worker
+# replays on load and tails while running, applying new entries to a copy of its state that
+# then replaces it (see catch_up). The copy shares everything with the state it was made from:
+# changed rows are laid over the base frame (AppState.row_changes), names over the base name
+# map, and only the store, coordinate and index columns a change writes are copied. compact()
+# folds the log back into the base CSV (and snapshot).
+#
+# Log entries carry the resolved coordinates, so replaying never geocodes, and replaying is
+# idempotent: add is an upsert, update and retire set values, so a log replayed over a base
+# it has already been compacted into yields the same state.
+CHANGE_LOG_SUFFIX = '.changes.jsonl'
+COMPACT_AFTER_CHANGES = 1000
+HOSPITAL_FIELDS = ['Name', 'Full Address', 'Services', 'Cost Level', 'Quality Score', 'User Rating']
+VALID_COST_LEVELS = {'Low', 'Medium', 'High', 'Premium'}
+
+def change_log_file(dataset_file):
+    # Shared by a CSV and the snapshot built from it
+    return os.path.splitext(dataset_file)[0] + CHANGE_LOG_SUFFIX
+
+# Append-only JSON-lines file. compact() renames it aside before folding it into the base, so
+# appends that race a compaction land in a fresh log.
+class ChangeLog:
+    def __init__(self, path):
+        self.path = path
+        self.compacting_path = path + '.compacting'
+
+    def size(self):
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def append(self, change):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(change) + '\n')
+
+    def read(self, offset=0, path=None):
+        # Complete entries from offset on, and the offset after the last one
+        path = path or self.path
+        try:
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return [], offset
+        end = data.rfind(b'\n') + 1
+        changes = []
+        for line in data[:end].splitlines():
+            try:
+                changes.append(json.loads(line))
+            except ValueError:
+                print(f"Skipping unreadable change log entry in {path}: {line[:80]!r}")
+        return changes, offset + end
+
+def parse_fields(fields, required=()):
+    # Validated, typed values for the given dataset columns
+    if not isinstance(fields, dict):
+        raise QueryError('Hospital fields must be a JSON object.')
+    unknown = set(fields) - set(HOSPITAL_FIELDS)
+    if unknown:
+        raise QueryError(f"Unknown hospital field(s): {', '.join(sorted(unknown))}. Use {', '.join(HOSPITAL_FIELDS)}.")
+    missing = [name for name in required if fields.get(name) in (None, '')]
+    if missing:
+        raise QueryError(f"Missing hospital field(s): {', '.join(missing)}.")
+    parsed = {}
+    for name, value in fields.items():
+        if name in ('Quality Score', 'User Rating'):
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                raise QueryError(f'{name} must be a number.')
+            if not 0 <= value <= 5:
+                raise QueryError(f'{name} must be between 0 and 5.')
+        elif name == 'Cost Level':
+            value = str(value).strip().capitalize()
+            if value not in VALID_COST_LEVELS:
+                raise QueryError(f"Invalid Cost Level. Use {', '.join(sorted(VALID_COST_LEVELS))}.")
+        else:
+            value = str(value).strip()
+            if not value:
+                raise QueryError(f'{name} must not be empty.')
+        parsed[name] = value
+    return parsed
+
+# Name -> row id of every active hospital: the map of the base dataset, shared by every copy of
+# a state, under the names added, renamed or retired since (None for a name that is gone)
+class HospitalNames:
+    def __init__(self, base):
+        self.base = base
+        self.changes = {}
+
+    def get(self, name, default=None):
+        i = self.changes[name] if name in self.changes else self.base.get(name)
+        return default if i is None else i
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def __getitem__(self, name):
+        i = self.get(name)
+        if i is None:
+            raise KeyError(name)
+        return i
+
+    def __setitem__(self, name, i):
+        self.changes[name] = i
+
+    def __delitem__(self, name):
+        self.changes[name] = None
+
+    def copy(self):
+        names = HospitalNames(self.base)
+        names.changes = dict(self.changes)
+        return names
+
+def hospital_ids(state):
+    # Built on the first change to a state. Names of a snapshot-backed state are read from the
+    # snapshot rather than loading its whole frame.
+    if state.hospital_ids is None:
+        if state._data is None:
+            names = state.snapshot.strings(state.snapshot.arrays['name'])
+        else:
+            names = state._data['Name'].tolist()
+        base = {}
+        for i, name in enumerate(names):
+            if i not in state.retired:
+                base.setdefault(name, i)
+        state.hospital_ids = HospitalNames(base)
+    return state.hospital_ids
+
+def hospital_record(state, i):
+    row = state.rows([i]).iloc[0]
+    record = {name: row[name] for name in HOSPITAL_FIELDS}
+    coords = row['Coordinates']
+    record['Coordinates'] = list(coords) if coords else None
+    return record
+
+def validate_change(state, op, name, fields=None):
+    # The log entry for an admin change, checked against the current state; see locate_change
+    # for its coordinates. Only the fields given are logged: a new hospital's missing values
+    # are filled in when it is applied, as load_hospital_data fills them, not written back.
+    ids = hospital_ids(state)
+    change = {'op': op, 'name': name, 'at': time.time()}
+    if op == 'retire':
+        if name not in ids:
+            raise QueryError(f"No active hospital named '{name}'.", 404)
+        return change
+    if op == 'add':
+        fields = parse_fields({**(fields or {}), 'Name': name}, REQUIRED_FIELDS)
+        if name in ids:
+            raise QueryError(f"A hospital named '{name}' already exists.", 409)
+    elif op == 'update':
+        if name not in ids:
+            raise QueryError(f"No active hospital named '{name}'.", 404)
+        fields = parse_fields(fields or {})
+        if not fields:
+            raise QueryError('No hospital fields to update.')
+        if fields.get('Name', name) != name and fields['Name'] in ids:
+            raise QueryError(f"A hospital named '{fields['Name']}' already exists.", 409)
+    else:
+        raise QueryError(f"Unknown change '{op}'. Use add, update or retire.")
+    change['fields'] = fields
+    return change
+
+def locate_change(state, change):
+    # Geocodes the address of a validated change unless it already has coordinates or leaves
+    # the hospital's address as it is
+    address = change.get('fields', {}).get('Full Address')
+    if address is None or 'coordinates' in change:
+        return change
+    if change['op'] == 'update':
+        old_address = state.rows([hospital_ids(state)[change['name']]])['Full Address'].iloc[0]
+        if normalize_address(address) == normalize_address(old_address):
+            return change
+    coords = state.geocode(address)
+    if coords == DEFAULT_COORDS and state.region is not None:
+        coords = state.region.centroid
+    change['coordinates'] = list(coords)
+    return change
+
+def prepare_change(state, op, name, fields=None):
+    # Validates and geocodes an admin change. Returns the log entry; nothing is applied yet.
+    return locate_change(state, validate_change(state, op, name, fields))
+
+def apply_change(state, change):
+    # Applies one log entry in place, to a state no request can see yet (see catch_up). Rows are
+    # only ever appended, so row ids stay valid across states; a retired hospital is dropped from the service and
+    # spatial indexes, so it never becomes a candidate again or takes a nearest=k slot.
+    ids = hospital_ids(state)
+    op, name = change['op'], change['name']
+    fields = change.get('fields', {})
+    coords = change.get('coordinates')
+    i = ids.get(name)
+    if op == 'retire':
+        if i is None:
+            return None
+        state.service_index.set_services(i, None)
+        state.spatial_index.remove(i)
+        state.retired.add(i)
+        del ids[name]
+    elif op == 'add' and i is None:
+        i = add_row(state, fields, coords)
+        ids[name] = i
+    elif op in ('add', 'update'):
+        if i is None:
+            print(f"Skipping change to unknown hospital '{name}'.")
+            return None
+        update_row(state, i, fields, coords)
+        if fields.get('Name', name) != name:
+            del ids[name]
+            ids[fields['Name']] = i
+    else:
+        print(f"Skipping unknown change '{op}' for '{name}'.")
+        return None
+    state.revision += 1
+    return i
+
+def add_row(state, fields, coords):
+    # The new row exists only in row_changes; the store, coordinate and index columns grow by
+    # one, which copies them
+    lat, lon = coords if coords else (np.nan, np.nan)
+    i = len(state.store)
+    row = {**FIELD_DEFAULTS, **fields}
+    state.row_changes[i] = dict(fields, Coordinates=(lat, lon) if coords else None)
+    state.service_index.append(fields['Services'])
+    state.coordinates = np.vstack([state.coordinates, [[lat, lon]]])
+    state.store.append_row(map_cost_rating(row['Cost Level']), row['Quality Score'], row['User Rating'], lat, lon)
+    state.spatial_index.append(lat, lon)
+    return i
+
+def update_row(state, i, fields, coords):
+    # The changed fields are laid over the row; columns are copied only when this is the
+    # state's first change to them
+    changes = dict(state.row_changes.get(i, {}), **fields)
+    if 'Services' in fields:
+        state.service_index.set_services(i, fields['Services'])
+    lat = lon = None
+    if coords:
+        if not state.coordinates.flags.writeable:
+            state.coordinates = state.coordinates.copy()
+        lat, lon = coords
+        state.spatial_index.move(i, lat, lon)
+        state.coordinates[i] = coords
+        changes['Coordinates'] = (lat, lon)
+    state.row_changes[i] = changes
+    state.store.update_row(
+        i, cost=map_cost_rating(fields['Cost Level']) if 'Cost Level' in fields else None,
+        quality=fields.get('Quality Score'), user_rating=fields.get('User Rating'), lat=lat, lon=lon
+    )
+
+def replay_change_log(state, change_log):
+    # Brings a freshly built state up to date: a log still being compacted first, then the log
+    applied = 0
+    for path in (change_log.compacting_path, change_log.path):
+        changes, offset = change_log.read(0, path)
+        for change in changes:
+            apply_change(state, change)
+        applied += len(changes)
+    state.change_offset = offset
+    state.pending_changes = applied
+    if applied:
+        print(f"Applied {applied} change(s) from {change_log.path}.")
+    return applied
+
+def catch_up(state, change_log):
+    # The state with the entries appended since it last read the log applied: itself when there
+    # are none, else a copy, so requests still reading it never see a change half-applied.
+    # None when the log was compacted underneath it, and the state has to be rebuilt instead.
+    size = change_log.size()
+    if size == state.change_offset:
+        return state
+    if size < state.change_offset:
+        return None
+    changes, offset = change_log.read(state.change_offset)
+    if not changes:
+        return state
+    state = state.copy()
+    state.change_offset = offset
+    for change in changes:
+        apply_change(state, change)
+    state.pending_changes += len(changes)
+    return state
+
+def csv_value(value):
+    return '' if value is None else str(value)
+
+def write_base_dataset(state, path):
+    # Folds the state's changes into the CSV it was loaded from: changed fields are set in their
+    # rows, retired rows dropped and added ones appended. Everything else is written back as
+    # read, including columns the recommender does not use, rows load_hospital_data skips, and
+    # missing values it fills in. Returns the number of hospitals the new CSV loads as, or None
+    # when the CSV is no longer the one the state was loaded from.
+    raw = pd.read_csv(path, dtype=str, keep_default_na=False)
+    # Row id -> CSV row, as load_hospital_data numbers them
+    rows = pd.read_csv(path).dropna(subset=REQUIRED_FIELDS).index
+    if len(rows) != state.base_rows:
+        print(f"Error: {path} has {len(rows)} hospitals where the loaded dataset had {state.base_rows}.")
+        return None
+    for name in HOSPITAL_FIELDS:
+        if name not in raw:
+            raw[name] = ''
+    added = []
+    for i in sorted(state.row_changes):
+        if i in state.retired:
+            continue
+        fields = {name: csv_value(value) for name, value in state.row_changes[i].items() if name in HOSPITAL_FIELDS}
+        if i < len(rows):
+            for name, value in fields.items():
+                raw.at[rows[i], name] = value
+        else:
+            added.append(fields)
+    retired = [rows[i] for i in state.retired if i < len(rows)]
+    raw = raw.drop(index=retired)
+    if added:
+        raw = pd.concat([raw, pd.DataFrame(added, columns=raw.columns).fillna('')], ignore_index=True)
+    replace_file(path, lambda f: raw.to_csv(f, index=False), 'w', encoding='utf-8', newline='')
+    return len(rows) - len(retired) + len(added)
+
+def begin_compaction(state, change_log):
+    # Renames the log aside, so appends from here on land in a fresh log that is replayed on top
+    # of the new base, and returns state with the entries it had not read yet applied. A log
+    # left aside by a compaction that did not finish stays there: state was built from it, and
+    # the newer log replays over the new base without changing it.
+    if os.path.exists(change_log.compacting_path) or not os.path.exists(change_log.path):
+        return state
+    os.replace(change_log.path, change_log.compacting_path)
+    changes, _ = change_log.read(state.change_offset, change_log.compacting_path)
+    if changes:
+        state = state.copy()
+        for change in changes:
+            apply_change(state, change)
+    return state
+
+def compact(state, change_log, dataset_file, cache_file, region=None):
+    # Folds the changes in state, from begin_compaction, into the base dataset, then drops the
+    # log that was set aside. Nothing here touches the live log, so it runs without the lock.
+    from app_state import build_app_state
+    from snapshot import build_snapshot, is_snapshot_file
+
+    csv_file = dataset_file
+    if is_snapshot_file(dataset_file):
+        csv_file = state.source_file or os.path.splitext(dataset_file)[0] + '.csv'
+    rows = write_base_dataset(state, csv_file)
+    if rows is None:
+        return None
+    if is_snapshot_file(dataset_file):
+        # Every address in the log is already in the geocode cache, so this does not geocode
+        base = build_app_state(csv_file, cache_file, region=region)
+        if base is None:
+            return None
+        build_snapshot(base.data, base.coordinates, base.service_index, base.spatial_index, base.store, dataset_file,
+                       source_file=csv_file)
+    if os.path.exists(change_log.compacting_path):
+        os.remove(change_log.compacting_path)
+    print(f"Compacted {state.pending_changes} change(s) into {dataset_file} ({rows} hospitals).")
+    return rows
@@ -0,0 +1,198 @@
+import heapq
+import math
+import numpy as np
+import pandas as pd
+import polyline
+from distance_calculator import EARTH_RADIUS_KM, haversine_km
+from spatial_index import SpatialIndex
+
+NO_ROUTE = (None, None, None, None)
+# Speed used for the straight-line legs between the user/hospital and the nearest road node
+ACCESS_SPEED_KPH = 20.0
+DEFAULT_SPEED_KPH = 30.0
+GRAPH_CELL_DEGREES = 0.01
+ONEWAY_VALUES = {'yes', 'true', '1'}
+
+def build_road_graph(nodes_csv, edges_csv, out_path):
+    # nodes_csv: id, lat, lon. edges_csv: from, to, length_m, speed_kph, name, oneway.
+    # This is the shape of an OSM extract exported as a node/edge list (e.g. by osmnx);
+    # it is compiled into CSR adjacency arrays so the engine loads it without parsing.
+    nodes = pd.read_csv(nodes_csv)
+    edges = pd.read_csv(edges_csv)
+    node_ids = {node_id: i for i, node_id in enumerate(nodes['id'])}
+    for column, default in (('speed_kph', DEFAULT_SPEED_KPH), ('name', ''), ('oneway', False)):
+        if column not in edges:
+            edges[column] = default
+    edges['speed_kph'] = pd.to_numeric(edges['speed_kph'], errors='coerce').fillna(DEFAULT_SPEED_KPH)
+    edges['name'] = edges['name'].fillna('')
+    # OSM style values: only these mean one-way ('no', 'False', '0' and blanks are two-way)
+    oneway = edges['oneway'].fillna('').astype(str).str.strip().str.lower().isin(ONEWAY_VALUES)
+
+    reverse = edges[~oneway].rename(columns={'from': 'to', 'to': 'from'})
+    edges = pd.concat([edges, reverse], ignore_index=True)
+    source = edges['from'].map(node_ids).to_numpy()
+    target = edges['to'].map(node_ids).to_numpy()
+    valid = ~(pd.isna(source) | pd.isna(target))
+    edges, source, target = edges[valid], source[valid].astype(np.int64), target[valid].astype(np.int32)
+
+    order = np.argsort(source, kind='stable')
+    names, name_ids = np.unique(edges['name'].astype(str).to_numpy(), return_inverse=True)
+    length_m = edges['length_m'].to_numpy(dtype=np.float32)[order]
+    np.savez_compressed(
+        out_path,
+        node_lat=nodes['lat'].to_numpy(dtype=np.float64),
+        node_lon=nodes['lon'].to_numpy(dtype=np.float64),
+        indptr=np.concatenate([[0], np.cumsum(np.bincount(source, minlength=len(nodes)))]).astype(np.int64),
+        indices=target[order],
+        length_m=length_m,
+        time_s=(length_m / (edges['speed_kph'].to_numpy(dtype=np.float32)[order] / 3.6)).astype(np.float32),
+        name_id=name_ids[order].astype(np.int32),
+        names=np.asarray(names, dtype=str),
+    )
+    print(f"Road graph with {len(nodes)} nodes and {len(edges)} directed edges saved to {out_path}")
+
+def format_distance(meters):
+    return f"{meters / 1000:.1f} km" if meters >= 1000 else f"{int(round(meters))} m"
+
+def format_duration(seconds):
+    minutes = max(int(round(seconds / 60)), 1)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours} hour{'s' if hours > 1 else ''} {minutes} min{'s' if minutes != 1 else ''}"
+    return f"{minutes} min{'s' if minutes != 1 else ''}"
+
+# In-process shortest-time routing over a road graph compiled by build_road_graph, answered
+# with A* (straight-line distance at the graph's top speed is an admissible heuristic).
+class LocalRoutingEngine:
+    def __init__(self, graph_file):
+        graph = np.load(graph_file, allow_pickle=False)
+        self.node_lat = graph['node_lat']
+        self.node_lon = graph['node_lon']
+        self.names = graph['names'].tolist()
+        # Plain lists: the search loop indexes them one element at a time
+        self.indptr = graph['indptr'].tolist()
+        self.indices = graph['indices'].tolist()
+        self.length_m = graph['length_m'].tolist()
+        self.time_s = graph['time_s'].tolist()
+        self.name_id = graph['name_id'].tolist()
+        self.edge_source = np.repeat(np.arange(len(self.indptr) - 1), np.diff(graph['indptr'])).tolist()
+        self._lat_rad = np.radians(self.node_lat).tolist()
+        self._lon_rad = np.radians(self.node_lon).tolist()
+        # The heuristic needs a speed no edge beats in a straight line, so an edge whose recorded
+        # length is shorter than the distance between its nodes still bounds it
+        source = np.asarray(self.edge_source, dtype=np.int64)
+        span_m = haversine_km(self.node_lat[source], self.node_lon[source],
+                              self.node_lat[graph['indices']], self.node_lon[graph['indices']]) * 1000.0
+        time_s = np.maximum(graph['time_s'].astype(np.float64), 1e-6)
+        max_speed = float((np.maximum(graph['length_m'], span_m) / time_s).max()) if self.time_s else 1.0
+        self.max_speed_mps = max(max_speed, 1.0)
+        self.node_index = SpatialIndex(self.node_lat, self.node_lon, cell_degrees=GRAPH_CELL_DEGREES)
+
+    def nearest_node(self, coords):
+        ids, distances = self.node_index.query_nearest(coords, 1)
+        return (int(ids[0]), float(distances[0]) * 1000.0) if ids.size else (None, None)
+
+    def _heuristic(self, node, target_lat, target_lon, cos_target_lat):
+        lat, lon = self._lat_rad[node], self._lon_rad[node]
+        a = math.sin((target_lat - lat) / 2.0) ** 2 + math.cos(lat) * cos_target_lat * math.sin((target_lon - lon) / 2.0) ** 2
+        return 2.0 * EARTH_RADIUS_KM * 1000.0 * math.asin(math.sqrt(min(a, 1.0))) / self.max_speed_mps
+
+    def shortest_path(self, source, target):
+        target_lat, target_lon = self._lat_rad[target], self._lon_rad[target]
+        cos_target_lat = math.cos(target_lat)
+        best = {source: 0.0}
+        previous = {}
+        settled = set()
+        heap = [(0.0, source)]
+        while heap:
+            _, node = heapq.heappop(heap)
+            if node == target:
+                break
+            if node in settled:
+                continue
+            settled.add(node)
+            cost = best[node]
+            for edge in range(self.indptr[node], self.indptr[node + 1]):
+                neighbour = self.indices[edge]
+                new_cost = cost + self.time_s[edge]
+                if new_cost < best.get(neighbour, float('inf')):
+                    best[neighbour] = new_cost
+                    previous[neighbour] = edge
+                    estimate = self._heuristic(neighbour, target_lat, target_lon, cos_target_lat)
+                    heapq.heappush(heap, (new_cost + estimate, neighbour))
+        if target not in best:
+            return None
+        edges = []
+        node = target
+        while node != source:
+            edge = previous[node]
+            edges.append(edge)
+            node = self.edge_source[edge]
+        return edges[::-1]
+
+    def travel_times(self, user_coords, destinations, departure_time=None):
+        # (duration_s, distance_m) to every destination from a single Dijkstra search that stops
+        # once all of them are settled; None where a destination is unreachable
+        source, source_offset = self.nearest_node(user_coords)
+        targets = [self.nearest_node(coords) for coords in destinations]
+        if source is None:
+            return [None] * len(destinations)
+        remaining = {target for target, _ in targets if target is not None}
+        best = {source: (0.0, 0.0)}
+        settled = set()
+        heap = [(0.0, source)]
+        while heap and remaining:
+            cost, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            settled.add(node)
+            remaining.discard(node)
+            length = best[node][1]
+            for edge in range(self.indptr[node], self.indptr[node + 1]):
+                neighbour = self.indices[edge]
+                new_cost = cost + self.time_s[edge]
+                if new_cost < best.get(neighbour, (float('inf'),))[0]:
+                    best[neighbour] = (new_cost, length + self.length_m[edge])
+                    heapq.heappush(heap, (new_cost, neighbour))
+
+        times = []
+        for target, target_offset in targets:
+            if target is None or target not in settled:
+                times.append(None)
+                continue
+            access_m = source_offset + target_offset
+            duration_s, distance_m = best[target]
+            times.append((access_m / (ACCESS_SPEED_KPH / 3.6) + duration_s, access_m + distance_m))
+        return times
+
+    def route(self, user_coords, hospital_coords, hospital_name, departure_time=None):
+        source, source_offset = self.nearest_node(user_coords)
+        target, target_offset = self.nearest_node(hospital_coords)
+        if source is None or target is None:
+            return NO_ROUTE
+        edges = self.shortest_path(source, target)
+        if edges is None:
+            print(f"No route found to {hospital_name} in the local road graph.")
+            return NO_ROUTE
+
+        access_m = source_offset + target_offset
+        distance_m = access_m + sum(self.length_m[edge] for edge in edges)
+        duration_s = access_m / (ACCESS_SPEED_KPH / 3.6) + sum(self.time_s[edge] for edge in edges)
+        points = [tuple(user_coords), (self.node_lat[source], self.node_lon[source])]
+        points += [(self.node_lat[self.indices[edge]], self.node_lon[self.indices[edge]]) for edge in edges]
+        points.append(tuple(hospital_coords))
+
+        instructions = []
+        street, street_m = None, 0.0
+        for edge in edges:
+            name = self.names[self.name_id[edge]] or 'unnamed road'
+            if name != street and street is not None:
+                instructions.append(f"{'Head' if not instructions else 'Continue'} along <b>{street}</b> for {format_distance(street_m)}")
+                street_m = 0.0
+            street = name
+            street_m += self.length_m[edge]
+        if street is not None:
+            instructions.append(f"{'Head' if not instructions else 'Continue'} along <b>{street}</b> for {format_distance(street_m)}")
+        instructions.append(f"Arrive at <b>{hospital_name}</b>")
+
+        return format_distance(distance_m), format_duration(duration_s), polyline.encode(points), instructions
@@ -1,11 +1,23 @@
-import pandas as pd
-from data_loader import load_hospital_data
-from geocoder import geocode_address, load_geocode_cache, save_geocode_cache
-from distance_calculator import calculate_distance
-from fuzzy_system import setup_fuzzy_system, compute_recommendation_score, map_preference_to_value
-from route_calculator import get_driving_route
+import time
+_import_start = time.perf_counter()
+import argparse
+import os
+import metrics
+from concurrent.futures import ThreadPoolExecutor
+from api_config import LOCAL_ROAD_GRAPH
+from app_state import build_app_state, default_dataset_file
+from bulk_geocoder import BulkGeocoder, RateLimiter, GEOCODE_MAX_WORKERS, GEOCODE_QPS, GEOCODE_SUFFIX
+from data_loader import load_hospital_data, DATASET_FILE
+from geocoder import load_geocode_cache, save_geocode_cache, CACHE_FILE
+from hospital_updates import hospital_record
+from recommender import QueryError, locate_user, parse_query, rank_shards
+from regions import RegionShards, load_region_registry
+from snapshot import SNAPSHOT_SUFFIX
 from visualizer import plot_recommendations, plot_map
 
+import_seconds = time.perf_counter() - _import_start
+metrics.set_gauge('hospital_import_seconds', import_seconds, module='main')
+
 def get_valid_category(prompt, default):
     valid_options = {'low', 'medium', 'high'}
     while True:
@@ -14,94 +26,52 @@ def get_valid_category(prompt, default):
             return value.capitalize()
         print("Invalid input. Please enter Low, Medium, or High (or press Enter for default).")
 
-def main():
-    data = load_hospital_data()
-    if data is None:
+def main(region_name=None):
+    shards = RegionShards()
+    try:
+        region = shards.region(region_name)
+    except QueryError as e:
+        print(e.message)
         return
 
-    print(f"Loaded {len(data)} hospitals from dataset.")
     location = input("Enter your location (e.g., Ikeja, Allen Avenue): ").strip()
     user_service = input("Enter service needed (e.g., General Medicine, Surgery): ").strip()
     cost_pref_str = get_valid_category("Enter cost preference", default="Medium")
     quality_pref_str = get_valid_category("Enter quality preference", default="High")
-    cost_pref = map_preference_to_value(cost_pref_str)
-    quality_pref = map_preference_to_value(quality_pref_str)
-
-    cache_file = 'hospital_coordinates.csv'
-    geocode_cache = load_geocode_cache(cache_file)
-
-    user_coords = None
-    if location:
-        user_coords = geocode_address(location, geocode_cache)
-        if user_coords == (6.5244, 3.3792):
-            print(f"Could not geocode location '{location}'. Using all hospitals without distance filter.")
-        else:
-            print(f"Geocoded location '{location}' to coordinates {user_coords}")
-    else:
-        print("No location provided. Using all hospitals without distance filter.")
-
-    print("Geocoding hospital addresses...")
-    data['Coordinates'] = data['Full Address'].apply(lambda addr: geocode_address(addr, geocode_cache))
-    default_coords_count = (data['Coordinates'] == (6.5244, 3.3792)).sum()
-    if default_coords_count > 0:
-        print(f"Warning: {default_coords_count} hospital(s) using default coordinates. Check addresses in dataset.")
-    valid_coords = data['Coordinates'].notna().sum()
-    print(f"Successfully geocoded {valid_coords} hospital addresses.")
-
-    save_geocode_cache(geocode_cache, cache_file)
-
-    if data.empty:
-        print("No hospitals available after filtering.")
+    try:
+        query = parse_query({
+            'location': location, 'service': user_service,
+            'cost_pref': cost_pref_str, 'quality_pref': quality_pref_str
+        })
+        locator = shards.locator(region)
+        user_coords = locate_user(locator, location)
+        locator.save_geocode_cache()
+        states = shards.states_for(user_coords, query['radius_km'], region)
+    except QueryError as e:
+        print(e.message)
         return
 
-    if user_coords and user_coords != (6.5244, 3.3792):
-        data['Distance_km'] = data['Coordinates'].apply(lambda coords: calculate_distance(user_coords, coords)[1])
-        data = data[data['Distance_km'] <= 10.0]
-        print(f"After 10 km filter, {len(data)} hospitals remain within 10 km of {location}.")
-        if data.empty:
-            print("No hospitals found within 10 km. Try a different location or broader service.")
-            return
-
-    fuzzy_system = setup_fuzzy_system()
-
-    data['Recommendation_Score'] = data.apply(
-        lambda row: compute_recommendation_score(row, user_service, cost_pref, quality_pref, user_coords, fuzzy_system),
-        axis=1
-    )
-
-    recommendations = data[data['Recommendation_Score'] > 0].copy()
-    print(f"Found {len(recommendations)} hospitals with non-zero recommendation scores.")
-
-    if recommendations.empty:
-        print(f"No hospitals found matching service '{user_service}'. Try a different service.")
+    searched = ', '.join(state.region.name for state in states)
+    print(f"Searching {sum(len(state.store) for state in states)} hospitals in {searched}.")
+    recommendations = rank_shards(states, query, user_coords)
+    if isinstance(recommendations, QueryError):
+        print(f"{recommendations.message} Try a different location or service.")
         return
 
-    recommendations = recommendations.sort_values(by='Recommendation_Score', ascending=False).head(3)
-
-    print("Calculating driving routes...")
-    for idx, row in recommendations.iterrows():
-        distance, duration, polyline_points, instructions = get_driving_route(
-            user_coords, row['Coordinates'], row['Name']
-        )
-        recommendations.at[idx, 'Route_Distance'] = distance
-        recommendations.at[idx, 'Route_Duration'] = duration
-        recommendations.at[idx, 'Polyline_Points'] = polyline_points
-        recommendations.at[idx, 'Route_Instructions'] = "; ".join(instructions) if instructions else "N/A"
-        if distance:
-            print(f"Route to {row['Name']}: {distance}, {duration}")
-
-    
+    if 'Distance_km' not in recommendations:
+        recommendations['Distance_km'] = None
     recommendations = recommendations[[
     'Name', 'Full Address', 'Services', 'Cost Level', 'Quality Score',
-    'Recommendation_Score', 'Distance_km', 'Route_Distance', 'Route_Duration', 'Route_Instructions', 'Coordinates']]
+    'Recommendation_Score', 'Distance_km', 'Route_Distance', 'Route_Duration', 'Route_Instructions', 'Coordinates',
+    'Polyline_Points']]
 
     print("\nUser Inputs:")
     print(f"Location: {location or 'None'}")
-    print(f"Service Needed: {user_service}")
+    print(f"Service Needed: {query['service']}")
     print(f"Cost Preference: {cost_pref_str}")
     print(f"Quality Preference: {quality_pref_str}")
-    print("\nTop 3 Recommended Hospitals:")
-    print(recommendations.drop(columns=['Coordinates', 'Route_Instructions']).to_string(index=False))
+    print(f"\nTop {len(recommendations)} Recommended Hospitals:")
+    print(recommendations.drop(columns=['Coordinates', 'Route_Instructions', 'Polyline_Points']).to_string(index=False))
 
     try:
         recommendations.drop(columns=['Coordinates', 'Polyline_Points']).to_csv('recommended_hospitals.csv', index=False)
@@ -109,11 +79,178 @@ def main():
     except Exception as e:
         print(f"Error saving to CSV: {e}")
 
-    plot_recommendations(recommendations)
-    print("\nBar chart saved to hospital_recommendations.png")
+    with metrics.timed('visualize'):
+        plot_recommendations(recommendations)
+        print("\nBar chart saved to hospital_recommendations.png")
 
-    plot_map(user_coords, recommendations)
-    print("\nInteractive map with routes saved to hospital_map.html")
+        plot_map(user_coords, recommendations, (region or shards.registry.default).centroid)
+        print("\nInteractive map with routes saved to hospital_map.html")
+
+def print_timings(timings):
+    print("\nStage timings:")
+    for stage, seconds in sorted(timings.items(), key=lambda item: -item[1]):
+        print(f"  {stage:<20} {seconds * 1000:10.1f} ms")
+
+def warm_cache(dataset_file=DATASET_FILE, cache_file=CACHE_FILE, max_workers=GEOCODE_MAX_WORKERS, qps=GEOCODE_QPS,
+               batch_size=500, region=None):
+    data = load_hospital_data(dataset_file)
+    if data is None:
+        return
+    geocode_cache = load_geocode_cache(cache_file)
+    addresses = list(dict.fromkeys(data['Full Address']))
+    geocode_cache.preload(addresses)
+    pending = [address for address in addresses if address not in geocode_cache]
+    print(f"{len(addresses) - len(pending)} of {len(addresses)} addresses already cached; geocoding {len(pending)}.")
+
+    with ThreadPoolExecutor(max_workers, thread_name_prefix='warm-cache') as executor:
+        geocoder = BulkGeocoder(geocode_cache, executor=executor, rate_limiter=RateLimiter(qps),
+                                suffix=region.geocode_suffix if region else GEOCODE_SUFFIX)
+        for start in range(0, len(pending), batch_size):
+            geocoder.geocode_many(pending[start:start + batch_size])
+            save_geocode_cache(geocode_cache)
+            print(f"Geocoded {min(start + batch_size, len(pending))}/{len(pending)} addresses.")
+
+def build_dataset_snapshot(dataset_file=DATASET_FILE, cache_file=CACHE_FILE, output=None, region=None):
+    # Geocodes anything not yet cached, then writes the dataset, coordinates and indexes as
+    # one snapshot that API workers map instead of parsing the CSV
+    from snapshot import build_snapshot
+    output = output or os.path.splitext(dataset_file)[0] + SNAPSHOT_SUFFIX
+    state = build_app_state(dataset_file, cache_file, region=region)
+    if state is None:
+        return
+    build_snapshot(state.data, state.coordinates, state.service_index, state.spatial_index, state.store, output,
+                   source_file=dataset_file)
+    print(f"Snapshot of {len(state.store)} hospitals written to {output} ({os.path.getsize(output) / 1e6:.1f} MB).")
+
+def build_coverage(dataset_file, cache_file, output=None, region=None, services=None,
+                   cell_degrees=None, workers=None):
+    from coverage_grid import COVERAGE_CELL_DEGREES, build_coverage_grid
+    build_coverage_grid(dataset_file, cache_file, output, region, services,
+                        cell_degrees or COVERAGE_CELL_DEGREES, workers=workers)
+
+def coverage_map(dataset_file, service=None, output='coverage_map.html', grid_file=None):
+    from coverage_grid import CoverageGrid, coverage_file
+    from visualizer import plot_coverage
+    grid_file = grid_file or coverage_file(dataset_file)
+    if not os.path.exists(grid_file):
+        print(f"Error: {grid_file} not found. Build it with `python main.py build-coverage`.")
+        return
+    plot_coverage(CoverageGrid(grid_file), service, output)
+
+def change_hospital(op, name, fields, region_name=None):
+    # The same path as the admin API: applied to a freshly loaded state and appended to the
+    # change log, which running API workers pick up within their reload check interval
+    shards = RegionShards()
+    try:
+        region = shards.region(region_name) or shards.registry.default
+        state, i = shards.manager(region).apply(op, name, fields)
+    except QueryError as e:
+        print(e.message)
+        return
+    if i is None:
+        print(f"Retired '{name}'.")
+    else:
+        print(f"{'Added' if op == 'add' else 'Updated'} hospital {i}: {hospital_record(state, i)}")
+
+def compact_changes(region_name=None):
+    shards = RegionShards()
+    try:
+        region = shards.region(region_name) or shards.registry.default
+    except QueryError as e:
+        print(e.message)
+        return
+    shards.manager(region).compact()
+
+def region_files(args):
+    # --region fills in that region's dataset and cache unless they are given explicitly
+    region = load_region_registry().get(args.region) if args.region else None
+    dataset_file = args.dataset or (region.dataset_file if region else DATASET_FILE)
+    cache_file = getattr(args, 'cache', None) or (region.cache_file if region else CACHE_FILE)
+    return region, dataset_file, cache_file
+
+HOSPITAL_FLAGS = {
+    '--address': 'Full Address', '--services': 'Services', '--cost': 'Cost Level',
+    '--quality': 'Quality Score', '--rating': 'User Rating',
+}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Hospital recommender")
+    parser.add_argument('--timings', action='store_true', help="Print how long each pipeline stage took")
+    parser.add_argument('--region', help="Search only this region of the region registry")
+    # Subcommands take --region after their name too; SUPPRESS keeps their copy from overwriting
+    # a --region given before it
+    subparsers = parser.add_subparsers(dest='command')
+    warm = subparsers.add_parser('warm-cache', help="Pre-geocode every hospital address in a dataset")
+    warm.add_argument('--region', default=argparse.SUPPRESS, help="Take the dataset, cache and geocoding suffix from this region")
+    warm.add_argument('--dataset')
+    warm.add_argument('--cache')
+    warm.add_argument('--workers', type=int, default=GEOCODE_MAX_WORKERS)
+    warm.add_argument('--qps', type=float, default=GEOCODE_QPS)
+    graph = subparsers.add_parser('build-road-graph', help="Compile a node/edge list into a local routing graph")
+    graph.add_argument('nodes_csv')
+    graph.add_argument('edges_csv')
+    graph.add_argument('--output', default=LOCAL_ROAD_GRAPH)
+    hospital = subparsers.add_parser('hospital', help="Add, update or retire one hospital without a full reload")
+    hospital.add_argument('op', choices=['add', 'update', 'retire'])
+    hospital.add_argument('name')
+    hospital.add_argument('--region', default=argparse.SUPPRESS)
+    hospital.add_argument('--new-name', help="Rename the hospital (update only)")
+    for flag, field in HOSPITAL_FLAGS.items():
+        hospital.add_argument(flag, dest=field)
+    compact = subparsers.add_parser('compact-changes', help="Fold the hospital change log into the base dataset")
+    compact.add_argument('--region', default=argparse.SUPPRESS)
+    snap = subparsers.add_parser('build-snapshot', help="Compile the dataset and its coordinates into a mmap snapshot")
+    snap.add_argument('--region', default=argparse.SUPPRESS, help="Take the dataset, cache and geocoding suffix from this region")
+    snap.add_argument('--dataset')
+    snap.add_argument('--cache')
+    snap.add_argument('--output', help="Defaults to the dataset path with a .snap extension")
+    coverage = subparsers.add_parser('build-coverage',
+                                     help="Precompute the top hospitals for popular queries over a grid of the region")
+    coverage.add_argument('--region', default=argparse.SUPPRESS, help="Take the dataset, cache and bounding box from this region")
+    coverage.add_argument('--dataset', help="Defaults to the region's snapshot if built, else its CSV")
+    coverage.add_argument('--cache')
+    coverage.add_argument('--output', help="Defaults to the dataset path with a .coverage extension")
+    coverage.add_argument('--services', nargs='+', help="Defaults to the services hospitals list most often")
+    coverage.add_argument('--cell-degrees', type=float)
+    coverage.add_argument('--workers', type=int, help="Processes to rank with; defaults to one per core")
+    heatmap = subparsers.add_parser('coverage-map', help="Render a coverage grid as a heatmap of underserved areas")
+    heatmap.add_argument('--region', default=argparse.SUPPRESS)
+    heatmap.add_argument('--dataset')
+    heatmap.add_argument('--grid', help="Defaults to the dataset path with a .coverage extension")
+    heatmap.add_argument('--service', help="Defaults to the least covered service in each cell")
+    heatmap.add_argument('--output', default='coverage_map.html')
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    args = parse_args()
+    if args.command in ('warm-cache', 'build-snapshot', 'build-coverage', 'coverage-map'):
+        try:
+            region, dataset_file, cache_file = region_files(args)
+        except QueryError as e:
+            raise SystemExit(e.message)
+        if args.command in ('build-coverage', 'coverage-map') and not args.dataset:
+            dataset_file = default_dataset_file(dataset_file)
+    if args.command == 'warm-cache':
+        warm_cache(dataset_file, cache_file, args.workers, args.qps, region=region)
+    elif args.command == 'build-road-graph':
+        from local_router import build_road_graph
+        build_road_graph(args.nodes_csv, args.edges_csv, args.output)
+    elif args.command == 'hospital':
+        fields = {field: getattr(args, field) for field in HOSPITAL_FLAGS.values() if getattr(args, field) is not None}
+        if args.new_name:
+            fields['Name'] = args.new_name
+        change_hospital(args.op, args.name, fields, args.region)
+    elif args.command == 'compact-changes':
+        compact_changes(args.region)
+    elif args.command == 'build-snapshot':
+        build_dataset_snapshot(dataset_file, cache_file, args.output, region)
+    elif args.command == 'build-coverage':
+        build_coverage(dataset_file, cache_file, args.output, region, args.services, args.cell_degrees, args.workers)
+    elif args.command == 'coverage-map':
+        coverage_map(dataset_file, args.service, args.output, args.grid)
+    else:
+        with metrics.request_timings(args.timings) as timings:
+            main(args.region)
+        if timings:
+            timings['import'] = import_seconds
+            print_timings(timings)
\ No newline at end of file
@@ -0,0 +1,143 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+import api_config
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRIC_DEFINITIONS = {
+    'hospital_stage_duration_seconds': ('histogram', 'Time spent in each pipeline stage.'),
+    'hospital_http_requests_total': ('counter', 'HTTP requests served, by endpoint and status.'),
+    'hospital_http_request_duration_seconds': ('histogram', 'HTTP request latency, by endpoint.'),
+    'hospital_geocode_cache_hits_total': ('counter', 'Geocode lookups answered from the cache.'),
+    'hospital_geocode_cache_misses_total': ('counter', 'Geocode lookups that needed the Geocoding API.'),
+    'hospital_google_api_calls_total': ('counter', 'Google Maps API calls, by API.'),
+    'hospital_google_api_duration_seconds': ('histogram', 'Google Maps API call latency, by API.'),
+    'hospital_scored_hospitals_total': ('counter', 'Hospitals run through fuzzy rule evaluation.'),
+    'hospital_coverage_grid_hits_total': ('counter', 'Queries answered from a precomputed coverage grid.'),
+    'hospital_import_seconds': ('gauge', 'Time to import an entry point and its dependencies, by module.'),
+    'hospital_fuzzy_model_load_seconds': ('gauge', 'Time to obtain the compiled fuzzy model, by source.'),
+    'hospital_region_shards_loaded': ('gauge', 'Region shards currently loaded.'),
+    'hospital_region_memory_bytes': ('gauge', 'Estimated memory held by loaded region shards.'),
+}
+
+# Set METRICS_ENABLED = False in api_config to turn every call below into a no-op
+enabled = api_config.METRICS_ENABLED
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_histograms = {}
+_local = threading.local()
+
+def increment(name, value=1, **labels):
+    if not enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def set_gauge(name, value, **labels):
+    if not enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _gauges[key] = value
+
+def observe(name, seconds, **labels):
+    if not enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    bucket = bisect_left(LATENCY_BUCKETS, seconds)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [[0] * len(LATENCY_BUCKETS), 0.0, 0]
+        if bucket < len(LATENCY_BUCKETS):
+            histogram[0][bucket] += 1
+        histogram[1] += seconds
+        histogram[2] += 1
+
+@contextmanager
+def timed(stage):
+    # Records the stage duration in the histogram and, inside request_timings(), in the
+    # current thread's per-request breakdown
+    timings = getattr(_local, 'timings', None)
+    if not enabled and timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        observe('hospital_stage_duration_seconds', elapsed, stage=stage)
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+
+@contextmanager
+def google_call(api):
+    if not enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        increment('hospital_google_api_calls_total', api=api)
+        observe('hospital_google_api_duration_seconds', time.perf_counter() - start, api=api)
+
+@contextmanager
+def request_timings(active=True):
+    # Yields a dict of stage -> seconds filled in by timed() on this thread, or None
+    if not active:
+        yield None
+        return
+    previous = getattr(_local, 'timings', None)
+    _local.timings = timings = {}
+    start = time.perf_counter()
+    try:
+        yield timings
+    finally:
+        timings['total'] = time.perf_counter() - start
+        _local.timings = previous
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+def render(extra=None):
+    # Prometheus text exposition format; extra maps name -> (type, help, value) for values
+    # owned elsewhere, such as the cache counters
+    with _lock:
+        values = {**_counters, **_gauges}
+        histograms = {key: (list(buckets), total, count) for key, (buckets, total, count) in _histograms.items()}
+
+    lines = []
+    for name, (kind, help_text) in METRIC_DEFINITIONS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind != 'histogram':
+            for (metric, labels), value in sorted(values.items()):
+                if metric == name:
+                    lines.append(f'{name}{_format_labels(labels)} {value}')
+            continue
+        for (metric, labels), (buckets, total, count) in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, bucket_count in zip(LATENCY_BUCKETS, buckets):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", f"{bound:g}"),))} {cumulative}')
+            lines.append(f'{name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {count}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {total}')
+            lines.append(f'{name}_count{_format_labels(labels)} {count}')
+    for name, (kind, help_text, value) in (extra or {}).items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
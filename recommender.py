@@ -0,0 +1,371 @@
+import numpy as np
+import pandas as pd
+import api_config
+import metrics
+from distance_calculator import calculate_distances
+from fuzzy_system import map_preference_to_value
+from geocoder import DEFAULT_COORDS
+from route_calculator import get_driving_routes_for, get_travel_times
+
+DEFAULT_RADIUS_KM = 10.0
+TOP_K = 3
+MAX_TOP_K = 50
+MAX_BATCH_QUERIES = 1000
+# Drive-time proximity: exp(-minutes / scale), about the straight-line exp(-km / 2) at city speed
+DRIVE_PROXIMITY_MINUTES = 6.0
+VALID_CATEGORIES = {'Low', 'Medium', 'High'}
+RESPONSE_COLUMNS = [
+    'Name', 'Full Address', 'Services', 'Cost Level', 'Quality Score',
+    'User Rating', 'Recommendation_Score', 'Route_Distance', 'Route_Duration', 'Route_Instructions'
+]
+
+class QueryError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+def parse_query(params):
+    # params is request.args or one JSON query object from a batch
+    location = str(params.get('location') or '').strip()
+    service = str(params.get('service') or '').strip()
+    cost_pref_str = str(params.get('cost_pref') or 'Medium').strip().capitalize()
+    quality_pref_str = str(params.get('quality_pref') or 'High').strip().capitalize()
+    radius_km = params.get('radius_km')
+    nearest = params.get('nearest')
+    k = params.get('k')
+    region = str(params.get('region') or '').strip().lower() or None
+    rerank = params.get('rerank')
+    if rerank in (None, ''):
+        rerank = getattr(api_config, 'RERANK_BY_DRIVE_TIME', False)
+    else:
+        rerank = str(rerank).lower() in ('1', 'true', 'yes')
+
+    if not service:
+        raise QueryError('Service parameter is required.')
+    if cost_pref_str not in VALID_CATEGORIES:
+        raise QueryError('Invalid cost preference. Use Low, Medium, or High.')
+    if quality_pref_str not in VALID_CATEGORIES:
+        raise QueryError('Invalid quality preference. Use Low, Medium, or High.')
+    try:
+        radius_km = float(radius_km) if radius_km not in (None, '') else DEFAULT_RADIUS_KM
+        nearest = int(nearest) if nearest not in (None, '') else None
+        k = int(k) if k not in (None, '') else TOP_K
+    except (TypeError, ValueError):
+        raise QueryError('radius_km must be a number and nearest and k integers.')
+    if radius_km <= 0 or (nearest is not None and nearest <= 0):
+        raise QueryError('radius_km and nearest must be positive.')
+    if not 1 <= k <= MAX_TOP_K:
+        raise QueryError(f'k must be between 1 and {MAX_TOP_K}.')
+
+    return {
+        'location': location,
+        'service': service,
+        'cost_pref_str': cost_pref_str,
+        'quality_pref_str': quality_pref_str,
+        'cost_pref': map_preference_to_value(cost_pref_str),
+        'quality_pref': map_preference_to_value(quality_pref_str),
+        'radius_km': radius_km,
+        'nearest': nearest,
+        'k': k,
+        'region': region,
+        'rerank': rerank,
+    }
+
+def has_location_filter(user_coords):
+    return bool(user_coords) and user_coords != DEFAULT_COORDS
+
+def report_user_location(location, user_coords):
+    if not location:
+        print("No location provided. Using all hospitals without distance filter.")
+    elif user_coords == DEFAULT_COORDS:
+        print(f"Could not geocode location '{location}'. Using all hospitals without distance filter.")
+    else:
+        print(f"Geocoded location '{location}' to coordinates {user_coords}")
+
+def locate_user(locator, location):
+    # locator: an AppState or a regions.Locator
+    with metrics.timed('geocode_user'):
+        user_coords = locator.geocode(location) if location else None
+    report_user_location(location, user_coords)
+    return user_coords
+
+def find_candidates(state, query, user_coords):
+    # Hospitals inside the query radius that offer the service, with their service match,
+    # proximity and distance to the user
+    if len(state.store) == 0:
+        raise QueryError('No hospitals available after filtering.', 404)
+
+    candidates = np.arange(len(state.store))
+    if has_location_filter(user_coords):
+        with metrics.timed('spatial_filter'):
+            if query['nearest']:
+                candidates, _ = state.spatial_index.query_nearest(
+                    user_coords, query['nearest'], max_distance_km=query['radius_km'])
+            else:
+                candidates, _ = state.spatial_index.query_radius(user_coords, query['radius_km'])
+        if candidates.size == 0:
+            raise QueryError(f"No hospitals found within {query['radius_km']:g} km of the provided location.", 404)
+        candidates = np.sort(candidates)
+
+    # Service match from the inverted index; hospitals that do not offer the service are skipped
+    with metrics.timed('service_filter'):
+        service_match = state.service_index.service_match(query['service'], idx=candidates)
+        offered = service_match > 0
+        candidates, service_match = candidates[offered], service_match[offered]
+    if candidates.size == 0:
+        raise QueryError(f"No hospitals found matching service '{query['service']}'.", 404)
+
+    with metrics.timed('distance'):
+        proximity, distances = calculate_distances(user_coords, state.coordinates[candidates])
+    return candidates, service_match, proximity, distances
+
+def reranks(query, user_coords):
+    # Drive times need a known origin
+    return bool(query.get('rerank')) and has_location_filter(user_coords)
+
+def rerank_depth(query, user_coords):
+    # How many fuzzy matches a query keeps: its k, or the drive-time re-ranking pool
+    if reranks(query, user_coords):
+        return max(query['k'], getattr(api_config, 'RERANK_CANDIDATES', 20))
+    return query['k']
+
+def coverage_lookup(state, query, user_coords):
+    # (row ids, scores) from the state's precomputed coverage grid, or None to score live. The
+    # grid covers the dataset as loaded, so it is skipped once admin changes have been applied.
+    # Its ranking is from the user's cell centre; one that lists a hospital outside the radius
+    # of the user is not used.
+    grid = state.coverage
+    if grid is None or state.revision or not has_location_filter(user_coords):
+        return None
+    found = grid.lookup(query, user_coords)
+    if found is None or state.spatial_index.within(user_coords, found[0], query['radius_km']).size < found[0].size:
+        return None
+    metrics.increment('hospital_coverage_grid_hits_total')
+    return found
+
+def score_candidates(state, queries, candidate_sets, depths=None):
+    # Rule activations for every (query, candidate) pair in one vectorized pass; only each
+    # query's top-k (or depths[i] best), found by upper-bound pruning, is defuzzified exactly.
+    # Returns (positions into the candidates, scores) per query, best first.
+    sizes = [candidates.size for candidates, _, _, _ in candidate_sets]
+    if not sizes:
+        return []
+    metrics.increment('hospital_scored_hospitals_total', sum(sizes))
+    idx = np.concatenate([candidates for candidates, _, _, _ in candidate_sets])
+    with metrics.timed('scoring'):
+        activations = state.store.activations(
+            np.concatenate([service_match for _, service_match, _, _ in candidate_sets]),
+            np.concatenate([proximity for _, _, proximity, _ in candidate_sets]),
+            np.repeat([query['cost_pref'] for query in queries], sizes),
+            np.repeat([query['quality_pref'] for query in queries], sizes),
+            idx=idx
+        )
+    bounds = np.cumsum([0] + sizes)
+    depths = depths or [query['k'] for query in queries]
+    with metrics.timed('ranking'):
+        return [
+            state.store.top_k({label: values[start:end] for label, values in activations.items()}, depth)
+            for depth, start, end in zip(depths, bounds[:-1], bounds[1:])
+        ]
+
+def rerank_by_drive_time(state, query, user_coords, candidate_set, positions, scores):
+    # Re-scores the fuzzy top-N with proximity from real drive times, fetched in one batched
+    # travel-time call, and keeps the best k. Hospitals without a drive time keep their
+    # straight-line proximity; only the final k go on to detailed routing.
+    candidates, service_match, proximity, _ = candidate_set
+    if positions.size <= 1:
+        return positions[:query['k']], scores[:query['k']]
+    idx = candidates[positions]
+    with metrics.timed('travel_times'):
+        times = get_travel_times(user_coords, [tuple(coords) for coords in state.coordinates[idx]])
+    drive_s = np.array([np.nan if time is None else time[0] for time in times], dtype=np.float64)
+    known = np.isfinite(drive_s)
+    if not known.any():
+        return positions[:query['k']], scores[:query['k']]
+    drive_proximity = proximity[positions].copy()
+    drive_proximity[known] = np.exp(-(drive_s[known] / 60.0) / DRIVE_PROXIMITY_MINUTES)
+    size = positions.size
+    with metrics.timed('scoring'):
+        drive_scores = state.store.score(
+            service_match[positions], drive_proximity,
+            np.full(size, query['cost_pref']), np.full(size, query['quality_pref']), idx=idx
+        )
+    # Every candidate already scored above zero, so a zero drive score only ranks it last; if
+    # none scores above zero the drive times say nothing and the fuzzy ranking stands
+    if not (drive_scores > 0).any():
+        return positions[:query['k']], scores[:query['k']]
+    # Stable, so equal scores keep the fuzzy order
+    order = np.argsort(-drive_scores, kind='stable')[:query['k']]
+    return positions[order], drive_scores[order]
+
+def top_recommendations(state, query, user_coords, candidates, distances, positions, scores):
+    # top_k only returns hospitals with non-zero scores
+    if positions.size == 0:
+        raise QueryError(f"No hospitals found matching service '{query['service']}'.", 404)
+    recommendations = state.rows(candidates[positions])
+    if has_location_filter(user_coords):
+        recommendations['Distance_km'] = distances[positions]
+    recommendations['Recommendation_Score'] = scores
+    return recommendations
+
+def add_routes(recommendation_sets, origins):
+    # Identical (origin, hospital) pairs across the batch share one route lookup
+    print("Calculating driving routes...")
+    pairs = {}
+    for recommendations, user_coords in zip(recommendation_sets, origins):
+        for coords, name in zip(recommendations['Coordinates'], recommendations['Name']):
+            pairs.setdefault((user_coords, coords), name)
+    with metrics.timed('routing'):
+        routes = dict(zip(pairs, get_driving_routes_for([(u, h, name) for (u, h), name in pairs.items()])))
+
+    for recommendations, user_coords in zip(recommendation_sets, origins):
+        for idx, row in recommendations.iterrows():
+            distance, duration, polyline_points, instructions = routes[(user_coords, row['Coordinates'])]
+            recommendations.at[idx, 'Route_Distance'] = distance
+            recommendations.at[idx, 'Route_Duration'] = duration
+            recommendations.at[idx, 'Polyline_Points'] = polyline_points
+            recommendations.at[idx, 'Route_Instructions'] = "; ".join(instructions) if instructions else "N/A"
+            if distance:
+                print(f"Route to {row['Name']}: {distance}, {duration}")
+
+def format_response(query, recommendations):
+    return {
+        'user_inputs': {
+            'location': query['location'] or 'None',
+            'service': query['service'],
+            'cost_preference': query['cost_pref_str'],
+            'quality_preference': query['quality_pref_str']
+        },
+        'recommendations': recommendations[RESPONSE_COLUMNS].to_dict(orient='records')
+    }
+
+def rank(state, queries, origins, with_routes=True):
+    # Returns one recommendations DataFrame or QueryError per query, in order
+    results = [None] * len(queries)
+    pending = []
+    candidate_sets = []
+    for i, (query, user_coords) in enumerate(zip(queries, origins)):
+        found = coverage_lookup(state, query, user_coords)
+        if found is not None:
+            ids, scores = found
+            _, distances = calculate_distances(user_coords, state.coordinates[ids])
+            results[i] = top_recommendations(state, query, user_coords, ids, distances, np.arange(ids.size), scores)
+            continue
+        try:
+            candidate_sets.append(find_candidates(state, query, user_coords))
+            pending.append(i)
+        except QueryError as e:
+            results[i] = e
+
+    depths = [rerank_depth(queries[i], origins[i]) for i in pending]
+    scored = score_candidates(state, [queries[i] for i in pending], candidate_sets, depths)
+    for i, candidate_set, (positions, scores) in zip(pending, candidate_sets, scored):
+        candidates, _, _, distances = candidate_set
+        if reranks(queries[i], origins[i]):
+            positions, scores = rerank_by_drive_time(state, queries[i], origins[i], candidate_set, positions, scores)
+        try:
+            results[i] = top_recommendations(state, queries[i], origins[i], candidates, distances, positions, scores)
+        except QueryError as e:
+            results[i] = e
+
+    if with_routes:
+        ranked = [i for i, result in enumerate(results) if not isinstance(result, QueryError)]
+        add_routes([results[i] for i in ranked], [origins[i] for i in ranked])
+    return results
+
+def rank_shards(states, query, user_coords, with_routes=True):
+    # One query over several region shards: each shard's top-k, merged by score. Equal scores
+    # keep registry order across shards, as they keep dataset order within one.
+    if len(states) == 1:
+        return rank(states[0], [query], [user_coords], with_routes)[0]
+    results = [rank(state, [query], [user_coords], with_routes=False)[0] for state in states]
+    ranked = [result for result in results if not isinstance(result, QueryError)]
+    if not ranked:
+        return results[0]
+    merged = pd.concat(ranked, ignore_index=True)
+    merged = merged.sort_values('Recommendation_Score', ascending=False, kind='stable').head(query['k'])
+    if with_routes:
+        add_routes([merged], [user_coords])
+    return merged
+
+def ranked_recommendations(states, query, user_coords, cache=None):
+    # states: the region shards that cover the query, from RegionShards.states_for. The
+    # DataFrame may be shared through the cache, so callers must not modify it.
+    if cache is None:
+        result = rank_shards(states, query, user_coords)
+    else:
+        result = cache.get_or_compute(states, cache.key(states, query, user_coords),
+                                      lambda: rank_shards(states, query, user_coords))
+    if isinstance(result, QueryError):
+        raise result
+    return result
+
+def recommend(states, query, user_coords, cache=None):
+    return format_response(query, ranked_recommendations(states, query, user_coords, cache))
+
+def recommend_batch(shards, raw_queries):
+    # Each entry is either a response like recommend()'s or {'error': ..., 'status': ...}
+    queries = []
+    for raw_query in raw_queries:
+        try:
+            if not isinstance(raw_query, dict):
+                raise QueryError('Each query must be a JSON object.')
+            queries.append(parse_query(raw_query))
+        except QueryError as e:
+            queries.append(e)
+
+    regions = {}
+    for i, query in enumerate(queries):
+        if not isinstance(query, QueryError):
+            try:
+                regions[i] = shards.region(query['region'])
+            except QueryError as e:
+                queries[i] = e
+
+    # Each distinct location is geocoded once per region it is asked about
+    origins = {}
+    for region_name in dict.fromkeys(queries[i]['region'] for i in regions):
+        members = [i for i in regions if queries[i]['region'] == region_name]
+        try:
+            locator = shards.locator(regions[members[0]])
+        except QueryError as e:
+            for i in members:
+                queries[i] = e
+                del regions[i]
+            continue
+        locations = list(dict.fromkeys(queries[i]['location'] for i in members if queries[i]['location']))
+        located = dict(zip(locations, locator.geocoder.geocode_many(locations)))
+        locator.save_geocode_cache()
+        for location, user_coords in located.items():
+            report_user_location(location, user_coords)
+        for i in members:
+            origins[i] = located.get(queries[i]['location'])
+
+    # Queries that search the same shards are ranked together
+    results = {}
+    groups = {}
+    for i in regions:
+        try:
+            states = shards.states_for(origins[i], queries[i]['radius_km'], regions[i])
+        except QueryError as e:
+            results[i] = e
+            continue
+        groups.setdefault(tuple(map(id, states)), (states, []))[1].append(i)
+    for states, members in groups.values():
+        if len(states) == 1:
+            ranked = rank(states[0], [queries[i] for i in members], [origins[i] for i in members])
+        else:
+            ranked = [rank_shards(states, queries[i], origins[i]) for i in members]
+        results.update(zip(members, ranked))
+
+    responses = [None] * len(queries)
+    for i, query in enumerate(queries):
+        if isinstance(query, QueryError):
+            responses[i] = {'error': query.message, 'status': query.status}
+    for i, result in results.items():
+        if isinstance(result, QueryError):
+            responses[i] = {'error': result.message, 'status': result.status}
+        else:
+            responses[i] = format_response(queries[i], result)
+    return responses
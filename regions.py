@@ -0,0 +1,212 @@
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+import metrics
+from app_state import StateManager, default_dataset_file
+from bulk_geocoder import BulkGeocoder, GEOCODE_SUFFIX
+from data_loader import DATASET_FILE
+from geocoder import load_geocode_cache, save_geocode_cache, CACHE_FILE, DEFAULT_COORDS
+from recommender import QueryError, has_location_filter
+from spatial_index import KM_PER_DEGREE
+
+# Region registry, e.g.
+# {"country_suffix": ", Nigeria", "default_region": "lagos", "regions": [
+#   {"name": "lagos", "bbox": [[6.35, 2.70], [6.75, 4.40]], "centroid": [6.5244, 3.3792],
+#    "geocode_suffix": ", Lagos, Nigeria", "dataset": "datasets/Lagos_hospital.csv",
+#    "cache": "hospital_coordinates.db"}, ...]}
+# Without it the app serves the single Lagos dataset, as before.
+REGIONS_FILE = 'datasets/regions.json'
+COUNTRY_SUFFIX = ', Nigeria'
+# User locations geocoded country-wide, i.e. not inside a named region
+LOCATION_CACHE_FILE = 'user_locations.db'
+REGION_MEMORY_BUDGET_MB = 1024
+
+class Region:
+    def __init__(self, name, bbox, centroid, geocode_suffix, dataset_file, cache_file):
+        self.name = name
+        # ((south, west), (north, east)), or None to cover everywhere
+        self.bbox = bbox
+        self.centroid = centroid
+        self.geocode_suffix = geocode_suffix
+        self.dataset_file = dataset_file
+        self.cache_file = cache_file
+
+    def covers(self, coords, radius_km=0.0):
+        # True when coords lie in the bounding box grown by radius_km on every side
+        if self.bbox is None:
+            return True
+        (south, west), (north, east) = self.bbox
+        lat, lon = coords
+        dlat = radius_km / KM_PER_DEGREE
+        dlon = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+        return south - dlat <= lat <= north + dlat and west - dlon <= lon <= east + dlon
+
+LAGOS = Region('lagos', ((6.35, 2.70), (6.75, 4.40)), DEFAULT_COORDS, GEOCODE_SUFFIX, DATASET_FILE, CACHE_FILE)
+
+class RegionRegistry:
+    def __init__(self, regions, default_region=None, country_suffix=COUNTRY_SUFFIX):
+        self.regions = OrderedDict((region.name, region) for region in regions)
+        self.default = self.regions[default_region] if default_region else next(iter(self.regions.values()))
+        self.country_suffix = country_suffix
+
+    def __len__(self):
+        return len(self.regions)
+
+    def get(self, name):
+        region = self.regions.get(name.lower())
+        if region is None:
+            raise QueryError(f"Unknown region '{name}'. Use one of: {', '.join(self.regions)}.")
+        return region
+
+    def covering(self, coords, radius_km=0.0):
+        return [region for region in self.regions.values() if region.covers(coords, radius_km)]
+
+def parse_region(entry, country_suffix):
+    name = entry['name'].lower()
+    bbox = entry.get('bbox')
+    bbox = None if bbox is None else (tuple(bbox[0]), tuple(bbox[1]))
+    centroid = entry.get('centroid')
+    if centroid is None:
+        centroid = ((bbox[0][0] + bbox[1][0]) / 2, (bbox[0][1] + bbox[1][1]) / 2) if bbox else DEFAULT_COORDS
+    return Region(
+        name, bbox, tuple(centroid),
+        entry.get('geocode_suffix', f", {entry['name']}{country_suffix}"),
+        entry['dataset'],
+        entry.get('cache', f'hospital_coordinates_{name}.db'),
+    )
+
+def load_region_registry(path=REGIONS_FILE):
+    if not os.path.exists(path):
+        return RegionRegistry([LAGOS])
+    try:
+        with open(path) as f:
+            config = json.load(f)
+        country_suffix = config.get('country_suffix', COUNTRY_SUFFIX)
+        regions = [parse_region(entry, country_suffix) for entry in config['regions']]
+        default_region = config.get('default_region')
+        return RegionRegistry(regions, default_region.lower() if default_region else None, country_suffix)
+    except (OSError, ValueError, KeyError, IndexError, TypeError) as e:
+        print(f"Error reading region registry {path}: {e}. Serving Lagos only.")
+        return RegionRegistry([LAGOS])
+
+# Geocodes user locations and saves what it learns: through a region shard's own geocoder
+# (its suffix and cache) or, for queries not tied to one region, country-wide.
+class Locator:
+    def __init__(self, geocoder, save):
+        self.geocoder = geocoder
+        self._save = save
+
+    def geocode(self, address):
+        return self.geocoder.geocode(address)
+
+    def save_geocode_cache(self):
+        return self._save()
+
+# One StateManager per region, created on first use. A request only touches the shards whose
+# region covers it, so its work scales with the local dataset rather than the national one.
+# When the loaded shards outgrow the memory budget the least recently used are dropped;
+# requests already holding one of their states finish with it.
+class RegionShards:
+    def __init__(self, registry=None, memory_budget_mb=REGION_MEMORY_BUDGET_MB, client=None,
+                 location_cache_file=LOCATION_CACHE_FILE):
+        self.registry = registry or load_region_registry()
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.client = client
+        self.location_cache_file = location_cache_file
+        self.evictions = 0
+        self._managers = OrderedDict()
+        self._sizes = {}
+        self._locator = None
+        self._lock = threading.Lock()
+
+    def region(self, name):
+        # The region a query names, or None to route it by location
+        return self.registry.get(name) if name else None
+
+    def manager(self, region):
+        with self._lock:
+            manager = self._managers.get(region.name)
+            if manager is None:
+                manager = self._managers[region.name] = StateManager(
+                    default_dataset_file(region.dataset_file), region.cache_file, client=self.client, region=region)
+            self._managers.move_to_end(region.name)
+        return manager
+
+    def states(self, regions):
+        states = [self.manager(region).get() for region in regions]
+        self._evict({region.name for region in regions})
+        return states
+
+    def _size(self, name, state):
+        # Measured once per loaded state; measuring a CSV frame is too slow to repeat per request
+        cached = self._sizes.get(name)
+        if cached is None or cached[0] is not state:
+            cached = self._sizes[name] = (state, state.memory_bytes)
+        return cached[1]
+
+    def _evict(self, keep):
+        with self._lock:
+            loaded = [(name, self._size(name, manager.loaded)) for name, manager in self._managers.items()
+                      if manager.loaded is not None]
+            total = sum(size for _, size in loaded)
+            count = len(loaded)
+            for name, size in loaded:
+                if total <= self.memory_budget:
+                    break
+                if name in keep:
+                    continue
+                del self._managers[name]
+                del self._sizes[name]
+                total -= size
+                count -= 1
+                self.evictions += 1
+                print(f"Unloaded region '{name}' ({size / 1e6:.1f} MB) to stay within the memory budget.")
+            metrics.set_gauge('hospital_region_shards_loaded', count)
+            metrics.set_gauge('hospital_region_memory_bytes', total)
+
+    def states_for(self, user_coords, radius_km, region=None):
+        # The shards a query has to search: the region it names, else every region whose box
+        # (grown by the search radius) holds the user, else the default region when the query
+        # has no usable location
+        if region is not None:
+            regions = [region]
+        elif has_location_filter(user_coords):
+            regions = self.registry.covering(user_coords, radius_km)
+        else:
+            regions = [self.registry.default]
+        if not regions:
+            raise QueryError(f"No hospitals found within {radius_km:g} km of the provided location.", 404)
+        states = self.states(regions)
+        if any(state is None for state in states):
+            raise QueryError('Failed to load hospital data.', 500)
+        return states
+
+    def locator(self, region=None):
+        # With a single region every location is geocoded as part of it, as before regions existed
+        if region is None and len(self.registry) == 1:
+            region = self.registry.default
+        if region is not None:
+            manager = self.manager(region)
+            state = self.states([region])[0]
+            if state is None:
+                raise QueryError('Failed to load hospital data.', 500)
+            return Locator(state.geocoder, lambda: manager.save_geocode_cache(state))
+        with self._lock:
+            if self._locator is None:
+                cache = load_geocode_cache(self.location_cache_file)
+                geocoder = BulkGeocoder(cache, client=self.client, suffix=self.registry.country_suffix)
+                self._locator = Locator(geocoder, lambda: save_geocode_cache(cache) > 0)
+            return self._locator
+
+    def stats(self):
+        with self._lock:
+            loaded = {name: manager.loaded for name, manager in self._managers.items() if manager.loaded is not None}
+            return {
+                'regions': list(self.registry.regions),
+                'loaded': {name: {'hospitals': len(state.store), 'memory_bytes': self._size(name, state)}
+                           for name, state in loaded.items()},
+                'memory_budget_bytes': self.memory_budget,
+                'evictions': self.evictions,
+            }
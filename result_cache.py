@@ -0,0 +1,91 @@
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future
+
+RESULT_CACHE_SIZE = 5000
+RESULT_CACHE_TTL = 300.0
+
+# Thread-safe LRU/TTL cache of ranked results (recommendations DataFrame or QueryError) for
+# one query. The key holds the user's coordinates as geocoded from the location text, so
+# everyone asking from the same place shares a result, ranked from exactly where they are, as
+# an uncached query would be. Identical concurrent misses wait on a single computation. Each
+# entry remembers the region shard states it was ranked against and is only served while they
+# are still the current ones, so a reload or an evicted and reloaded shard invalidates it;
+# admin changes bump a state's revision, which is part of the key.
+def same_states(refs, states):
+    # refs are weak, so entries never keep an evicted or replaced shard in memory
+    return len(refs) == len(states) and all(ref() is state for ref, state in zip(refs, states))
+
+class ResultCache:
+    def __init__(self, max_size=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def key(self, states, query, user_coords):
+        return (
+            states[0].store.model['fingerprint'], tuple(state.revision for state in states),
+            tuple(user_coords) if user_coords is not None else None, query['region'],
+            query['rerank'], query['service'].lower().strip(),
+            query['cost_pref_str'], query['quality_pref_str'], query['radius_km'], query['nearest'], query['k']
+        )
+
+    def get_or_compute(self, states, key, compute):
+        refs = tuple(weakref.ref(state) for state in states)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] >= time.monotonic() and same_states(entry[2], states):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            inflight = self._inflight.get(key)
+            owner = inflight is None or not same_states(inflight[1], states)
+            if owner:
+                future = Future()
+                self._inflight[key] = (future, refs)
+                self.misses += 1
+            else:
+                future = inflight[0]
+                self.coalesced += 1
+        if not owner:
+            return future.result()
+
+        try:
+            value = compute()
+        except BaseException as e:
+            self._finish(key, future)
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value, refs)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        self._finish(key, future)
+        future.set_result(value)
+        return value
+
+    def _finish(self, key, future):
+        with self._lock:
+            inflight = self._inflight.get(key)
+            if inflight is not None and inflight[0] is future:
+                del self._inflight[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses, 'coalesced': self.coalesced}
+
+result_cache = ResultCache()
@@ -1,31 +1,232 @@
-from api_config import gmaps
-import polyline
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime
+import api_config
+import metrics
 
 DEFAULT_COORDS = (6.5244, 3.3792)
+NO_ROUTE = (None, None, None, None)
 
-def get_driving_route(user_coords, hospital_coords, hospital_name):
-    if user_coords == DEFAULT_COORDS or hospital_coords == DEFAULT_COORDS:
+ROUTE_TIMEOUT = 8.0
+ROUTE_MAX_WORKERS = 6
+# Origins and destinations are snapped to a grid of this many degrees (~220 m at Lagos'
+# latitude) so nearby users heading to the same hospital share a cached route.
+ROUTE_CELL_DEGREES = 0.002
+ROUTE_TIME_BUCKET_MINUTES = 30
+ROUTE_CACHE_TTL = 900.0
+ROUTE_CACHE_SIZE = 10000
+# The Distance Matrix API takes at most 25 destinations per request
+MATRIX_MAX_DESTINATIONS = 25
+
+# Thread-safe LRU cache whose entries expire ttl seconds after they were stored
+class RouteCache:
+    def __init__(self, max_size=ROUTE_CACHE_SIZE, ttl=ROUTE_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+route_cache = RouteCache()
+# (duration_s, distance_m) per snapped origin, destination and departure window
+travel_time_cache = RouteCache()
+_executor = None
+_executor_lock = threading.Lock()
+
+def _route_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(ROUTE_MAX_WORKERS, thread_name_prefix='route')
+    return _executor
+
+def snap_coords(coords, cell_degrees=ROUTE_CELL_DEGREES):
+    return (round(coords[0] / cell_degrees), round(coords[1] / cell_degrees))
+
+def route_cache_key(user_coords, hospital_coords, departure_time):
+    minutes = departure_time.hour * 60 + departure_time.minute
+    return (snap_coords(user_coords), snap_coords(hospital_coords), minutes // ROUTE_TIME_BUCKET_MINUTES)
+
+class GoogleDirectionsBackend:
+    def __init__(self, client=None):
+        self.client = client
+
+    def route(self, user_coords, hospital_coords, hospital_name, departure_time):
+        try:
+            with metrics.google_call('directions'):
+                directions_result = (self.client or api_config.gmaps).directions(
+                    origin=user_coords,
+                    destination=hospital_coords,
+                    mode="driving",
+                    departure_time=departure_time
+                )
+            if directions_result and len(directions_result) > 0:
+                route = directions_result[0]['legs'][0]
+                distance = route['distance']['text']
+                duration = route['duration']['text']
+                # overview_polyline is on the route, not the leg; reading it from the leg raised
+                # KeyError, and every Google route came back as NO_ROUTE
+                polyline_points = directions_result[0]['overview_polyline']['points']
+                instructions = [step['html_instructions'] for step in route['steps']]
+                return distance, duration, polyline_points, instructions
+            else:
+                print(f"No route found to {hospital_name}. API response: {directions_result}")
+                return NO_ROUTE
+        except Exception as e:
+            print(f"Error fetching route to {hospital_name}: {e}. Check API key or coordinates.")
+            return NO_ROUTE
+
+    def travel_times(self, user_coords, destinations, departure_time):
+        # (duration_s, distance_m) from one origin to each destination, None where there is no
+        # route; duration_in_traffic when Google returns it
+        try:
+            with metrics.google_call('distance_matrix'):
+                result = (self.client or api_config.gmaps).distance_matrix(
+                    origins=[user_coords],
+                    destinations=list(destinations),
+                    mode="driving",
+                    departure_time=departure_time
+                )
+            elements = result['rows'][0]['elements']
+        except Exception as e:
+            print(f"Error fetching travel times: {e}. Ranking by straight-line distance.")
+            return [None] * len(destinations)
+        times = []
+        for element in elements:
+            if element.get('status') == 'OK':
+                duration = element.get('duration_in_traffic', element['duration'])
+                times.append((duration['value'], element['distance']['value']))
+            else:
+                times.append(None)
+        return times
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def set_routing_backend(backend):
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+def get_routing_backend():
+    # Any object with route(user_coords, hospital_coords, hospital_name, departure_time)
+    # returning (distance, duration, polyline_points, instructions), and
+    # travel_times(user_coords, destinations, departure_time) returning a (duration_s,
+    # distance_m) or None per destination, can serve as a backend.
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if getattr(api_config, 'ROUTING_BACKEND', 'google') == 'local':
+                from local_router import LocalRoutingEngine
+                _backend = LocalRoutingEngine(api_config.LOCAL_ROAD_GRAPH)
+            else:
+                _backend = GoogleDirectionsBackend()
+        return _backend
+
+def get_driving_route(user_coords, hospital_coords, hospital_name, client=None, cache=route_cache, backend=None):
+    if user_coords is None or user_coords == DEFAULT_COORDS or hospital_coords == DEFAULT_COORDS:
         print(f"Skipping route to {hospital_name}: Invalid coordinates (user: {user_coords}, hospital: {hospital_coords})")
-        return None, None, None, None
-    
-    try:
-        directions_result = gmaps.directions(
-            origin=user_coords,
-            destination=hospital_coords,
-            mode="driving",
-            departure_time=datetime.now()
-        )
-        if directions_result and len(directions_result) > 0:
-            route = directions_result[0]['legs'][0]
-            distance = route['distance']['text']
-            duration = route['duration']['text']
-            polyline_points = route['overview_polyline']['points']
-            instructions = [step['html_instructions'] for step in route['steps']]
-            return distance, duration, polyline_points, instructions
+        return NO_ROUTE
+
+    departure_time = datetime.now()
+    key = route_cache_key(user_coords, hospital_coords, departure_time)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    if backend is None:
+        backend = GoogleDirectionsBackend(client) if client is not None else get_routing_backend()
+    result = backend.route(user_coords, hospital_coords, hospital_name, departure_time)
+    if cache is not None and result[0] is not None:
+        cache.put(key, result)
+    return result
+
+def get_travel_times(user_coords, destinations, client=None, cache=travel_time_cache, backend=None):
+    # Drive (duration_s, distance_m) from one origin to each hospital coords, or None. Cached
+    # pairs are reused and the rest are fetched in one batched backend call (per
+    # MATRIX_MAX_DESTINATIONS), rather than one directions call each.
+    times = [None] * len(destinations)
+    if user_coords is None or user_coords == DEFAULT_COORDS:
+        return times
+    departure_time = datetime.now()
+    pending = []
+    for i, coords in enumerate(destinations):
+        if coords is None or coords == DEFAULT_COORDS:
+            continue
+        key = route_cache_key(user_coords, coords, departure_time)
+        cached = cache.get(key) if cache is not None else None
+        if cached is not None:
+            times[i] = cached
         else:
-            print(f"No route found to {hospital_name}. API response: {directions_result}")
-            return None, None, None, None
-    except Exception as e:
-        print(f"Error fetching route to {hospital_name}: {e}. Check API key or coordinates.")
-        return None, None, None, None
\ No newline at end of file
+            pending.append((i, key, coords))
+    if not pending:
+        return times
+
+    if backend is None:
+        backend = GoogleDirectionsBackend(client) if client is not None else get_routing_backend()
+    for start in range(0, len(pending), MATRIX_MAX_DESTINATIONS):
+        chunk = pending[start:start + MATRIX_MAX_DESTINATIONS]
+        results = backend.travel_times(user_coords, [coords for _, _, coords in chunk], departure_time)
+        for (i, key, _), result in zip(chunk, results):
+            times[i] = result
+            if cache is not None and result is not None:
+                cache.put(key, result)
+    return times
+
+def get_driving_routes_for(requests, timeout=ROUTE_TIMEOUT, client=None, cache=route_cache, backend=None):
+    # requests is a list of (user_coords, hospital_coords, hospital_name); results come back in
+    # the same order. Lookups run concurrently and any still pending after timeout seconds get
+    # NO_ROUTE.
+    executor = _route_executor()
+    futures = [
+        executor.submit(get_driving_route, user_coords, coords, name, client, cache, backend)
+        for user_coords, coords, name in requests
+    ]
+    deadline = time.monotonic() + timeout
+    routes = []
+    for future, (_, _, name) in zip(futures, requests):
+        try:
+            routes.append(future.result(timeout=max(deadline - time.monotonic(), 0.0)))
+        except FutureTimeoutError:
+            # Lookups still queued are dropped rather than left to occupy the shared pool later;
+            # one already running finishes (and fills the cache) in the background
+            future.cancel()
+            print(f"Timed out fetching route to {name} after {timeout:g}s.")
+            routes.append(NO_ROUTE)
+    return routes
+
+def get_driving_routes(user_coords, destinations, timeout=ROUTE_TIMEOUT, client=None, cache=route_cache, backend=None):
+    # destinations is a list of (hospital_coords, hospital_name) from one origin
+    requests = [(user_coords, coords, name) for coords, name in destinations]
+    return get_driving_routes_for(requests, timeout, client, cache, backend)
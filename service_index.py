@@ -0,0 +1,132 @@
+import copy
+import numpy as np
+import pandas as pd
+from snapshot import read_only
+
+MAX_CACHED_WORDS = 4096
+
+# Inverted index over hospital Services strings, built once at load time.
+#
+# compute_service_match scores 1.0 when the whole (lowercased, stripped) query is a substring
+# of the hospital's services and 0.5 when any query word is. A query word has no whitespace,
+# so it can only occur inside a single whitespace-separated token of the services text:
+# looking the word up against the token vocabulary and unioning the posting lists gives
+# exactly the hospitals whose text contains it. Multi-word phrases are verified against the
+# text only for hospitals that contain every word.
+class ServiceIndex:
+    def __init__(self, services):
+        self.texts = [None if pd.isna(text) else str(text).lower().strip() for text in services]
+        postings = {}
+        for hospital_id, text in enumerate(self.texts):
+            if text is None:
+                continue
+            for token in set(text.split()):
+                postings.setdefault(token, []).append(hospital_id)
+        self.postings = {token: np.array(ids, dtype=np.int32) for token, ids in postings.items()}
+        self.valid = np.array([text is not None for text in self.texts], dtype=bool)
+        self._word_cache = {}
+        # Set on a copy until its first change (see copy)
+        self._shared = False
+
+    @classmethod
+    def from_postings(cls, texts, postings, valid):
+        # Rebuilds an index saved elsewhere (a snapshot) without re-tokenizing every hospital
+        index = cls.__new__(cls)
+        index.texts = texts
+        index.postings = postings
+        index.valid = valid
+        index._word_cache = {}
+        index._shared = False
+        return index
+
+    def __len__(self):
+        return len(self.texts)
+
+    def copy(self):
+        # Shares everything; the copy's first change copies the texts and postings it edits, and
+        # resets its word cache
+        index = copy.copy(self)
+        index.valid = read_only(self.valid)
+        index._shared = True
+        return index
+
+    def _writable(self):
+        if self._shared or not isinstance(self.texts, list):
+            self.texts = list(self.texts)
+        if self._shared:
+            self.postings = dict(self.postings)
+            self._word_cache = {}
+            self._shared = False
+        if not self.valid.flags.writeable:
+            self.valid = self.valid.copy()
+
+    def hospitals_containing(self, word):
+        # Cached until the next change to the index
+        cache = self._word_cache
+        ids = cache.get(word)
+        if ids is None:
+            lists = [posting for token, posting in self.postings.items() if word in token]
+            ids = np.unique(np.concatenate(lists)) if lists else np.empty(0, dtype=np.int32)
+            if len(cache) >= MAX_CACHED_WORDS:
+                cache.clear()
+            cache[word] = ids
+        return ids
+
+    def set_services(self, i, services):
+        # Re-indexes hospital i; None (a retired hospital) drops it from every posting list.
+        # Posting arrays are replaced rather than edited, as copies share them.
+        self._writable()
+        old = self.texts[i]
+        text = None if services is None or pd.isna(services) else str(services).lower().strip()
+        old_tokens = set(old.split()) if old else set()
+        new_tokens = set(text.split()) if text else set()
+        postings = self.postings
+        for token in old_tokens - new_tokens:
+            ids = postings[token]
+            ids = ids[ids != i]
+            if ids.size:
+                postings[token] = ids
+            else:
+                del postings[token]
+        for token in new_tokens - old_tokens:
+            ids = postings.get(token, np.empty(0, dtype=np.int32))
+            postings[token] = np.insert(ids, np.searchsorted(ids, i), i).astype(np.int32)
+        self.texts[i] = text
+        self.valid[i] = text is not None
+        self._word_cache.clear()
+
+    def append(self, services):
+        self._writable()
+        self.texts.append(None)
+        self.valid = np.append(self.valid, False)
+        self.set_services(len(self.texts) - 1, services)
+        return len(self.texts) - 1
+
+    def match(self, user_service):
+        # Returns (full_match_ids, partial_match_ids), both sorted
+        if pd.isna(user_service):
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32)
+        query = user_service.lower().strip()
+        words = query.split()
+        if not words:
+            return np.flatnonzero(self.valid).astype(np.int32), np.empty(0, dtype=np.int32)
+
+        word_ids = [self.hospitals_containing(word) for word in words]
+        any_word = word_ids[0]
+        all_words = word_ids[0]
+        for ids in word_ids[1:]:
+            any_word = np.union1d(any_word, ids)
+            all_words = np.intersect1d(all_words, ids, assume_unique=True)
+        if len(words) == 1:
+            full = all_words
+        else:
+            full = np.array([i for i in all_words if query in self.texts[i]], dtype=np.int32)
+        partial = np.setdiff1d(any_word, full, assume_unique=True)
+        return full, partial
+
+    def service_match(self, user_service, idx=None):
+        scores = np.zeros(len(self))
+        full, partial = self.match(user_service)
+        scores[partial] = 0.5
+        scores[full] = 1.0
+        return scores if idx is None else scores[idx]
@@ -0,0 +1,258 @@
+import json
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import numpy as np
+import pandas as pd
+
+# Binary snapshot of a hospital dataset with its resolved coordinates, opened with mmap so
+# prefork workers share one read-only copy of the pages instead of each parsing the CSV.
+#
+# Layout: magic, format version (u32), header length (u32), JSON header, then each section
+# as a raw little-endian array starting on a SNAPSHOT_ALIGNMENT boundary. The header lists
+# every section's dtype, shape and offset. Strings (names, addresses, services, cost levels,
+# service tokens) are interned into one UTF-8 blob and referenced by int32 id, -1 for missing.
+SNAPSHOT_MAGIC = b'HOSPSNAP'
+SNAPSHOT_VERSION = 2
+SNAPSHOT_ALIGNMENT = 64
+SNAPSHOT_SUFFIX = '.snap'
+_PREAMBLE = struct.Struct('<8sII')
+
+STRING_COLUMNS = {'name': 'Name', 'address': 'Full Address', 'services': 'Services', 'cost_level': 'Cost Level'}
+
+def is_snapshot_file(path):
+    return str(path).endswith(SNAPSHOT_SUFFIX)
+
+def _align(offset):
+    return -(-offset // SNAPSHOT_ALIGNMENT) * SNAPSHOT_ALIGNMENT
+
+def read_only(array):
+    # A view that cannot be written, like a snapshot's own columns: whatever updates one copies
+    # it first, leaving the array it was taken from untouched
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+class StringTable:
+    def __init__(self):
+        self.ids = {}
+        self.values = []
+
+    def intern(self, value):
+        if value is None or (not isinstance(value, str) and pd.isna(value)):
+            return -1
+        value = str(value)
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return string_id
+
+    def column(self, values):
+        return np.array([self.intern(value) for value in values], dtype=np.int32)
+
+    def sections(self):
+        encoded = [value.encode('utf-8') for value in self.values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        return {'string_offsets': offsets, 'string_blob': np.frombuffer(b''.join(encoded), dtype=np.uint8)}
+
+def replace_file(path, write, mode='wb', **open_args):
+    # Calls write(f) on a new file beside path and renames it over path, so readers see the old
+    # file or the new one, never half of either. Replacing rather than rewriting also keeps
+    # pages already mapped by running workers valid. The name is unique, so writers racing each
+    # other never share a temporary file.
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp',
+                                    dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, mode, **open_args) as f:
+            write(f)
+        if os.path.exists(path):
+            shutil.copymode(path, tmp_path)
+        else:
+            os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def write_snapshot(path, sections, meta, magic=SNAPSHOT_MAGIC, version=SNAPSHOT_VERSION):
+    # Also writes other files in the same layout (see coverage_grid) under their own magic
+    layout = {}
+    offset = 0
+    for name, array in sections.items():
+        offset = _align(offset)
+        layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += array.nbytes
+    header = json.dumps({**meta, 'sections': layout}).encode('utf-8')
+    data_start = _align(_PREAMBLE.size + len(header))
+
+    def write(f):
+        f.write(_PREAMBLE.pack(magic, version, len(header)))
+        f.write(header)
+        for name, array in sections.items():
+            f.write(b'\0' * (data_start + layout[name]['offset'] - f.tell()))
+            f.write(np.ascontiguousarray(array, dtype=array.dtype.newbyteorder('<')).tobytes())
+    replace_file(path, write)
+
+def build_snapshot(data, coordinates, service_index, spatial_index, store, out_path, source_file=None):
+    # data: the cleaned frame from load_hospital_data, row-aligned with the other arguments
+    strings = StringTable()
+    sections = {name: strings.column(data[column]) for name, column in STRING_COLUMNS.items()}
+    sections['services_text'] = strings.column(service_index.texts)
+
+    tokens = sorted(service_index.postings)
+    postings = [service_index.postings[token] for token in tokens]
+    sections['service_tokens'] = strings.column(tokens)
+    sections['service_indptr'] = np.concatenate([[0], np.cumsum([len(ids) for ids in postings])]).astype(np.int64)
+    sections['service_postings'] = (np.concatenate(postings) if postings else np.empty(0)).astype(np.int32)
+
+    sections['quality_score'] = data['Quality Score'].to_numpy(dtype=np.float64)
+    sections['user_rating'] = data['User Rating'].to_numpy(dtype=np.float64)
+    sections['coordinates'] = np.ascontiguousarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    sections['spatial_ids'] = spatial_index.sorted_ids.astype(np.int64)
+    # The store's own columns, so workers use them in place rather than converting
+    sections['cost'] = store.cost
+    sections['quality'] = store.quality
+    sections['rating'] = store.user_rating
+    sections['lat'] = store.lat
+    sections['lon'] = store.lon
+    memberships = {}
+    for name, (labels, degrees) in store.memberships.items():
+        sections[f'membership_{name}'] = degrees
+        memberships[name] = labels
+    sections.update(strings.sections())
+
+    meta = {
+        'rows': len(data),
+        'source': source_stamp(source_file),
+        'cell_degrees': spatial_index.cell_degrees,
+        'fingerprint': store.model['fingerprint'],
+        'memberships': memberships,
+    }
+    write_snapshot(out_path, sections, meta)
+    return out_path
+
+def map_sections(path, magic=SNAPSHOT_MAGIC, version=SNAPSHOT_VERSION, kind='hospital snapshot'):
+    # (mmap, header, arrays) of a file written by write_snapshot. The arrays are read-only views
+    # straight onto the mapped pages; nothing is copied.
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(mapped) < _PREAMBLE.size:
+        raise ValueError(f"{path} is not a {kind}")
+    file_magic, file_version, header_length = _PREAMBLE.unpack_from(mapped, 0)
+    if file_magic != magic:
+        raise ValueError(f"{path} is not a {kind}")
+    if file_version != version:
+        raise ValueError(f"{path} has {kind} format {file_version}; expected {version}")
+    header = json.loads(mapped[_PREAMBLE.size:_PREAMBLE.size + header_length].decode('utf-8'))
+    data_start = _align(_PREAMBLE.size + header_length)
+    arrays = {}
+    for name, section in header['sections'].items():
+        count = int(np.prod(section['shape'], dtype=np.int64))
+        arrays[name] = np.frombuffer(mapped, dtype=np.dtype(section['dtype']), count=count,
+                                     offset=data_start + section['offset']).reshape(section['shape'])
+    return mapped, header, arrays
+
+def source_stamp(path):
+    # Identifies the file a derived one was built from, so it can tell when it is out of date
+    if not path or not os.path.exists(path):
+        return None
+    return {'path': path, 'mtime': os.path.getmtime(path), 'size': os.path.getsize(path)}
+
+def is_stale_source(source):
+    if not source or not os.path.exists(source['path']):
+        return False
+    return (os.path.getmtime(source['path']), os.path.getsize(source['path'])) != (source['mtime'], source['size'])
+
+class HospitalSnapshot:
+    def __init__(self, path):
+        self.path = path
+        self._mmap, self.header, self.arrays = map_sections(path)
+
+    def __len__(self):
+        return self.header['rows']
+
+    def is_stale(self):
+        # True when the CSV the snapshot was built from has changed since
+        return is_stale_source(self.header['source'])
+
+    def string(self, string_id):
+        if string_id < 0:
+            return None
+        offsets = self.arrays['string_offsets']
+        return self.arrays['string_blob'][offsets[string_id]:offsets[string_id + 1]].tobytes().decode('utf-8')
+
+    def strings(self, string_ids):
+        decoded = {}
+        values = []
+        for string_id in string_ids.tolist():
+            value = decoded.get(string_id)
+            if value is None:
+                value = decoded[string_id] = self.string(string_id)
+            values.append(value)
+        return values
+
+    def string_column(self, name):
+        return SnapshotStrings(self, self.arrays[name])
+
+    def service_postings(self):
+        indptr = self.arrays['service_indptr']
+        postings = self.arrays['service_postings']
+        tokens = self.strings(self.arrays['service_tokens'])
+        return {token: postings[indptr[i]:indptr[i + 1]] for i, token in enumerate(tokens)}
+
+    def memberships(self, fingerprint):
+        # Precomputed static memberships, or None when built with other fuzzy definitions
+        if self.header['fingerprint'] != fingerprint:
+            return None
+        return {name: (labels, self.arrays[f'membership_{name}']) for name, labels in self.header['memberships'].items()}
+
+    def to_frame(self, ids=None):
+        # DataFrame in load_hospital_data's shape plus the Coordinates column, indexed by row id
+        ids = np.arange(len(self)) if ids is None else np.asarray(ids, dtype=np.int64)
+        frame = pd.DataFrame({column: self.strings(self.arrays[name][ids]) for name, column in STRING_COLUMNS.items()},
+                             index=ids)
+        frame['Quality Score'] = self.arrays['quality_score'][ids]
+        frame['User Rating'] = self.arrays['user_rating'][ids]
+        frame['Coordinates'] = [
+            None if np.isnan(lat) or np.isnan(lon) else (lat, lon)
+            for lat, lon in self.arrays['coordinates'][ids].tolist()
+        ]
+        return frame
+
+# Lazy sequence over one string-id column, decoded per access rather than held per process
+class SnapshotStrings:
+    def __init__(self, snapshot, string_ids):
+        self.snapshot = snapshot
+        self.string_ids = string_ids
+
+    def __len__(self):
+        return len(self.string_ids)
+
+    def __getitem__(self, i):
+        return self.snapshot.string(int(self.string_ids[i]))
+
+    def __iter__(self):
+        return iter(self.snapshot.strings(self.string_ids))
+
+def snapshot_source_file(path):
+    # The CSV a snapshot was built from, as recorded in its header; None when unknown
+    try:
+        _, header, _ = map_sections(path)
+    except (OSError, ValueError, KeyError):
+        return None
+    source = header.get('source')
+    return source['path'] if source else None
+
+def open_snapshot(path):
+    try:
+        return HospitalSnapshot(path)
+    except FileNotFoundError:
+        print(f"Error: {path} not found.")
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error: Unable to read snapshot {path}: {e}")
+    return None
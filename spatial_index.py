@@ -0,0 +1,156 @@
+import copy
+import math
+import numpy as np
+from geopy.distance import geodesic
+from distance_calculator import EARTH_RADIUS_KM, haversine_km
+from snapshot import read_only
+
+# On the sphere haversine_km measures, so search extents and candidate distances agree
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180.0
+DEFAULT_CELL_DEGREES = 0.05
+# Haversine on a sphere is within ~0.56% of the WGS-84 geodesic; only candidates inside
+# this relative band around the radius need the exact (and much slower) geodesic.
+HAVERSINE_TOLERANCE = 0.006
+
+# Grid bucket index over hospital coordinates. Each bucket holds the ids of the hospitals
+# whose (lat, lon) fall in one cell_degrees x cell_degrees cell; hospitals without
+# coordinates are not indexed. sorted_ids (the indexed ids in cell order, as saved in a
+# snapshot) skips the sort, and the buckets become views into it. move() and append() keep
+# the buckets current after an update; sorted_ids then only describes the initial build.
+class SpatialIndex:
+    def __init__(self, lat, lon, cell_degrees=DEFAULT_CELL_DEGREES, sorted_ids=None):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.cell_degrees = cell_degrees
+        if sorted_ids is None:
+            valid = np.flatnonzero(np.isfinite(self.lat) & np.isfinite(self.lon))
+            rows = np.floor(self.lat[valid] / cell_degrees).astype(np.int64)
+            cols = np.floor(self.lon[valid] / cell_degrees).astype(np.int64)
+            order = np.lexsort((cols, rows))
+            rows, cols, ids = rows[order], cols[order], valid[order]
+        else:
+            ids = valid = sorted_ids
+            rows = np.floor(self.lat[ids] / cell_degrees).astype(np.int64)
+            cols = np.floor(self.lon[ids] / cell_degrees).astype(np.int64)
+        self.sorted_ids = ids
+        boundaries = np.flatnonzero((np.diff(rows) != 0) | (np.diff(cols) != 0)) + 1
+        self.buckets = {
+            (int(r[0]), int(c[0])): bucket
+            for r, c, bucket in zip(np.split(rows, boundaries), np.split(cols, boundaries), np.split(ids, boundaries))
+            if bucket.size
+        }
+        self.max_abs_lat = float(np.abs(self.lat[valid]).max()) if valid.size else 0.0
+
+    def __len__(self):
+        return sum(bucket.size for bucket in self.buckets.values())
+
+    def copy(self):
+        # Buckets are replaced rather than edited, so only the dict holding them is copied
+        index = copy.copy(self)
+        index.lat, index.lon = read_only(self.lat), read_only(self.lon)
+        index.buckets = dict(self.buckets)
+        return index
+
+    def _cell(self, lat, lon):
+        return int(np.floor(lat / self.cell_degrees)), int(np.floor(lon / self.cell_degrees))
+
+    def _gather(self, rows, cols):
+        buckets = [self.buckets.get((r, c)) for r in rows for c in cols]
+        buckets = [bucket for bucket in buckets if bucket is not None]
+        return np.concatenate(buckets) if buckets else np.empty(0, dtype=np.int64)
+
+    def move(self, i, lat, lon):
+        # Re-buckets hospital i at new coordinates; NaN coordinates take it out of the index
+        if not self.lat.flags.writeable or not self.lon.flags.writeable:
+            self.lat, self.lon = self.lat.copy(), self.lon.copy()
+        self.remove(i)
+        self.lat[i], self.lon[i] = lat, lon
+        self._insert(i)
+
+    def remove(self, i):
+        # Takes hospital i out of the index (a retired hospital); its coordinates stay as they were
+        if np.isfinite(self.lat[i]) and np.isfinite(self.lon[i]):
+            cell = self._cell(self.lat[i], self.lon[i])
+            bucket = self.buckets.get(cell)
+            if bucket is not None:
+                bucket = bucket[bucket != i]
+                if bucket.size:
+                    self.buckets[cell] = bucket
+                else:
+                    del self.buckets[cell]
+
+    def append(self, lat, lon):
+        self.lat = np.append(self.lat, lat)
+        self.lon = np.append(self.lon, lon)
+        i = self.lat.size - 1
+        self._insert(i)
+        return i
+
+    def _insert(self, i):
+        lat, lon = self.lat[i], self.lon[i]
+        if not (np.isfinite(lat) and np.isfinite(lon)):
+            return
+        cell = self._cell(lat, lon)
+        bucket = self.buckets.get(cell)
+        self.buckets[cell] = np.array([i], dtype=np.int64) if bucket is None else np.append(bucket, i)
+        self.max_abs_lat = max(self.max_abs_lat, float(abs(lat)))
+
+    def query_radius(self, coords, radius_km):
+        lat, lon = coords
+        lat_span = radius_km / KM_PER_DEGREE
+        lon_span = radius_km / (KM_PER_DEGREE * max(np.cos(np.radians(min(abs(lat) + lat_span, 89.0))), 1e-6))
+        pad = 1.0 + HAVERSINE_TOLERANCE
+        row_lo, col_lo = self._cell(lat - lat_span * pad, lon - lon_span * pad)
+        row_hi, col_hi = self._cell(lat + lat_span * pad, lon + lon_span * pad)
+        ids = self._gather(range(row_lo, row_hi + 1), range(col_lo, col_hi + 1))
+        distances = haversine_km(lat, lon, self.lat[ids], self.lon[ids])
+        ids, distances = self._within(coords, ids, distances, radius_km)
+        order = np.argsort(distances, kind='stable')
+        return ids[order], distances[order]
+
+    def within(self, coords, ids, radius_km):
+        # The given ids inside radius_km of coords by the same test as query_radius, in order
+        distances = haversine_km(coords[0], coords[1], self.lat[ids], self.lon[ids])
+        return self._within(coords, ids, distances, radius_km)[0]
+
+    def _within(self, coords, ids, distances, radius_km):
+        keep = distances <= radius_km * (1.0 - HAVERSINE_TOLERANCE)
+        boundary = np.flatnonzero(~keep & (distances <= radius_km * (1.0 + HAVERSINE_TOLERANCE)))
+        for i in boundary:
+            distances[i] = geodesic(coords, (self.lat[ids[i]], self.lon[ids[i]])).km
+            keep[i] = distances[i] <= radius_km
+        return ids[keep], distances[keep]
+
+    def query_nearest(self, coords, k, max_distance_km=None):
+        lat, lon = coords
+        row, col = self._cell(lat, lon)
+        # Smallest east-west extent of a cell anywhere in the indexed area, in km
+        cell_km = self.cell_degrees * KM_PER_DEGREE * np.cos(np.radians(min(max(self.max_abs_lat, abs(lat)), 89.0)))
+        total = len(self)
+        ids = np.empty(0, dtype=np.int64)
+        ring = 0
+        while True:
+            if ring == 0:
+                ring_ids = self._gather([row], [col])
+            else:
+                rows = range(row - ring, row + ring + 1)
+                ring_ids = np.concatenate([
+                    self._gather([row - ring, row + ring], range(col - ring, col + ring + 1)),
+                    self._gather(rows[1:-1], [col - ring, col + ring]),
+                ])
+            ids = np.concatenate([ids, ring_ids])
+            # Every hospital outside the searched square is at least this far away
+            covered_km = ring * cell_km
+            if ids.size == total or (max_distance_km is not None and covered_km >= max_distance_km):
+                break
+            if ids.size >= k:
+                distances = haversine_km(lat, lon, self.lat[ids], self.lon[ids])
+                if np.partition(distances, k - 1)[k - 1] <= covered_km:
+                    break
+            ring += 1
+
+        distances = haversine_km(lat, lon, self.lat[ids], self.lon[ids])
+        if max_distance_km is not None:
+            ids, distances = self._within(coords, ids, distances, max_distance_km)
+        order = np.argsort(distances, kind='stable')[:k]
+        return ids[order], distances[order]
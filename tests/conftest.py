@@ -0,0 +1,40 @@
+import os
+import sys
+import pytest
+
+# The modules live flat at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stub_maps import StubMapsClient
+from benchmarks.synthetic_data import write_dataset
+
+DATASET_SIZE = 300
+
+@pytest.fixture(autouse=True)
+def unlimited_geocoding(monkeypatch):
+    # The stub answers instantly; the shared limiter's QPS only models the real API
+    from bulk_geocoder import shared_pool
+    _, rate_limiter = shared_pool()
+    monkeypatch.setattr(rate_limiter, 'interval', 0.0)
+
+@pytest.fixture
+def stub_client():
+    return StubMapsClient()
+
+@pytest.fixture(autouse=True)
+def no_google_maps(monkeypatch, stub_client):
+    # Anything that reaches for the shared client gets the stub, never the real API. Set in the
+    # module dict, as reading the attribute first would create the real client.
+    import api_config
+    monkeypatch.setitem(vars(api_config), 'gmaps', stub_client)
+
+@pytest.fixture
+def dataset(tmp_path):
+    # (dataset CSV, geocode cache) of synthetic hospitals in the Lagos schema
+    return write_dataset(str(tmp_path / 'hospitals.csv'), DATASET_SIZE, seed=1), str(tmp_path / 'coordinates.db')
+
+@pytest.fixture
+def state(dataset, stub_client):
+    from app_state import build_app_state
+    dataset_file, cache_file = dataset
+    return build_app_state(dataset_file, cache_file, client=stub_client)
@@ -0,0 +1,52 @@
+import pytest
+import api
+from bulk_geocoder import GEOCODE_SUFFIX
+from regions import Region, RegionRegistry, RegionShards
+
+@pytest.fixture
+def client(dataset, stub_client, monkeypatch):
+    dataset_file, cache_file = dataset
+    lagos = Region('lagos', ((6.35, 2.70), (6.75, 4.40)), (6.5244, 3.3792), GEOCODE_SUFFIX, dataset_file, cache_file)
+    monkeypatch.setattr(api, 'shards', RegionShards(RegionRegistry([lagos]), client=stub_client))
+    return api.app.test_client()
+
+def post_batch(client, queries, **body):
+    response = client.post('/batch_recommendations', json={'queries': queries, **body})
+    return response.status_code, response.get_json()
+
+def test_batch_reports_errors_per_query(client):
+    good = {'location': 'Yaba', 'service': 'Surgery', 'k': 3}
+    status, body = post_batch(client, [
+        good,
+        'Surgery near Yaba',
+        {'location': 'Yaba'},
+        {'location': 'Yaba', 'service': 'Surgery', 'cost_pref': 'Cheap'},
+        {'location': 'Yaba', 'service': 'Surgery', 'region': 'kano'},
+        {'location': 'Yaba', 'service': 'Astrology'},
+        dict(good, service='Dental'),
+    ])
+    assert status == 200
+    results = body['results']
+    assert len(results) == 7
+    assert [result.get('status') for result in results] == [None, 400, 400, 400, 400, 404, None]
+    assert results[1]['error'] == 'Each query must be a JSON object.'
+    assert results[2]['error'] == 'Service parameter is required.'
+    assert 'Unknown region' in results[4]['error']
+    # The good queries are answered as they would be on their own
+    assert results[0] == post_batch(client, [good])[1]['results'][0]
+    assert len(results[0]['recommendations']) == 3
+    assert results[6]['user_inputs']['service'] == 'Dental'
+
+def test_batch_rejects_malformed_bodies(client, monkeypatch):
+    for body in [None, {'queries': []}, {'queries': {'service': 'Surgery'}}, ['Surgery']]:
+        response = client.post('/batch_recommendations', json=body)
+        assert response.status_code == 400 and 'queries' in response.get_json()['error']
+    monkeypatch.setattr(api, 'MAX_BATCH_QUERIES', 2)
+    status, body = post_batch(client, [{'service': 'Surgery'}] * 3)
+    assert status == 400 and body['error'] == 'At most 2 queries per batch.'
+
+def test_batch_timings_only_on_debug(client):
+    _, body = post_batch(client, [{'location': 'Yaba', 'service': 'Surgery'}])
+    assert 'timings_ms' not in body
+    _, body = post_batch(client, [{'location': 'Yaba', 'service': 'Surgery'}], debug=True)
+    assert body['timings_ms']
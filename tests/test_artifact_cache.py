@@ -0,0 +1,59 @@
+import threading
+import pytest
+from artifact_cache import ArtifactCache, artifact_key
+
+def test_key_depends_on_content_not_order():
+    assert artifact_key('map', {'zoom': 11, 'rows': [[1, 2]]}) == artifact_key('map', {'rows': [[1, 2]], 'zoom': 11})
+    assert artifact_key('map', {'zoom': 11}) != artifact_key('chart', {'zoom': 11})
+    assert artifact_key('map', {'zoom': 11}) != artifact_key('map', {'zoom': 12})
+
+def test_bounded_by_bytes_least_recently_used_first():
+    cache = ArtifactCache(max_bytes=10)
+    for key in 'abc':
+        cache.get_or_render(key, lambda: b'1234')
+    assert cache.stats() == {'size': 2, 'bytes': 8, 'hits': 0, 'misses': 3, 'coalesced': 0}
+    assert cache.get_or_render('b', lambda: b'new!') == b'1234'
+    # 'c' is now the least recently used, so it goes first
+    cache.get_or_render('d', lambda: 'xyz')
+    assert list(cache._entries) == ['b', 'd'] and cache.stats()['bytes'] == 7
+    cache.get_or_render('a', lambda: b'5678')
+    assert list(cache._entries) == ['d', 'a'] and cache.stats()['bytes'] == 7
+    assert cache.get_or_render('d', lambda: 'new') == 'xyz'
+
+    # Larger than the whole budget: served, not kept, and nothing else evicted for it
+    before = cache.stats()
+    assert cache.get_or_render('huge', lambda: b'x' * 11) == b'x' * 11
+    assert cache.stats()['bytes'] == before['bytes'] and cache.stats()['size'] == before['size']
+
+def test_identical_misses_render_once():
+    cache = ArtifactCache()
+    started, release = threading.Event(), threading.Event()
+    renders = []
+
+    def render():
+        renders.append(1)
+        started.set()
+        release.wait(5.0)
+        return b'png'
+    results = []
+    owner = threading.Thread(target=lambda: results.append(cache.get_or_render('k', render)))
+    owner.start()
+    started.wait(5.0)
+    waiter = threading.Thread(target=lambda: results.append(cache.get_or_render('k', render)))
+    waiter.start()
+    while cache.stats()['coalesced'] == 0:
+        threading.Event().wait(0.01)
+    release.set()
+    owner.join()
+    waiter.join()
+    assert results == [b'png', b'png'] and len(renders) == 1
+
+def test_failed_renders_are_not_cached():
+    cache = ArtifactCache()
+
+    def fail():
+        raise RuntimeError('no display')
+    with pytest.raises(RuntimeError):
+        cache.get_or_render('k', fail)
+    assert cache.get_or_render('k', lambda: b'ok') == b'ok'
+    assert cache.stats()['misses'] == 2
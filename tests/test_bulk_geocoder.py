@@ -0,0 +1,83 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import googlemaps
+import pytest
+from benchmarks.stub_maps import StubMapsClient
+from bulk_geocoder import BulkGeocoder, RateLimiter
+from geocoder import DEFAULT_COORDS, MISSING, GeocodeCache
+
+# Fails the first `failures` geocode calls with error, then answers like the stub
+class FlakyClient(StubMapsClient):
+    def __init__(self, failures, error, latency=0.0):
+        super().__init__(latency)
+        self.failures = failures
+        self.error = error
+
+    def geocode(self, address):
+        with self._lock:
+            failing = self.failures > 0
+            self.failures -= failing
+        if failing:
+            self._call('geocode')
+            raise self.error
+        return super().geocode(address)
+
+@pytest.fixture
+def cache(tmp_path):
+    return GeocodeCache(str(tmp_path / 'coordinates.db'), legacy_csv=None)
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(8) as executor:
+        yield executor
+
+def geocoder(cache, client, executor, **kwargs):
+    return BulkGeocoder(cache, client=client, executor=executor, rate_limiter=RateLimiter(0), backoff=0.0, **kwargs)
+
+def stub_coords(address):
+    location = StubMapsClient().geocode(address)[0]['geometry']['location']
+    return location['lat'], location['lng']
+
+def test_retries_retriable_errors(cache, executor):
+    client = FlakyClient(2, googlemaps.exceptions.ApiError('OVER_QUERY_LIMIT'))
+    coords = geocoder(cache, client, executor).geocode('1 Allen Avenue, Ikeja')
+    assert coords == stub_coords('1 Allen Avenue, Ikeja, Lagos, Nigeria')
+    assert client.calls['geocode'] == 3
+    assert cache.lookup('1 allen avenue,  IKEJA') == coords
+
+def test_gives_up_after_the_retry_budget_without_caching(cache, executor):
+    client = FlakyClient(10, googlemaps.exceptions.Timeout())
+    assert geocoder(cache, client, executor, retries=2).geocode('2 Allen Avenue') == DEFAULT_COORDS
+    assert client.calls['geocode'] == 3
+    assert cache.lookup('2 Allen Avenue') is MISSING
+
+def test_does_not_retry_other_errors(cache, executor):
+    client = FlakyClient(1, googlemaps.exceptions.ApiError('REQUEST_DENIED'))
+    assert geocoder(cache, client, executor).geocode('3 Allen Avenue') == DEFAULT_COORDS
+    assert client.calls['geocode'] == 1
+
+def test_concurrent_lookups_share_one_call(cache, executor):
+    client = StubMapsClient(latency=0.05)
+    bulk = geocoder(cache, client, executor)
+    results = []
+    start = threading.Barrier(6)
+    def lookup(address):
+        start.wait()
+        results.append(bulk.geocode(address))
+    threads = [threading.Thread(target=lookup, args=(address,))
+               for address in ['4 Awolowo Road', '4 awolowo road', ' 4  Awolowo Road '] * 2]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert client.calls['geocode'] == 1
+    assert len(set(results)) == 1
+
+def test_geocode_many_calls_once_per_address(cache, executor):
+    client = StubMapsClient()
+    addresses = [f'{i % 7} Opebi Road' for i in range(30)]
+    results = geocoder(cache, client, executor).geocode_many(addresses)
+    assert client.calls['geocode'] == 7
+    assert results == [stub_coords(f'{address}, Lagos, Nigeria') for address in addresses]
+    geocoder(cache, client, executor).geocode_many(addresses)
+    assert client.calls['geocode'] == 7
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+import recommender
+from coverage_grid import build_coverage_grid, open_coverage_grid
+from distance_calculator import calculate_distances
+from recommender import QueryError, coverage_lookup, parse_query, rank
+from route_calculator import snap_coords
+
+CELL_DEGREES = 0.02
+
+@pytest.fixture
+def grid(state, dataset, tmp_path):
+    dataset_file, cache_file = dataset
+    path = build_coverage_grid(dataset_file, cache_file, str(tmp_path / 'hospitals.coverage'),
+                               cell_degrees=CELL_DEGREES, workers=1)
+    grid = state.coverage = open_coverage_grid(path, state)
+    assert grid is not None
+    return grid
+
+def live(state, query, user_coords):
+    grid, state.coverage = state.coverage, None
+    try:
+        return rank(state, [dict(query)], [user_coords], with_routes=False)[0]
+    finally:
+        state.coverage = grid
+
+def random_query(rng, grid):
+    return parse_query({
+        'service': str(rng.choice([service.title() for service in grid.services])),
+        'cost_pref': str(rng.choice(['Low', 'Medium', 'High'])),
+        'quality_pref': str(rng.choice(['Low', 'Medium', 'High'])), 'k': str(rng.integers(1, 11)), 'rerank': '0',
+    })
+
+def test_grid_answers_are_the_cell_centre_ranking(state, grid):
+    rng = np.random.default_rng(5)
+    (south, west), (north, east) = grid.bounds()
+    hits = 0
+    for _ in range(200):
+        user_coords = (float(rng.uniform(south, north)), float(rng.uniform(west, east)))
+        query = random_query(rng, grid)
+        result = rank(state, [dict(query)], [user_coords], with_routes=False)[0]
+        if coverage_lookup(state, query, user_coords) is None:
+            expected = live(state, query, user_coords)
+            if isinstance(expected, QueryError):
+                assert isinstance(result, QueryError) and result.message == expected.message
+            else:
+                assert result.equals(expected)
+            continue
+        hits += 1
+        centre = tuple(index * CELL_DEGREES for index in snap_coords(user_coords, CELL_DEGREES))
+        expected = live(state, query, centre)
+        assert list(result['Name']) == list(expected['Name'])
+        np.testing.assert_array_equal(result['Recommendation_Score'], expected['Recommendation_Score'])
+        # Distances are the user's own, and all within the radius
+        _, distances = calculate_distances(user_coords, np.array(list(result['Coordinates'])))
+        np.testing.assert_array_equal(result['Distance_km'], distances)
+        assert (result['Distance_km'] <= query['radius_km']).all()
+    assert hits > 100
+
+def test_grid_hits_skip_candidate_search_and_scoring(state, grid, monkeypatch):
+    rng = np.random.default_rng(6)
+    (south, west), (north, east) = grid.bounds()
+    hits = []
+    while len(hits) < 20:
+        user_coords = (float(rng.uniform(south, north)), float(rng.uniform(west, east)))
+        query = random_query(rng, grid)
+        if coverage_lookup(state, query, user_coords) is not None:
+            hits.append((query, user_coords))
+    expected = rank(state, [query for query, _ in hits], [user_coords for _, user_coords in hits], with_routes=False)
+
+    def unreachable(*args, **kwargs):
+        raise AssertionError('a grid hit was searched or scored live')
+    monkeypatch.setattr(recommender, 'find_candidates', unreachable)
+    monkeypatch.setattr(state.store, 'activations', unreachable)
+    results = rank(state, [query for query, _ in hits], [user_coords for _, user_coords in hits], with_routes=False)
+    for result, answer in zip(results, expected):
+        assert result.equals(answer)
+
+def test_grid_leaves_other_queries_to_live_scoring(state, grid):
+    service = next(iter(grid.services))
+    inside = grid.bounds()[0][0] + CELL_DEGREES, grid.bounds()[0][1] + CELL_DEGREES
+    assert grid.lookup(parse_query({'service': service}), inside) is not None
+    assert grid.lookup(parse_query({'service': service, 'nearest': '3'}), inside) is None
+    assert grid.lookup(parse_query({'service': service, 'radius_km': '5'}), inside) is None
+    assert grid.lookup(parse_query({'service': service, 'k': '20'}), inside) is None
+    assert grid.lookup(parse_query({'service': service, 'rerank': '1'}), inside) is None
+    assert grid.lookup(parse_query({'service': 'no such service'}), inside) is None
+    assert grid.lookup(parse_query({'service': service}), (7.5, 3.4)) is None
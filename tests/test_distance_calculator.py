@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+from geopy.distance import geodesic
+from distance_calculator import calculate_distance, calculate_distances, haversine_km, vincenty_km
+
+USER_COORDS = (6.55, 3.36)
+
+def test_vincenty_matches_geodesic():
+    rng = np.random.default_rng(11)
+    # City distances, the same point, a pole, across the antimeridian and nearly antipodal pairs
+    origins = [USER_COORDS, (0.0, 0.0), (-33.9, 18.4), (89.9, 10.0)]
+    lats = np.concatenate([rng.uniform(6.3, 6.8, 200), rng.uniform(-90, 90, 200), [6.55, 90.0, -6.55, 0.0, 0.5]])
+    lons = np.concatenate([rng.uniform(3.0, 3.7, 200), rng.uniform(-180, 180, 200), [3.36, 0.0, -176.64, 179.7, 179.5]])
+    for lat, lon in origins:
+        expected = [geodesic((lat, lon), point).km for point in zip(lats, lons)]
+        np.testing.assert_allclose(vincenty_km(lat, lon, lats, lons), expected, rtol=0, atol=1e-6)
+
+def test_vectorized_distances_match_the_scalar_version():
+    rng = np.random.default_rng(12)
+    coords = np.column_stack([rng.uniform(6.3, 6.8, 100), rng.uniform(3.0, 3.7, 100)])
+    coords[[4, 40]] = np.nan
+    proximity, distances = calculate_distances(USER_COORDS, coords)
+    for i, point in enumerate(coords):
+        expected = calculate_distance(USER_COORDS, None if np.isnan(point).any() else tuple(point))
+        assert proximity[i] == pytest.approx(expected[0], abs=1e-9)
+        # Within a millimetre
+        assert distances[i] == pytest.approx(expected[1], abs=1e-6)
+
+    _, fast = calculate_distances(USER_COORDS, coords, method='haversine')
+    valid = np.isfinite(distances)
+    assert np.array_equal(np.isfinite(fast), valid)
+    np.testing.assert_allclose(fast[valid], haversine_km(*USER_COORDS, coords[valid, 0], coords[valid, 1]))
+    # Haversine is within its stated relative error of the ellipsoid
+    assert np.all(np.abs(fast[valid] - distances[valid]) <= 0.006 * distances[valid])
+    assert np.all(np.isinf(calculate_distances(None, coords)[1]))
+    with pytest.raises(ValueError):
+        calculate_distances(USER_COORDS, coords, method='flat')
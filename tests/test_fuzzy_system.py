@@ -0,0 +1,131 @@
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+import fuzzy_system
+from distance_calculator import calculate_distance
+from fuzzy_system import (
+    SCORE_TOLERANCE, compute_recommendation_score, compute_recommendation_scores, compute_service_match,
+    defuzzify_centroid, fuzzify, get_fuzzy_model, load_fuzzy_model, map_cost_rating, map_preference_to_value,
+    rule_activations, setup_fuzzy_system, top_k_scores
+)
+
+USER_COORDS = (6.55, 3.36)
+
+def random_rows(rng, size):
+    services = ['Surgery, Dental', 'General Medicine', 'Pediatrics, Surgery', 'Dental', 'Maternity']
+    return [{
+        'Name': f'Hospital {i}',
+        'Services': str(rng.choice(services)),
+        'Cost Level': str(rng.choice(['Low', 'Medium', 'High', 'Premium'])),
+        'Quality Score': float(np.round(rng.uniform(0, 5), 1)),
+        'User Rating': float(np.round(rng.uniform(0, 5), 1)),
+        'Coordinates': (float(rng.uniform(6.42, 6.70)), float(rng.uniform(3.20, 3.60))),
+    } for i in range(size)]
+
+def random_activations(model, rng, size):
+    memberships = {
+        'cost': fuzzify(model, 'cost', rng.choice([1.0, 2.0, 3.0], size)),
+        'quality': fuzzify(model, 'quality', np.round(rng.uniform(0, 5, size), 1)),
+        'user_rating': fuzzify(model, 'user_rating', np.round(rng.uniform(0, 5, size), 1)),
+        'service_match': fuzzify(model, 'service_match', rng.choice([0.5, 1.0], size)),
+        'proximity': fuzzify(model, 'proximity', rng.uniform(0, 1, size)),
+        'user_cost_pref': fuzzify(model, 'user_cost_pref', np.full(size, 0.33)),
+        'user_quality_pref': fuzzify(model, 'user_quality_pref', np.full(size, 1.0)),
+    }
+    return rule_activations(model, memberships, size)
+
+def test_batch_scores_match_skfuzzy():
+    rng = np.random.default_rng(0)
+    rows = random_rows(rng, 150)
+    simulation = setup_fuzzy_system()
+    for service, cost_pref, quality_pref in [('Surgery', 'Low', 'High'), ('general', 'High', 'Low'),
+                                             ('Dental care', 'Medium', 'Medium')]:
+        cost_value, quality_value = map_preference_to_value(cost_pref), map_preference_to_value(quality_pref)
+        expected = [compute_recommendation_score(row, service, cost_value, quality_value, USER_COORDS, simulation)
+                    for row in rows]
+        assert max(expected) > 0
+        scores = compute_recommendation_scores(
+            np.array([map_cost_rating(row['Cost Level']) for row in rows]),
+            np.array([row['Quality Score'] for row in rows]),
+            np.array([row['User Rating'] for row in rows]),
+            np.array([compute_service_match(service, row['Services']) for row in rows]),
+            np.array([calculate_distance(USER_COORDS, row['Coordinates'])[0] for row in rows]),
+            cost_value, quality_value
+        )
+        np.testing.assert_allclose(scores, expected, rtol=0, atol=SCORE_TOLERANCE)
+
+def test_top_k_matches_a_full_stable_sort():
+    model = get_fuzzy_model()
+    rng = np.random.default_rng(1)
+    activations = random_activations(model, rng, 400)
+    # Repeated hospitals tie exactly; ties must keep the lower position first
+    activations = {label: np.concatenate([values, values[:50]]) for label, values in activations.items()}
+    scores = defuzzify_centroid(model, activations)
+    order = np.argsort(-scores, kind='stable')
+    order = order[scores[order] > 0]
+    for k in (1, 5, 10, 64, 300, 1000):
+        positions, top_scores = top_k_scores(model, activations, k)
+        np.testing.assert_array_equal(positions, order[:k])
+        np.testing.assert_array_equal(top_scores, scores[order[:k]])
+
+def test_top_k_of_nothing_is_empty():
+    model = get_fuzzy_model()
+    activations = random_activations(model, np.random.default_rng(2), 0)
+    positions, scores = top_k_scores(model, activations, 5)
+    assert positions.size == 0 and scores.size == 0
+
+@pytest.fixture
+def model_file(tmp_path, monkeypatch):
+    # A private artifact path, with the process-wide model forgotten before and after
+    monkeypatch.setattr(fuzzy_system, '_fuzzy_model', None)
+    return str(tmp_path / 'fuzzy_model.npz')
+
+def reload_model(monkeypatch, path):
+    monkeypatch.setattr(fuzzy_system, '_fuzzy_model', None)
+    return get_fuzzy_model(path)
+
+def test_compiled_model_is_reused_until_the_definitions_change(model_file, monkeypatch):
+    compiled = get_fuzzy_model(model_file)
+    assert os.path.exists(model_file)
+
+    compile_model = fuzzy_system.compile_fuzzy_model
+
+    def no_compile():
+        raise AssertionError('compiled again')
+    monkeypatch.setattr(fuzzy_system, 'compile_fuzzy_model', no_compile)
+    loaded = reload_model(monkeypatch, model_file)
+    assert loaded['fingerprint'] == compiled['fingerprint'] and loaded['rules'] == compiled['rules']
+    rng = np.random.default_rng(13)
+    activations = random_activations(compiled, rng, 200)
+    np.testing.assert_array_equal(defuzzify_centroid(loaded, activations), defuzzify_centroid(compiled, activations))
+
+    # Editing a term's parameters changes the fingerprint, so the artifact is rebuilt
+    monkeypatch.setattr(fuzzy_system, 'compile_fuzzy_model', compile_model)
+    monkeypatch.setattr(fuzzy_system, '_fuzzy_model', None)
+    variables = dict(fuzzy_system.FUZZY_VARIABLES)
+    universe, terms = variables['quality']
+    variables['quality'] = (universe, dict(terms, high=[4.0, 4.5, 5, 5]))
+    monkeypatch.setattr(fuzzy_system, 'FUZZY_VARIABLES', variables)
+    assert load_fuzzy_model(model_file) is None
+    rebuilt = get_fuzzy_model(model_file)
+    assert rebuilt['fingerprint'] != compiled['fingerprint']
+    assert fuzzify(rebuilt, 'quality', np.array([4.2]))['high'][0] > fuzzify(compiled, 'quality', np.array([4.2]))['high'][0]
+    assert reload_model(monkeypatch, model_file)['fingerprint'] == rebuilt['fingerprint']
+
+def test_unreadable_model_is_rebuilt(model_file, capsys):
+    with open(model_file, 'wb') as f:
+        f.write(b'not a zip file')
+    assert load_fuzzy_model(model_file) is None
+    assert 'Ignoring unreadable compiled fuzzy model' in capsys.readouterr().out
+    model = get_fuzzy_model(model_file)
+    assert load_fuzzy_model(model_file)['fingerprint'] == model['fingerprint']
+
+def test_entry_points_import_without_heavy_libraries():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    heavy = ('matplotlib', 'folium', 'skfuzzy', 'googlemaps')
+    for module in ('main', 'api'):
+        code = f"import sys, {module}; print(','.join(m for m in {heavy!r} if m in sys.modules))"
+        result = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True, check=True)
+        assert result.stdout.strip() == '', f'{module} imported {result.stdout.strip()}'
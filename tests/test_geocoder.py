@@ -0,0 +1,42 @@
+import pandas as pd
+from geocoder import MISSING, GeocodeCache
+
+def test_entries_persist_across_instances(tmp_path):
+    path = str(tmp_path / 'coordinates.db')
+    cache = GeocodeCache(path, legacy_csv=None)
+    cache.store('12 Awolowo Road, Ikoyi', (6.45, 3.43))
+    cache.store('Nowhere Street', None)
+    assert cache.lookup('12  awolowo road, IKOYI') == (6.45, 3.43)
+    assert cache.flush() == 2 and cache.flush() == 0
+
+    # Another worker's connection sees both, the failure as a cached None
+    other = GeocodeCache(path, legacy_csv=None)
+    assert len(other) == 2
+    assert other.lookup('12 Awolowo Road, Ikoyi') == (6.45, 3.43)
+    assert other.lookup('Nowhere Street') is None and 'Nowhere Street' in other
+    assert other.lookup('1 Unknown Way') is MISSING and '1 Unknown Way' not in other
+    other.store('Nowhere Street', (6.5, 3.3))
+    other.flush()
+    fresh = GeocodeCache(path, legacy_csv=None)
+    fresh.preload(['Nowhere Street', '12 Awolowo Road, Ikoyi', '1 Unknown Way'])
+    assert fresh._entries == {'nowhere street': (6.5, 3.3), '12 awolowo road, ikoyi': (6.45, 3.43)}
+
+def test_imports_the_legacy_csv_once(tmp_path, capsys):
+    legacy = str(tmp_path / 'hospital_coordinates.csv')
+    pd.DataFrame({
+        'Address': ['12 Awolowo Road, Ikoyi', 'Nowhere Street', 'Blank Street', 'Garbled Street'],
+        'Coordinates': ['(6.45, 3.43)', 'None', None, 'somewhere'],
+    }).to_csv(legacy, index=False)
+    path = str(tmp_path / 'coordinates.db')
+    cache = GeocodeCache(path, legacy_csv=legacy)
+    assert 'Imported 3 cached coordinates' in capsys.readouterr().out
+    assert cache.lookup('12 Awolowo Road, Ikoyi') == (6.45, 3.43)
+    assert cache.lookup('Nowhere Street') is None and cache.lookup('Blank Street') is None
+    assert cache.lookup('Garbled Street') is MISSING
+
+    # Not again over a cache that already has entries
+    cache.store('12 Awolowo Road, Ikoyi', (6.46, 3.44))
+    cache.flush()
+    again = GeocodeCache(path, legacy_csv=legacy)
+    assert 'Imported' not in capsys.readouterr().out
+    assert again.lookup('12 Awolowo Road, Ikoyi') == (6.46, 3.44)
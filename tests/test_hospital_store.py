@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+from fuzzy_system import SCORE_TOLERANCE, compute_recommendation_scores, map_cost_rating
+from hospital_store import build_hospital_store
+
+def random_frame(rng, size):
+    return pd.DataFrame({
+        'Cost Level': rng.choice(['Low', 'Medium', 'High', 'Premium'], size),
+        'Quality Score': np.round(rng.uniform(0, 5, size), 1),
+        'User Rating': rng.uniform(0, 5, size),
+        'Coordinates': [(float(lat), float(lon)) for lat, lon in
+                        zip(rng.uniform(6.42, 6.70, size), rng.uniform(3.20, 3.60, size))],
+    })
+
+def test_store_scores_match_the_batch_path():
+    rng = np.random.default_rng(3)
+    data = random_frame(rng, 500)
+    store = build_hospital_store(data)
+    service_match = rng.choice([0.0, 0.5, 1.0], len(data))
+    proximity = rng.uniform(0, 1, len(data))
+    cost = data['Cost Level'].map(map_cost_rating).to_numpy()
+    quality, rating = data['Quality Score'].to_numpy(), data['User Rating'].to_numpy()
+    for cost_pref, quality_pref in [(0.0, 1.0), (0.5, 0.5), (1.0, 0.0)]:
+        expected = compute_recommendation_scores(cost, quality, rating, service_match, proximity, cost_pref, quality_pref)
+        np.testing.assert_allclose(store.score(service_match, proximity, cost_pref, quality_pref),
+                                   expected, rtol=0, atol=SCORE_TOLERANCE)
+        idx = rng.choice(len(data), 50, replace=False)
+        np.testing.assert_allclose(store.score(service_match[idx], proximity[idx], cost_pref, quality_pref, idx=idx),
+                                   expected[idx], rtol=0, atol=SCORE_TOLERANCE)
+
+def test_updated_rows_score_like_fresh_ones():
+    rng = np.random.default_rng(4)
+    data = random_frame(rng, 200)
+    store = build_hospital_store(data).copy()
+    store.update_row(5, quality=4.3, user_rating=1.23456789)
+    i = store.append_row(map_cost_rating('High'), 2.2, 3.3, 6.5, 3.4)
+    data.loc[5, ['Quality Score', 'User Rating']] = [4.3, 1.23456789]
+    data.loc[i] = {'Cost Level': 'High', 'Quality Score': 2.2, 'User Rating': 3.3, 'Coordinates': (6.5, 3.4)}
+    fresh = build_hospital_store(data)
+    service_match, proximity = np.full(len(data), 1.0), rng.uniform(0, 1, len(data))
+    np.testing.assert_allclose(store.score(service_match, proximity, 0.5, 1.0),
+                               fresh.score(service_match, proximity, 0.5, 1.0), rtol=0, atol=SCORE_TOLERANCE)
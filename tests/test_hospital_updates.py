@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+import pytest
+from app_state import StateManager, build_app_state
+from hospital_updates import HOSPITAL_FIELDS, catch_up, hospital_record, replay_change_log
+from recommender import parse_query, rank
+from snapshot import build_snapshot
+
+NEW_HOSPITAL = {'Full Address': '99 Herbert Macaulay Way, Yaba', 'Services': 'Xenotology, Surgery',
+                'Cost Level': 'low', 'User Rating': 4.8}
+
+@pytest.fixture
+def dataset_file(dataset):
+    # The synthetic dataset with a column the recommender does not read and a row it skips
+    dataset_file, _ = dataset
+    raw = pd.read_csv(dataset_file, dtype=str, keep_default_na=False)
+    raw['Phone'] = [f'0800{i:04d}' for i in range(len(raw))]
+    raw.loc[len(raw)] = {**dict.fromkeys(raw.columns, ''), 'Name': 'No Cost Clinic', 'Services': 'Dental'}
+    raw.to_csv(dataset_file, index=False)
+    return dataset_file
+
+@pytest.fixture
+def manager(dataset_file, dataset, stub_client):
+    return StateManager(dataset_file, dataset[1], check_interval=0, client=stub_client)
+
+def active_rows(state):
+    ids = [i for i in range(len(state.store)) if i not in state.retired]
+    frame = state.rows(ids)[HOSPITAL_FIELDS + ['Coordinates']]
+    return frame.sort_values('Name').reset_index(drop=True)
+
+def ranked(state):
+    rng = np.random.default_rng(7)
+    results = []
+    for service in ('Surgery', 'Xenotology', 'Dental', 'General Medicine'):
+        for _ in range(5):
+            user_coords = (float(rng.uniform(6.45, 6.65)), float(rng.uniform(3.25, 3.55)))
+            query = parse_query({'service': service, 'radius_km': '15', 'k': '5', 'rerank': '0'})
+            result = rank(state, [query], [user_coords], with_routes=False)[0]
+            results.append(getattr(result, 'message', None) or list(zip(result['Name'], result['Recommendation_Score'])))
+    return results
+
+def make_changes(manager):
+    manager.apply('add', 'Brand New Clinic', NEW_HOSPITAL)
+    manager.apply('update', 'Synthetic Hospital 7', {'Full Address': '1 New Road, Ikoyi', 'Quality Score': 4.5})
+    manager.apply('update', 'Synthetic Hospital 8', {'Name': 'Hospital Eight', 'Cost Level': 'Premium'})
+    manager.apply('retire', 'Synthetic Hospital 9')
+    return manager.get()
+
+def test_add_update_and_retire(manager, stub_client):
+    before = manager.get()
+    before_rows = active_rows(before)
+    state, i = manager.apply('add', 'Brand New Clinic', NEW_HOSPITAL)
+    assert i == len(before.store)
+    record = hospital_record(state, i)
+    assert record['Cost Level'] == 'Low' and record['User Rating'] == 4.8 and record['Quality Score'] == 3.1
+    assert any('Brand New Clinic' in str(result) for result in ranked(state))
+
+    calls = stub_client.calls['geocode']
+    state, j = manager.apply('update', 'Synthetic Hospital 7', {'User Rating': 1.5, 'Services': 'Xenotology'})
+    assert stub_client.calls['geocode'] == calls
+    assert hospital_record(state, j)['User Rating'] == 1.5 and state.store.user_rating[j] == 1.5
+    assert j in state.service_index.match('xenotology')[0]
+    state, j = manager.apply('update', 'Synthetic Hospital 7', {'Full Address': '1 New Road, Ikoyi'})
+    assert stub_client.calls['geocode'] == calls + 1
+    assert tuple(state.coordinates[j]) == tuple(hospital_record(state, j)['Coordinates'])
+
+    state, gone = manager.apply('retire', 'Brand New Clinic')
+    assert gone is None and i in state.retired
+    assert not any('Brand New Clinic' in str(result) for result in ranked(state))
+    # Requests still holding the first state never see a change
+    assert before.revision == 0 and active_rows(before).equals(before_rows)
+
+def test_snapshot_updates_leave_the_frame_unloaded(dataset_file, dataset, stub_client, tmp_path):
+    snapshot_file = str(tmp_path / 'hospitals.snap')
+    base = build_app_state(dataset_file, dataset[1], client=stub_client)
+    build_snapshot(base.data, base.coordinates, base.service_index, base.spatial_index, base.store, snapshot_file,
+                   source_file=dataset_file)
+    manager = StateManager(snapshot_file, dataset[1], check_interval=0, client=stub_client)
+    state, i = manager.apply('update', 'Synthetic Hospital 3', {'User Rating': 0.5})
+    assert state.snapshot is not None and state._data is None
+    assert hospital_record(state, i)['User Rating'] == 0.5
+
+def test_geocodes_outside_the_lock(manager, stub_client):
+    geocode = stub_client.geocode
+
+    def checked_geocode(address):
+        assert not manager._lock.locked()
+        return geocode(address)
+    stub_client.geocode = checked_geocode
+    manager.get()
+    _, i = manager.apply('add', 'Brand New Clinic', NEW_HOSPITAL)
+    assert i is not None
+
+def test_replaying_the_log_is_idempotent(manager, dataset_file, dataset, stub_client):
+    state = make_changes(manager)
+    fresh = build_app_state(dataset_file, dataset[1], client=stub_client)
+    replay_change_log(fresh, manager.change_log)
+    assert active_rows(fresh).equals(active_rows(state))
+    assert ranked(fresh) == ranked(state)
+    # Replayed again over a state it has already been applied to, nothing changes
+    replay_change_log(fresh, manager.change_log)
+    assert len(fresh.store) == len(state.store)
+    assert active_rows(fresh).equals(active_rows(state))
+    assert ranked(fresh) == ranked(state)
+
+def test_compact_keeps_what_the_recommender_does_not_read(manager, dataset_file):
+    original = pd.read_csv(dataset_file, dtype=str, keep_default_na=False)
+    state = make_changes(manager)
+    expected, expected_ranking = active_rows(state), ranked(state)
+    assert manager.compact() == len(expected)
+
+    compacted = pd.read_csv(dataset_file, dtype=str, keep_default_na=False)
+    assert list(compacted.columns) == list(original.columns)
+    assert 'No Cost Clinic' in set(compacted['Name'])
+    assert 'Synthetic Hospital 9' not in set(compacted['Name'])
+    # Values the loader fills in are left missing, for the change as for the base rows
+    added = compacted[compacted['Name'] == 'Brand New Clinic'].iloc[0]
+    assert added['Quality Score'] == '' and added['Cost Level'] == 'Low' and added['Phone'] == ''
+    changed = ['Synthetic Hospital 7', 'Synthetic Hospital 8', 'Hospital Eight', 'Synthetic Hospital 9', 'Brand New Clinic']
+    untouched = original[~original['Name'].isin(changed)].reset_index(drop=True)
+    assert compacted[~compacted['Name'].isin(changed)].reset_index(drop=True).equals(untouched)
+
+    assert not manager.change_log.size()
+    reloaded = manager.get()
+    assert reloaded.revision == 0 and reloaded.pending_changes == 0
+    assert active_rows(reloaded).equals(expected)
+    assert ranked(reloaded) == expected_ranking
+
+def test_catch_up_after_compaction(manager, dataset_file, dataset, stub_client):
+    other = StateManager(dataset_file, dataset[1], check_interval=0, client=stub_client)
+    make_changes(manager)
+    behind = other.get()
+    assert behind.revision == 4
+    manager.compact()
+    manager.apply('update', 'Hospital Eight', {'User Rating': 2.0})
+    expected = manager.get()
+    # The log it had read up to is gone, so the state cannot be brought up to date in place
+    assert catch_up(behind, other.change_log) is None
+    state = other.get()
+    assert state is not behind and state.revision == 1
+    assert active_rows(state).equals(active_rows(expected))
+    assert ranked(state) == ranked(expected)
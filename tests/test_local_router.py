@@ -0,0 +1,70 @@
+import heapq
+import numpy as np
+import pandas as pd
+import pytest
+from local_router import LocalRoutingEngine, build_road_graph
+
+@pytest.fixture
+def engine(tmp_path):
+    # A jittered street grid with mixed speeds, some one-way streets and a node no road reaches
+    rng = np.random.default_rng(5)
+    size = 15
+    nodes = pd.DataFrame({
+        'id': np.arange(size * size + 1) + 1000,
+        'lat': np.append(6.45 + np.repeat(np.arange(size), size) * 0.004 + rng.uniform(-0.001, 0.001, size * size), 6.3),
+        'lon': np.append(3.30 + np.tile(np.arange(size), size) * 0.004 + rng.uniform(-0.001, 0.001, size * size), 3.1),
+    })
+    edges = []
+    for i in range(size * size):
+        for j in (i + 1 if (i + 1) % size else None, i + size if i + size < size * size else None):
+            if j is None:
+                continue
+            edges.append({'from': 1000 + i, 'to': 1000 + j, 'length_m': float(rng.uniform(350, 600)),
+                          'speed_kph': float(rng.choice([20, 30, 50, 80])), 'name': f'Street {i % 7}',
+                          'oneway': str(rng.choice(['yes', 'no', 'no', 'no']))})
+    pd.DataFrame(nodes).to_csv(tmp_path / 'nodes.csv', index=False)
+    pd.DataFrame(edges).to_csv(tmp_path / 'edges.csv', index=False)
+    build_road_graph(tmp_path / 'nodes.csv', tmp_path / 'edges.csv', tmp_path / 'graph.npz')
+    return LocalRoutingEngine(tmp_path / 'graph.npz')
+
+def dijkstra(engine, source):
+    best = {source: 0.0}
+    heap = [(0.0, source)]
+    while heap:
+        cost, node = heapq.heappop(heap)
+        if cost > best[node]:
+            continue
+        for edge in range(engine.indptr[node], engine.indptr[node + 1]):
+            neighbour, new_cost = engine.indices[edge], cost + engine.time_s[edge]
+            if new_cost < best.get(neighbour, float('inf')):
+                best[neighbour] = new_cost
+                heapq.heappush(heap, (new_cost, neighbour))
+    return best
+
+def test_a_star_matches_dijkstra(engine):
+    rng = np.random.default_rng(6)
+    unreachable = len(engine.indptr) - 2
+    for source in rng.choice(unreachable, 8, replace=False):
+        best = dijkstra(engine, int(source))
+        for target in [*rng.choice(unreachable, 15, replace=False), unreachable]:
+            edges = engine.shortest_path(int(source), int(target))
+            if int(target) not in best:
+                assert edges is None
+                continue
+            # A connected path from source to target, as fast as the exhaustive search
+            nodes = [int(source)] + [engine.indices[edge] for edge in edges]
+            assert all(engine.edge_source[edge] == node for edge, node in zip(edges, nodes))
+            assert nodes[-1] == target
+            assert sum(engine.time_s[edge] for edge in edges) == pytest.approx(best[int(target)], rel=1e-6)
+
+def test_travel_times_match_dijkstra(engine):
+    source = 17
+    best = dijkstra(engine, source)
+    user_coords = (engine.node_lat[source], engine.node_lon[source])
+    targets = list(range(0, len(engine.indptr) - 1, 11))
+    times = engine.travel_times(user_coords, [(engine.node_lat[t], engine.node_lon[t]) for t in targets])
+    for target, time in zip(targets, times):
+        if target not in best:
+            assert time is None
+        else:
+            assert time[0] == pytest.approx(best[target], rel=1e-9)
@@ -0,0 +1,80 @@
+import pytest
+import api
+import metrics
+
+@pytest.fixture(autouse=True)
+def fresh_metrics(monkeypatch):
+    monkeypatch.setattr(metrics, 'enabled', True)
+    for name in ('_counters', '_gauges', '_histograms'):
+        monkeypatch.setattr(metrics, name, {})
+
+def samples(text):
+    # {sample with labels: value} of the exposition, comments skipped
+    return dict(line.rsplit(' ', 1) for line in text.splitlines() if not line.startswith('#'))
+
+def test_renders_counters_gauges_and_labels():
+    metrics.increment('hospital_google_api_calls_total', api='geocode')
+    metrics.increment('hospital_google_api_calls_total', 2, api='geocode')
+    metrics.increment('hospital_http_requests_total', endpoint='say "hi"\\\n', status=200)
+    metrics.set_gauge('hospital_region_shards_loaded', 3)
+    metrics.set_gauge('hospital_region_shards_loaded', 2)
+    text = metrics.render({'hospital_route_cache_entries': ('gauge', 'Entries in the route cache.', 7)})
+    assert '# HELP hospital_google_api_calls_total Google Maps API calls, by API.' in text
+    assert '# TYPE hospital_google_api_calls_total counter' in text
+    assert '# TYPE hospital_route_cache_entries gauge' in text
+    assert samples(text) == {
+        'hospital_http_requests_total{endpoint="say \\"hi\\"\\\\\\n",status="200"}': '1',
+        'hospital_google_api_calls_total{api="geocode"}': '3',
+        'hospital_region_shards_loaded': '2',
+        'hospital_route_cache_entries': '7',
+    }
+
+def test_renders_cumulative_histograms():
+    for seconds in (0.0005, 0.001, 0.02, 0.02, 30.0):
+        metrics.observe('hospital_stage_duration_seconds', seconds, stage='score')
+    rendered = samples(metrics.render())
+    bucket = 'hospital_stage_duration_seconds_bucket{{stage="score",le="{}"}}'.format
+    assert rendered[bucket('0.001')] == '2'
+    assert rendered[bucket('0.01')] == '2'
+    assert rendered[bucket('0.025')] == '4'
+    assert rendered[bucket('10')] == '4'
+    assert rendered[bucket('+Inf')] == '5'
+    assert rendered['hospital_stage_duration_seconds_count{stage="score"}'] == '5'
+    assert float(rendered['hospital_stage_duration_seconds_sum{stage="score"}']) == pytest.approx(30.0415)
+
+def test_request_timings_collect_stages_on_this_thread():
+    with metrics.timed('outside'):
+        pass
+    with metrics.request_timings() as timings:
+        with metrics.timed('load'):
+            pass
+        with metrics.timed('score'):
+            pass
+        with metrics.timed('score'):
+            pass
+    assert set(timings) == {'load', 'score', 'total'}
+    assert timings['total'] >= timings['load'] + timings['score']
+    with metrics.request_timings(False) as timings:
+        assert timings is None
+    assert samples(metrics.render())['hospital_stage_duration_seconds_count{stage="score"}'] == '2'
+
+def test_disabled_metrics_record_nothing(monkeypatch):
+    monkeypatch.setattr(metrics, 'enabled', False)
+    metrics.increment('hospital_google_api_calls_total', api='geocode')
+    metrics.observe('hospital_stage_duration_seconds', 0.1, stage='score')
+    with metrics.google_call('directions'):
+        pass
+    with metrics.request_timings() as timings:
+        with metrics.timed('score'):
+            pass
+    assert 'score' in timings
+    assert samples(metrics.render()) == {}
+
+def test_metrics_endpoint():
+    client = api.app.test_client()
+    client.get('/cache_stats')
+    response = client.get('/metrics')
+    assert response.status_code == 200 and response.mimetype == 'text/plain'
+    rendered = samples(response.get_data(as_text=True))
+    assert rendered['hospital_http_requests_total{endpoint="cache_stats",status="200"}'] == '1'
+    assert 'hospital_result_cache_hits_total' in rendered and 'hospital_artifact_cache_bytes' in rendered
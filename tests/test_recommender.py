@@ -0,0 +1,14 @@
+import numpy as np
+import recommender
+from recommender import parse_query, rank
+
+USER_COORDS = (6.55, 3.36)
+
+def test_rerank_keeps_the_fuzzy_ranking_when_no_drive_score_is_positive(state, monkeypatch):
+    query = parse_query({'service': 'Surgery', 'k': 5, 'rerank': 'false'})
+    expected = rank(state, [query], [USER_COORDS], with_routes=False)[0]
+    monkeypatch.setattr(recommender, 'get_travel_times', lambda user_coords, destinations: [(36000, 500000)] * len(destinations))
+    monkeypatch.setattr(state.store, 'score', lambda service_match, *args, **kwargs: np.zeros(len(service_match)))
+    reranked = rank(state, [dict(query, rerank=True)], [USER_COORDS], with_routes=False)[0]
+    assert list(reranked['Name']) == list(expected['Name'])
+    np.testing.assert_array_equal(reranked['Recommendation_Score'], expected['Recommendation_Score'])
@@ -0,0 +1,43 @@
+import pytest
+from bulk_geocoder import GEOCODE_SUFFIX
+from recommender import parse_query, rank
+from regions import Region, RegionRegistry, RegionShards
+
+USER_COORDS = (6.55, 3.36)
+
+@pytest.fixture
+def shards(dataset, stub_client):
+    # Three regions over the same synthetic hospitals, one per box
+    dataset_file, cache_file = dataset
+    boxes = {'north': ((7.0, 3.0), (7.5, 3.5)), 'lagos': ((6.35, 2.70), (6.75, 4.40)), 'east': ((6.0, 5.0), (6.5, 5.5))}
+    regions = [Region(name, bbox, bbox[0], GEOCODE_SUFFIX, dataset_file, cache_file) for name, bbox in boxes.items()]
+    return RegionShards(RegionRegistry(regions, 'lagos'), client=stub_client)
+
+def loaded(shards):
+    return set(shards.stats()['loaded'])
+
+def test_evicts_the_least_recently_used_shard(shards):
+    north, lagos, east = shards.registry.regions.values()
+    held = shards.states_for(USER_COORDS, 10.0, lagos)[0]
+    shards.memory_budget = 2.5 * held.memory_bytes
+    shards.states_for(USER_COORDS, 10.0, north)
+    shards.states_for(USER_COORDS, 10.0, east)
+    assert loaded(shards) == {'north', 'east'} and shards.evictions == 1
+    # A request still holding an unloaded shard's state finishes with it
+    query = parse_query({'service': 'Surgery', 'radius_km': '15', 'k': '3', 'rerank': '0'})
+    assert len(rank(held, [query], [USER_COORDS], with_routes=False)[0]) == 3
+
+    shards.states_for(USER_COORDS, 10.0, north)
+    shards.states_for(USER_COORDS, 10.0, lagos)
+    assert loaded(shards) == {'north', 'lagos'} and shards.evictions == 2
+    stats = shards.stats()
+    assert sum(shard['memory_bytes'] for shard in stats['loaded'].values()) <= shards.memory_budget
+
+def test_keeps_the_shards_a_request_needs(shards):
+    shards.memory_budget = 1
+    states = shards.states(list(shards.registry.regions.values()))
+    assert all(state is not None for state in states)
+    assert loaded(shards) == {'north', 'lagos', 'east'} and shards.evictions == 0
+    # The next request drops the others, however over budget its own shard leaves it
+    shards.states([shards.registry.get('east')])
+    assert loaded(shards) == {'east'} and shards.evictions == 2
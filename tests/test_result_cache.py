@@ -0,0 +1,55 @@
+import threading
+import time
+from recommender import parse_query, rank_shards, ranked_recommendations
+from result_cache import ResultCache
+
+USER_COORDS = (6.5512, 3.3647)
+
+def test_concurrent_identical_misses_compute_once(state):
+    cache = ResultCache()
+    key = cache.key([state], parse_query({'service': 'Surgery'}), USER_COORDS)
+    waiting = 7
+    computed = []
+
+    def compute():
+        computed.append(threading.current_thread().name)
+        # Holds the computation open until every other request is waiting on it
+        deadline = time.monotonic() + 5
+        while cache.stats()['coalesced'] < waiting and time.monotonic() < deadline:
+            time.sleep(0.001)
+        return object()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute([state], key, compute)))
+               for _ in range(waiting + 1)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(computed) == 1
+    assert len(results) == waiting + 1 and all(result is results[0] for result in results)
+    assert cache.stats() == {'size': 1, 'hits': 0, 'misses': 1, 'coalesced': waiting}
+
+def test_cached_results_are_ranked_from_the_user(state):
+    cache = ResultCache()
+    query = parse_query({'service': 'Surgery', 'k': '5'})
+    cached = ranked_recommendations([state], query, USER_COORDS, cache)
+    live = rank_shards([state], query, USER_COORDS, with_routes=False)
+    columns = ['Name', 'Distance_km', 'Recommendation_Score']
+    assert cached[columns].equals(live[columns])
+    assert ranked_recommendations([state], query, USER_COORDS, cache) is cached
+    assert cache.stats()['hits'] == 1
+
+def test_state_changes_invalidate_entries(state):
+    cache = ResultCache()
+    query = parse_query({'service': 'Surgery', 'k': '5'})
+    first = ranked_recommendations([state], query, USER_COORDS, cache)
+    # An admin change bumps the revision of the copy that replaces the state
+    changed = state.copy()
+    changed.revision += 1
+    assert ranked_recommendations([changed], query, USER_COORDS, cache) is not first
+    assert ranked_recommendations([state], query, USER_COORDS, cache) is first
+    # A reload is a new state at revision 0 again
+    reloaded = state.copy()
+    assert ranked_recommendations([reloaded], query, USER_COORDS, cache) is not first
+    assert cache.stats()['misses'] == 3 and cache.stats()['hits'] == 1
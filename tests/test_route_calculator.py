@@ -0,0 +1,98 @@
+import threading
+import time
+import numpy as np
+import route_calculator
+from benchmarks.stub_maps import StubMapsClient
+from route_calculator import (
+    DEFAULT_COORDS, MATRIX_MAX_DESTINATIONS, NO_ROUTE, RouteCache, get_driving_routes_for, get_travel_times
+)
+
+USER_COORDS = (6.55, 3.36)
+
+def destinations(count):
+    rng = np.random.default_rng(4)
+    return [(float(lat), float(lon)) for lat, lon in zip(rng.uniform(6.42, 6.70, count), rng.uniform(3.20, 3.60, count))]
+
+def expected_times(client, targets):
+    elements = client.distance_matrix([USER_COORDS], targets)['rows'][0]['elements']
+    return [(element['duration']['value'], element['distance']['value']) for element in elements]
+
+def test_batches_destinations_per_matrix_request():
+    client = StubMapsClient()
+    targets = destinations(2 * MATRIX_MAX_DESTINATIONS + 10)
+    times = get_travel_times(USER_COORDS, targets, client=client, cache=RouteCache())
+    assert client.calls['distance_matrix'] == 3
+    assert client.calls['directions'] == 0
+    assert times == expected_times(StubMapsClient(), targets)
+
+def test_reuses_cached_pairs():
+    client = StubMapsClient()
+    cache = RouteCache()
+    targets = destinations(30)
+    first = get_travel_times(USER_COORDS, targets[:20], client=client, cache=cache)
+    both = get_travel_times(USER_COORDS, targets, client=client, cache=cache)
+    assert client.calls['distance_matrix'] == 2
+    assert both[:20] == first
+    assert get_travel_times(USER_COORDS, targets, client=client, cache=cache) == both
+    assert client.calls['distance_matrix'] == 2
+
+def test_skips_unknown_locations():
+    client = StubMapsClient()
+    targets = [DEFAULT_COORDS, None, destinations(1)[0]]
+    times = get_travel_times(USER_COORDS, targets, client=client, cache=None)
+    assert times[:2] == [None, None] and times[2] is not None
+    assert get_travel_times(DEFAULT_COORDS, targets, client=client, cache=None) == [None] * 3
+    assert client.calls['distance_matrix'] == 1
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+def test_route_cache_expires_and_evicts_least_recently_used(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(route_calculator, 'time', clock)
+    cache = RouteCache(max_size=2, ttl=60.0)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert cache.get('b') is None and cache.get('a') == 1 and cache.get('c') == 3
+    clock.now += 59.0
+    cache.put('c', 4)
+    clock.now += 2.0
+    assert cache.get('a') is None and cache.get('c') == 4
+    assert cache.stats() == {'size': 1, 'hits': 4, 'misses': 2}
+
+class SlowBackend:
+    # Routes instantly except to the hospitals named slow, which wait until released
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = 0
+
+    def route(self, user_coords, hospital_coords, hospital_name, departure_time):
+        self.calls += 1
+        if hospital_name.startswith('slow'):
+            self.release.wait(10.0)
+        return '1.0 km', '2 mins', 'points', [hospital_name]
+
+def test_batch_gives_up_at_the_deadline():
+    backend = SlowBackend()
+    cache = RouteCache()
+    names = ['fast 0', 'slow 1', 'fast 2', 'slow 3']
+    requests = [(USER_COORDS, coords, name) for coords, name in zip(destinations(len(names)), names)]
+    start = time.monotonic()
+    try:
+        routes = get_driving_routes_for(requests, timeout=0.3, cache=cache, backend=backend)
+    finally:
+        backend.release.set()
+    assert time.monotonic() - start < 2.0
+    assert [route[3] for route in routes] == [['fast 0'], None, ['fast 2'], None]
+    assert routes[1] == NO_ROUTE
+    # Fetched routes are cached; the next request asks the backend only for the missing ones
+    calls = backend.calls
+    routes = get_driving_routes_for(requests, timeout=5.0, cache=cache, backend=backend)
+    assert [route[3] for route in routes] == [[name] for name in names]
+    assert backend.calls - calls <= 2
@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+from benchmarks.synthetic_data import generate_hospitals
+from fuzzy_system import compute_service_match
+from service_index import ServiceIndex
+
+QUERIES = [
+    'Surgery', 'surgery', '  SURGERY  ', 'surg', 'general medicine', 'Medicine General', 'care', 'emergency care',
+    'dental surgery', 'ent', 'e', 'laboratory services', 'services', 'x-ray', 'Oncology Neurology', '',
+]
+
+def test_service_match_matches_substring_matching():
+    services = list(generate_hospitals(500, seed=3)['Services'])
+    services[:4] = [None, np.nan, 'ENT,Surgery', 'Emergency  Care']
+    index = ServiceIndex(services)
+    for query in QUERIES:
+        expected = [compute_service_match(query, text) for text in services]
+        np.testing.assert_array_equal(index.service_match(query), expected, err_msg=query)
+        idx = np.array([5, 2, 400])
+        np.testing.assert_array_equal(index.service_match(query, idx=idx), np.array(expected)[idx], err_msg=query)
+
+def test_missing_query_matches_nothing():
+    index = ServiceIndex(['Surgery', 'Dental'])
+    np.testing.assert_array_equal(index.service_match(pd.NA), [0.0, 0.0])
+
+def test_updates_keep_matching_the_new_text():
+    services = ['Surgery, Dental', 'General Medicine', 'Pediatrics']
+    index = ServiceIndex(services)
+    index.set_services(0, 'Dental')
+    index.set_services(2, None)
+    services[0], services[2] = 'Dental', None
+    index.append('Cardiology, Surgery')
+    services.append('Cardiology, Surgery')
+    for query in ('surgery', 'dental', 'pediatrics', 'cardiology surgery', 'medicine'):
+        np.testing.assert_array_equal(index.service_match(query), [compute_service_match(query, s) for s in services])
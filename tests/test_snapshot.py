@@ -0,0 +1,72 @@
+import os
+import struct
+import numpy as np
+import pandas as pd
+import pytest
+from app_state import build_app_state
+from recommender import parse_query, rank
+from snapshot import SNAPSHOT_VERSION, HospitalSnapshot, build_snapshot, open_snapshot
+
+@pytest.fixture
+def states(dataset, stub_client, tmp_path):
+    # (CSV state, snapshot state) of the same dataset, which has a row the loader skips
+    dataset_file, cache_file = dataset
+    raw = pd.read_csv(dataset_file, dtype=str, keep_default_na=False)
+    raw.loc[len(raw)] = {**dict.fromkeys(raw.columns, ''), 'Name': 'No Cost Clinic', 'Services': 'Dental'}
+    raw.to_csv(dataset_file, index=False)
+    csv_state = build_app_state(dataset_file, cache_file, client=stub_client)
+    snapshot_file = str(tmp_path / 'hospitals.snap')
+    build_snapshot(csv_state.data, csv_state.coordinates, csv_state.service_index, csv_state.spatial_index,
+                   csv_state.store, snapshot_file, source_file=dataset_file)
+    return csv_state, build_app_state(snapshot_file, cache_file, client=stub_client)
+
+def queries():
+    rng = np.random.default_rng(14)
+    for service in ('Surgery', 'dental', 'General Medicine', 'Pediatrics surgery', 'Astrology'):
+        for cost_pref, quality_pref in (('Low', 'High'), ('High', 'Low'), ('Medium', 'Medium')):
+            params = {'service': service, 'cost_pref': cost_pref, 'quality_pref': quality_pref, 'rerank': '0',
+                      'k': str(rng.integers(1, 20))}
+            params.update(rng.choice([{'radius_km': '4'}, {'radius_km': '25'}, {'nearest': '30'}]))
+            user_coords = (float(rng.uniform(6.45, 6.65)), float(rng.uniform(3.25, 3.55)))
+            yield parse_query(params), user_coords
+
+def test_snapshot_ranks_like_the_csv(states):
+    csv_state, snapshot_state = states
+    assert snapshot_state.snapshot is not None and snapshot_state._data is None
+    assert len(snapshot_state.store) == len(csv_state.store)
+    pairs = list(queries())
+    expected = rank(csv_state, [query for query, _ in pairs], [coords for _, coords in pairs], with_routes=False)
+    ranked = rank(snapshot_state, [query for query, _ in pairs], [coords for _, coords in pairs], with_routes=False)
+    assert any(not hasattr(result, 'message') for result in expected)
+    assert any(hasattr(result, 'message') for result in expected)
+    for result, want in zip(ranked, expected):
+        if hasattr(want, 'message'):
+            assert (result.message, result.status) == (want.message, want.status)
+        else:
+            pd.testing.assert_frame_equal(result, want, check_exact=True)
+
+def test_snapshot_holds_the_loaded_frame(states):
+    csv_state, snapshot_state = states
+    frame = snapshot_state.snapshot.to_frame()
+    columns = ['Name', 'Full Address', 'Services', 'Cost Level', 'Quality Score', 'User Rating', 'Coordinates']
+    assert frame[columns].reset_index(drop=True).equals(csv_state.data[columns].reset_index(drop=True))
+    assert 'No Cost Clinic' not in set(frame['Name'])
+
+def test_snapshot_notices_changes_and_other_formats(states, dataset, tmp_path, capsys):
+    _, snapshot_state = states
+    snapshot = snapshot_state.snapshot
+    assert not snapshot.is_stale()
+    with open(dataset[0], 'a') as f:
+        f.write('Late Clinic,1 Road,Dental,Low,4.0,4.0\n')
+    assert snapshot.is_stale()
+
+    old = str(tmp_path / 'old.snap')
+    with open(snapshot.path, 'rb') as f:
+        data = bytearray(f.read())
+    struct.pack_into('<I', data, 8, SNAPSHOT_VERSION - 1)
+    with open(old, 'wb') as f:
+        f.write(data)
+    with pytest.raises(ValueError, match=f'format {SNAPSHOT_VERSION - 1}; expected {SNAPSHOT_VERSION}'):
+        HospitalSnapshot(old)
+    assert open_snapshot(old) is None and 'Unable to read snapshot' in capsys.readouterr().out
+    assert open_snapshot(os.path.join(tmp_path, 'missing.snap')) is None
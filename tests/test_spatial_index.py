@@ -0,0 +1,65 @@
+import numpy as np
+from geopy.distance import geodesic
+from distance_calculator import haversine_km
+from spatial_index import SpatialIndex
+
+def random_points(rng, size):
+    lat, lon = rng.uniform(6.3, 6.8, size), rng.uniform(3.0, 3.7, size)
+    lat[rng.choice(size, 10, replace=False)] = np.nan
+    return lat, lon
+
+def brute_radius(lat, lon, coords, radius_km):
+    return {i for i in range(lat.size) if np.isfinite(lat[i]) and geodesic(coords, (lat[i], lon[i])).km <= radius_km}
+
+def brute_nearest(lat, lon, coords, k):
+    distances = haversine_km(coords[0], coords[1], lat, lon)
+    return np.sort(distances[np.isfinite(distances)])[:k]
+
+def test_radius_matches_a_geodesic_scan():
+    rng = np.random.default_rng(8)
+    lat, lon = random_points(rng, 1000)
+    index = SpatialIndex(lat, lon)
+    for _ in range(12):
+        coords = (float(rng.uniform(6.3, 6.8)), float(rng.uniform(3.0, 3.7)))
+        radius_km = float(rng.choice([0.5, 3.0, 10.0, 25.0]))
+        ids, distances = index.query_radius(coords, radius_km)
+        assert set(ids.tolist()) == brute_radius(lat, lon, coords, radius_km)
+        assert np.all(np.diff(distances) >= 0)
+
+def test_radius_decides_the_boundary_by_geodesic():
+    # Points straddling the radius by less than the haversine error
+    coords, radius_km = (6.5, 3.4), 10.0
+    bearings = np.linspace(0, 2 * np.pi, 40, endpoint=False)
+    points = [geodesic(kilometers=radius_km + offset).destination(coords, np.degrees(bearing))
+              for bearing in bearings for offset in (-0.01, 0.01)]
+    lat, lon = np.array([p.latitude for p in points]), np.array([p.longitude for p in points])
+    ids, _ = SpatialIndex(lat, lon).query_radius(coords, radius_km)
+    assert set(ids.tolist()) == set(range(0, lat.size, 2))
+
+def test_nearest_matches_a_full_sort():
+    rng = np.random.default_rng(9)
+    lat, lon = random_points(rng, 2000)
+    index = SpatialIndex(lat, lon, cell_degrees=0.02)
+    for k in (1, 5, 50, 3000):
+        # Including users outside the indexed area
+        for coords in [(6.5, 3.3), (6.31, 3.69), (7.5, 2.5)]:
+            ids, distances = index.query_nearest(coords, k)
+            np.testing.assert_allclose(distances, brute_nearest(lat, lon, coords, k))
+            np.testing.assert_allclose(haversine_km(coords[0], coords[1], lat[ids], lon[ids]), distances)
+
+def test_updates_match_a_rebuilt_index():
+    rng = np.random.default_rng(10)
+    lat, lon = random_points(rng, 500)
+    index = SpatialIndex(lat, lon).copy()
+    index.move(3, 6.55, 3.36)
+    index.move(4, np.nan, np.nan)
+    index.remove(5)
+    index.append(6.56, 3.37)
+    lat, lon = np.append(lat, 6.56), np.append(lon, 3.37)
+    lat[3], lon[3], lat[4], lat[5] = 6.55, 3.36, np.nan, np.nan
+    rebuilt = SpatialIndex(lat, lon)
+    for radius_km in (1.0, 20.0):
+        assert np.array_equal(np.sort(index.query_radius((6.55, 3.36), radius_km)[0]),
+                              np.sort(rebuilt.query_radius((6.55, 3.36), radius_km)[0]))
+    assert np.array_equal(np.sort(index.query_nearest((6.55, 3.36), 20)[0]),
+                          np.sort(rebuilt.query_nearest((6.55, 3.36), 20)[0]))
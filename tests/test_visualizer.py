@@ -0,0 +1,61 @@
+import math
+import numpy as np
+import pandas as pd
+from artifact_cache import artifact_key
+from visualizer import CHART_COLUMNS, render_inputs, simplify_polyline, zoom_tolerance
+
+def projected(points, lat):
+    return np.column_stack([points[:, 1] * math.cos(math.radians(lat)), points[:, 0]])
+
+def distance_to_polyline(points, line):
+    # Distance of each point to the nearest segment of line, both projected
+    a, b = line[:-1], line[1:]
+    ab = b - a
+    lengths = np.maximum((ab ** 2).sum(axis=1), 1e-30)
+    t = np.clip(((points[:, None, :] - a) * ab).sum(axis=2) / lengths, 0.0, 1.0)
+    nearest = a + t[..., None] * ab
+    return np.sqrt(((points[:, None, :] - nearest) ** 2).sum(axis=2)).min(axis=1)
+
+def random_route(rng, size):
+    steps = rng.normal(0, 0.0005, (size, 2)) + [0.0002, 0.0001]
+    return np.cumsum(steps, axis=0) + [6.5, 3.35]
+
+def test_simplified_route_stays_within_tolerance():
+    rng = np.random.default_rng(15)
+    points = random_route(rng, 2000)
+    lat = points[:, 0].mean()
+    for zoom in (8, 11.5, 15):
+        tolerance = zoom_tolerance(zoom, lat)
+        simplified = simplify_polyline(points, tolerance)
+        # Both ends, in order, a subset of the original vertices
+        assert np.array_equal(simplified[0], points[0]) and np.array_equal(simplified[-1], points[-1])
+        kept = [i for i, point in enumerate(points) if (simplified == point).all(axis=1).any()]
+        assert len(kept) == len(simplified) and points[kept].tolist() == simplified.tolist()
+        assert distance_to_polyline(projected(points, lat), projected(simplified, lat)).max() <= tolerance * (1 + 1e-9)
+        assert len(simplified) < len(points)
+    assert len(simplify_polyline(points, zoom_tolerance(8, lat))) < len(simplify_polyline(points, zoom_tolerance(15, lat)))
+
+def test_simplify_edge_cases():
+    line = np.column_stack([np.linspace(6.5, 6.6, 50), np.linspace(3.3, 3.5, 50)])
+    assert simplify_polyline(line, 1e-6).tolist() == [line[0].tolist(), line[-1].tolist()]
+    assert len(simplify_polyline(line, 0)) == 50
+    assert simplify_polyline([(6.5, 3.3), (6.6, 3.4)], 1.0).tolist() == [[6.5, 3.3], [6.6, 3.4]]
+    # A route that returns to its start keeps the vertex furthest out
+    loop = np.array([(6.5, 3.3), (6.51, 3.3), (6.52, 3.31), (6.51, 3.31), (6.5, 3.3)])
+    assert [6.52, 3.31] in simplify_polyline(loop, 0.001).tolist()
+    assert zoom_tolerance(12, 6.5) == zoom_tolerance(11, 6.5) / 2
+
+def test_render_inputs_address_what_is_drawn():
+    recommendations = pd.DataFrame({'Name': ['A', 'B'], 'Recommendation_Score': [0.8, 0.6], 'Services': ['x', None],
+                                    'Distance_km': [1.0, 2.0]})
+    key = artifact_key('chart', render_inputs(recommendations, CHART_COLUMNS))
+    # Columns the chart does not draw leave its address alone
+    other = recommendations.assign(Services='y', Distance_km=[5.0, 6.0])
+    assert artifact_key('chart', render_inputs(other, CHART_COLUMNS)) == key
+    assert artifact_key('map', render_inputs(recommendations, CHART_COLUMNS)) != key
+    assert artifact_key('chart', render_inputs(recommendations.assign(Recommendation_Score=[0.8, 0.61]),
+                                               CHART_COLUMNS)) != key
+    assert artifact_key('chart', render_inputs(recommendations.iloc[::-1], CHART_COLUMNS)) != key
+    assert artifact_key('chart', render_inputs(recommendations, CHART_COLUMNS, zoom=11)) != key
+    inputs = render_inputs(recommendations, ['Name', 'Services', 'Polyline_Points'])
+    assert inputs['rows'] == [['A', 'x', None], ['B', None, None]]
@@ -1,28 +1,99 @@
-import matplotlib.pyplot as plt
-import folium
+import io
+import math
+import numpy as np
 import polyline
 
-def plot_recommendations(recommendations):
+# matplotlib and folium are imported on first use; they dominate start-up time otherwise.
+# Charts and maps are built as standalone objects (no pyplot state), so API workers can
+# render them concurrently into memory as well as to the files the CLI writes.
+
+DEFAULT_CENTER = (6.5244, 3.3792)
+DEFAULT_MAP_ZOOM = 11.5
+# Web Mercator metres per pixel at zoom 0 on the equator; halves with every zoom level
+METRES_PER_PIXEL_AT_ZOOM_0 = 156543.03
+METRES_PER_DEGREE = 111320.0
+# Route vertices within this many screen pixels of the simplified line are dropped
+SIMPLIFY_PIXELS = 1.0
+# The columns each rendering reads; see render_inputs
+CHART_COLUMNS = ['Name', 'Recommendation_Score']
+MAP_COLUMNS = ['Name', 'Services', 'Recommendation_Score', 'Route_Distance', 'Route_Duration', 'Coordinates',
+               'Polyline_Points']
+
+def render_inputs(recommendations, columns, **extra):
+    # Everything a rendering depends on, as plain values: the same inputs render the same bytes,
+    # so a hash of these addresses the artifact (see artifact_cache)
+    frame = recommendations.reindex(columns=columns)
+    return {'index': frame.index.tolist(), 'rows': frame.astype(object).where(frame.notna(), None).values.tolist(),
+            **extra}
+
+def zoom_tolerance(zoom, lat, pixels=SIMPLIFY_PIXELS):
+    # Degrees spanned by `pixels` screen pixels at this zoom and latitude
+    return METRES_PER_PIXEL_AT_ZOOM_0 * math.cos(math.radians(lat)) / 2 ** zoom * pixels / METRES_PER_DEGREE
+
+def simplify_polyline(points, tolerance):
+    # Douglas-Peucker on an equirectangular projection around the route, keeping both ends:
+    # a vertex survives when it lies more than tolerance (degrees of latitude) off the line
+    # between the vertices kept around it
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(points) < 3 or tolerance <= 0:
+        return points
+    xy = np.column_stack([points[:, 1] * math.cos(math.radians(points[:, 0].mean())), points[:, 0]])
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        (ax, ay), (bx, by) = xy[start], xy[end]
+        inner = xy[start + 1:end]
+        length = math.hypot(bx - ax, by - ay)
+        if length == 0:
+            distances = np.hypot(inner[:, 0] - ax, inner[:, 1] - ay)
+        else:
+            distances = np.abs((bx - ax) * (inner[:, 1] - ay) - (by - ay) * (inner[:, 0] - ax)) / length
+        i = int(np.argmax(distances))
+        if distances[i] > tolerance:
+            split = start + 1 + i
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return points[keep]
+
+def draw_recommendations(recommendations, output):
+    # output: a path or a binary file object
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    ax.bar(recommendations['Name'], recommendations['Recommendation_Score'], color='skyblue')
+    ax.set_xlabel('Hospital Name')
+    ax.set_ylabel('Recommendation Score')
+    ax.set_title(f'Top {len(recommendations)} Recommended Hospitals')
+    for label in ax.get_xticklabels():
+        label.set_rotation(45)
+        label.set_horizontalalignment('right')
+    fig.tight_layout()
+    fig.savefig(output, format='png')
+
+def plot_recommendations(recommendations, output='hospital_recommendations.png'):
     if recommendations.empty:
         print("No recommendations to plot.")
         return
-    plt.figure(figsize=(10, 6))
-    plt.bar(recommendations['Name'], recommendations['Recommendation_Score'], color='skyblue')
-    plt.xlabel('Hospital Name')
-    plt.ylabel('Recommendation Score')
-    plt.title('Top 3 Recommended Hospitals')
-    plt.xticks(rotation=45, ha='right')
-    plt.tight_layout()
-    plt.savefig('hospital_recommendations.png')
-    plt.close()
-
-def plot_map(user_coords, recommendations):
-    if recommendations.empty:
-        print("No hospitals to display on the map.")
-        return
-    
-    map_center = user_coords if user_coords else (6.5244, 3.3792)
-    m = folium.Map(location=map_center, zoom_start=11.5)
+    draw_recommendations(recommendations, output)
+
+def render_chart(recommendations):
+    # PNG bytes
+    buffer = io.BytesIO()
+    draw_recommendations(recommendations, buffer)
+    return buffer.getvalue()
+
+def build_map(user_coords, recommendations, default_center=DEFAULT_CENTER, zoom=DEFAULT_MAP_ZOOM):
+    # Routes are simplified to what is visible at the map's zoom before they are embedded
+    import folium
+
+    map_center = user_coords if user_coords else default_center
+    m = folium.Map(location=map_center, zoom_start=zoom)
+    tolerance = zoom_tolerance(zoom, map_center[0])
 
     if user_coords:
         folium.Marker(
@@ -49,9 +120,9 @@ def plot_map(user_coords, recommendations):
             
             if user_coords and row.get('Polyline_Points'):
                 try:
-                    decoded_points = polyline.decode(row['Polyline_Points'])
+                    decoded_points = simplify_polyline(polyline.decode(row['Polyline_Points']), tolerance)
                     folium.PolyLine(
-                        locations=decoded_points,
+                        locations=decoded_points.tolist(),
                         color=colors[idx % len(colors)],
                         weight=5,
                         opacity=0.7,
@@ -63,5 +134,45 @@ def plot_map(user_coords, recommendations):
                     ).add_to(m)
                 except Exception as e:
                     print(f"Error plotting route to {row['Name']}: {e}")
+    return m
+
+def plot_map(user_coords, recommendations, default_center=DEFAULT_CENTER, output='hospital_map.html',
+             zoom=DEFAULT_MAP_ZOOM):
+    if recommendations.empty:
+        print("No hospitals to display on the map.")
+        return
+    build_map(user_coords, recommendations, default_center, zoom).save(output)
+
+def render_map(user_coords, recommendations, default_center=DEFAULT_CENTER, zoom=DEFAULT_MAP_ZOOM):
+    # Standalone HTML page
+    return build_map(user_coords, recommendations, default_center, zoom).get_root().render()
+
+def plot_coverage(grid, service=None, output='coverage_map.html'):
+    # Heatmap of a coverage grid: how many hospitals offering the service lie within the grid's
+    # radius of each cell, or with no service the fewest over all the grid's services. Red
+    # cells are underserved.
+    import folium
+    from matplotlib import colormaps
+
+    if service:
+        s = grid.services.get(service.lower().strip())
+        if s is None:
+            print(f"The coverage grid has no service '{service}'. Use one of: {', '.join(grid.services)}.")
+            return
+        counts = grid.counts[s]
+    else:
+        counts = grid.counts.min(axis=0)
+    (south, west), (north, east) = grid.bounds()
+    image = colormaps['RdYlGn'](counts / max(int(counts.max()), 1))
+    image[..., 3] = 0.5
 
-    m.save('hospital_map.html')
\ No newline at end of file
+    m = folium.Map(location=((south + north) / 2, (west + east) / 2), zoom_start=11)
+    # Row 0 of the grid is its southern edge; images are drawn from the top
+    folium.raster_layers.ImageOverlay(
+        image=image[::-1], bounds=[[south, west], [north, east]], mercator_project=True,
+        name=f"Hospitals offering {service or 'every service'} within {grid.header['radius_km']:g} km"
+    ).add_to(m)
+    folium.LayerControl().add_to(m)
+    m.save(output)
+    print(f"{int((counts == 0).sum())} of {counts.size} cells have no such hospital within "
+          f"{grid.header['radius_km']:g} km. Coverage map saved to {output}")